@@ -0,0 +1,42 @@
+import java.io.File;
+import java.lang.reflect.Method;
+import java.net.URL;
+import java.net.URLClassLoader;
+import java.util.ArrayList;
+import java.util.List;
+
+// Reference vm for the benchmarks (see make_core.py). Loads the generated
+// classes Gen0 ... Gen<classes-1> with the given number of class loaders,
+// calls run() of the first <hot> classes often enough to get it compiled,
+// prints READY and waits to be dumped with gcore. make_core.py runs it
+// with -Xbatch, so the compilations are finished when READY is printed.
+//
+// Usage: java BenchApp <dir of generated classes> <classes> <loaders> <hot>
+public class BenchApp {
+    static final List<Class<?>> loaded = new ArrayList<>();
+    static int sink;
+
+    public static void main(String[] args) throws Exception {
+        URL[] path = { new File(args[0]).toURI().toURL() };
+        int classes = Integer.parseInt(args[1]);
+        int loaders = Integer.parseInt(args[2]);
+        int hot = Integer.parseInt(args[3]);
+
+        URLClassLoader[] cls = new URLClassLoader[loaders];
+        for (int i = 0; i < loaders; i++) {
+            cls[i] = new URLClassLoader(path, BenchApp.class.getClassLoader());
+        }
+        for (int i = 0; i < classes; i++) {
+            loaded.add(Class.forName("Gen" + i, true, cls[i % loaders]));
+        }
+        for (int i = 0; i < hot && i < classes; i++) {
+            Method run = loaded.get(i).getMethod("run", int.class);
+            for (int j = 0; j < 20_000; j++) {
+                sink += (Integer) run.invoke(null, j);
+            }
+        }
+        System.out.println("READY");
+        System.out.flush();
+        Thread.sleep(Long.MAX_VALUE);
+    }
+}
@@ -0,0 +1,257 @@
+#############################################################################
+#
+# Benchmarks of gdb_utilities_python3.py on reference core files
+#
+#############################################################################
+#
+# Times the core operations of the utilities on cores created with
+# make_core.py and records the results as JSON, so that speedups and
+# regressions can be tracked over releases. Every benchmark is run
+# --repeat times in one batch gdb per core. The caches are cleared before
+# each run, i.e. the times include building the indexes.
+#
+# Example:
+#
+#    $ python3 bench_gdb.py run -o results/$(git rev-parse --short HEAD).json cores/20k/core.json
+#    $ python3 bench_gdb.py compare results/3c6c2a4.json results/e0dbea6.json
+#
+# Benchmarks: see BENCHMARKS below.
+#
+# This file has two roles like hs_triage_cores.py. Run with python3 it is
+# the driver. Sourced in gdb (done by the driver) it runs the benchmarks
+# and writes the results of the core as JSON.
+#
+#############################################################################
+
+import io
+import json
+import os
+import random
+import sys
+import time
+
+# environment variables to pass the job from the driver to gdb
+ENV_PARAMS = 'HS_BENCH_PARAMS'
+ENV_RESULT = 'HS_BENCH_RESULT'
+
+#############################################################################
+# Running in gdb
+#############################################################################
+
+# The benchmarks get the globals of the utilities (u) and the parameters.
+# setup returns the input of the timed function, which returns the number
+# of items processed.
+
+def setup_none(u, params):
+    return None
+
+def class_walk(u, params, _):
+    names = []
+    u['ClassLoaderDataGraph'].classes_do(lambda k: names.append(k.extended_str()))
+    return len(names)
+
+def iter_klasses(u, params, _):
+    return sum(1 for rec in u['ClassLoaderDataGraph'].iter_klasses())
+
+def cld_listing(u, params, _):
+    return len(u['gdb'].execute('hs-print-all-class-loader-data', to_string = True).splitlines())
+
+# K random pcs in the nmethods of the code cache
+def setup_pcs(u, params):
+    rnd = random.Random(params['seed'])
+    blobs = [(start, end) for heap in u['CodeCache'].heaps()
+             for start, end, kind in heap.index().entries() if kind == 'nmethod']
+    if not blobs: return []
+    return [rnd.randrange(start, end) for start, end in (rnd.choice(blobs) for i in range(params['k']))]
+
+def find_blob_unsafe(u, params, pcs):
+    NULL = u['NULL']
+    return sum(1 for pc in pcs if u['CodeCache'].find_blob_unsafe(pc) != NULL)
+
+# (Method*, bci) of the scopes at K random pcs
+def setup_bcis(u, params):
+    res = []
+    for pc in setup_pcs(u, params):
+        nm = u['CodeCache'].find_blob_unsafe(pc).as_nmethod()
+        desc = nm.pc_desc_at(u['gdb'].Value(pc))
+        if desc == u['NULL']: continue
+        for method, bci in nm.inlining_at(desc):
+            if int(bci) >= 0:
+                res.append((method.obj_address(), int(bci)))
+    return res
+
+def line_number_from_bci(u, params, bcis):
+    Method = u['Method']
+    gdb = u['gdb']
+    for method, bci in bcis:
+        Method(gdb.Value(method)).line_number_from_bci(bci)
+    return len(bcis)
+
+# K object starts in the java heap: the class loader oops and the mirrors
+# of random classes
+def setup_addresses(u, params):
+    rnd = random.Random(params['seed'])
+    res = [cld.loader for cld in u['ClassLoaderDataGraph'].iter_clds() if cld.loader != 0][:params['k'] // 2]
+    klasses = [rec.klass for rec in u['ClassLoaderDataGraph'].iter_klasses()]
+    if not klasses: return res
+    for i in range(params['k'] - len(res)):
+        mirror = u['RawStruct'].read(rnd.choice(klasses), u['T'].Klass_t).get_oop('_java_mirror')
+        if mirror != 0: res.append(mirror)
+    return res
+
+def universe_find(u, params, addrs):
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    try:
+        for addr in addrs:
+            u['Universe'].find(addr)
+    finally:
+        sys.stdout = stdout
+    return len(addrs)
+
+# name -> (setup, timed function)
+BENCHMARKS = {
+    'class_walk':           (setup_none, class_walk),
+    'iter_klasses':         (setup_none, iter_klasses),
+    'cld_listing':          (setup_none, cld_listing),
+    'find_blob_unsafe':     (setup_pcs, find_blob_unsafe),
+    'line_number_from_bci': (setup_bcis, line_number_from_bci),
+    'universe_find':        (setup_addresses, universe_find),
+}
+
+def run_benchmarks_in_gdb(u, params, result_file):
+    results = {}
+    for name in params['benchmarks']:
+        setup, timed = BENCHMARKS[name]
+        res = {'seconds': []}
+        try:
+            data = setup(u, params)
+            for i in range(params['repeat']):
+                u['clear_caches']()
+                start = time.perf_counter()
+                res['items'] = timed(u, params, data)
+                res['seconds'].append(round(time.perf_counter() - start, 4))
+        except Exception as e:
+            res['error'] = "%s: %s" % (type(e).__name__, e)
+        if res['seconds']:
+            res['min'] = min(res['seconds'])
+            res['median'] = sorted(res['seconds'])[len(res['seconds']) // 2]
+        results[name] = res
+    with open(result_file, 'w') as f:
+        json.dump(results, f)
+
+#############################################################################
+# Driver
+#############################################################################
+
+def git_revision(path):
+    import subprocess
+    try:
+        return subprocess.check_output(['git', '-C', path, 'rev-parse', 'HEAD'], universal_newlines = True,
+                                       stderr = subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def bench_core(core_json, args, params, result_file):
+    import subprocess
+    with open(core_json) as f:
+        core = json.load(f)
+    env = dict(os.environ)
+    env[ENV_PARAMS] = json.dumps(params)
+    env[ENV_RESULT] = result_file
+    cmd = [args.gdb, '-batch', '-nx', '-q', core['executable'], '-c', core['core'],
+           '-ex', 'source ' + args.utilities, '-ex', 'source ' + os.path.abspath(__file__)]
+    res = {'core': core}
+    start = time.time()
+    proc = subprocess.run(cmd, env = env, stdout = subprocess.PIPE, stderr = subprocess.PIPE, universal_newlines = True)
+    res['seconds'] = round(time.time() - start, 3)
+    if os.path.exists(result_file):
+        with open(result_file) as f:
+            res['benchmarks'] = json.load(f)
+        os.remove(result_file)
+    else:
+        res['error'] = 'gdb exited with %d: %s' % (proc.returncode, proc.stderr[-4096:])
+    return res
+
+def run(args):
+    import subprocess
+    import tempfile
+
+    params = {'benchmarks': args.benchmarks or sorted(BENCHMARKS), 'repeat': args.repeat, 'k': args.k, 'seed': args.seed}
+    gdb_version = subprocess.check_output([args.gdb, '--version'], universal_newlines = True).splitlines()[0]
+    cores = []
+    with tempfile.TemporaryDirectory(prefix = 'hs_bench_') as result_dir:
+        for i, core_json in enumerate(args.cores):
+            cores.append(bench_core(core_json, args, params, os.path.join(result_dir, str(i) + '.json')))
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'revision': git_revision(os.path.dirname(os.path.abspath(args.utilities))),
+        'gdb': gdb_version,
+        'python': sys.version.split()[0],
+        'params': params,
+        'cores': cores,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent = 1)
+    else:
+        json.dump(report, sys.stdout, indent = 1)
+    return 0 if all('benchmarks' in c and not any('error' in b for b in c['benchmarks'].values()) for c in cores) else 1
+
+# print the minimum times of two reports side by side
+def compare(args):
+    reports = []
+    for name in (args.base, args.new):
+        with open(name) as f:
+            reports.append(json.load(f))
+    print("%-24s %-40s %10s %10s %8s" % ("benchmark", "core", "base s", "new s", "speedup"))
+    for base_core, new_core in zip(reports[0]['cores'], reports[1]['cores']):
+        core_name = os.path.basename(new_core['core']['core'])
+        base_benchmarks = base_core.get('benchmarks', {})
+        for name, new in sorted(new_core.get('benchmarks', {}).items()):
+            base = base_benchmarks.get(name, {})
+            if 'min' not in base or 'min' not in new:
+                print("%-24s %-40s %10s %10s %8s" % (name, core_name, base.get('min', '-'), new.get('min', '-'), '-'))
+                continue
+            speedup = base['min'] / new['min'] if new['min'] > 0 else float('inf')
+            print("%-24s %-40s %10.3f %10.3f %7.2fx" % (name, core_name, base['min'], new['min'], speedup))
+    return 0
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(description = 'Benchmark gdb_utilities_python3.py on reference cores.')
+    sub = parser.add_subparsers(dest = 'action')
+    run_parser = sub.add_parser('run', help = 'run the benchmarks')
+    run_parser.add_argument('cores', nargs = '+', help = 'core.json files written by make_core.py')
+    run_parser.add_argument('-o', '--output', help = 'JSON report (default: stdout)')
+    run_parser.add_argument('-b', '--benchmark', dest = 'benchmarks', action = 'append', choices = sorted(BENCHMARKS),
+                            help = 'benchmark to run (repeatable, default: all)')
+    run_parser.add_argument('-r', '--repeat', type = int, default = 3, help = 'runs of each benchmark')
+    run_parser.add_argument('-k', type = int, default = 1000, help = 'number of pcs and addresses to look up')
+    run_parser.add_argument('--seed', type = int, default = 4711, help = 'seed for choosing pcs and addresses')
+    run_parser.add_argument('--gdb', default = 'gdb', help = 'gdb executable')
+    run_parser.add_argument('--utilities', default = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                                  'gdb_utilities_python3.py'),
+                            help = 'path of gdb_utilities_python3.py')
+    compare_parser = sub.add_parser('compare', help = 'compare two reports')
+    compare_parser.add_argument('base', help = 'JSON report')
+    compare_parser.add_argument('new', help = 'JSON report')
+    args = parser.parse_args(argv)
+    if args.action == 'run':
+        return run(args)
+    if args.action == 'compare':
+        return compare(args)
+    parser.print_help()
+    return 2
+
+try:
+    import gdb
+except ImportError:
+    gdb = None
+
+if gdb is not None and ENV_RESULT in os.environ:
+    import __main__
+    run_benchmarks_in_gdb(vars(__main__), json.loads(os.environ[ENV_PARAMS]), os.environ[ENV_RESULT])
+elif __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,134 @@
+#############################################################################
+#
+# Create a reference core file for the benchmarks
+#
+#############################################################################
+#
+# Generates <classes> small classes, compiles them together with
+# BenchApp.java, runs BenchApp until it has loaded the classes with
+# <loaders> class loaders and compiled run() of <hot> of them, and dumps
+# the vm with gcore. The vm runs with -Xbatch, so the methods are compiled
+# when BenchApp prints READY. The core and a description core.json are
+# written to the output directory. core.json is the input of bench_gdb.py.
+#
+# Example:
+#
+#    $ python3 make_core.py -o cores/20k --java /opt/jdk/bin/java --classes 20000 --loaders 100 --hot 500
+#
+#############################################################################
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+GEN_TEMPLATE = """public class Gen%d {
+    static int field;
+    public static int run(int x) {
+        int s = x;
+        for (int i = 0; i < 100; i++) {
+            s = s * 31 + i;
+            if ((s & 7) == 0) {
+                field += i;
+            }
+        }
+        return s;
+    }
+}
+"""
+
+def generate_sources(src_dir, classes):
+    files = []
+    for i in range(classes):
+        name = os.path.join(src_dir, 'Gen%d.java' % i)
+        with open(name, 'w') as f:
+            f.write(GEN_TEMPLATE % i)
+        files.append(name)
+    return files
+
+def javac(java, sources, out_dir):
+    # javac is next to the java launcher; a list file avoids too long command lines
+    list_file = out_dir + '.sources'
+    with open(list_file, 'w') as f:
+        f.write('\n'.join(sources))
+    subprocess.check_call([os.path.join(os.path.dirname(java), 'javac'), '-d', out_dir, '@' + list_file])
+
+# the first line printed by the vm, or RuntimeError if there is none
+# after timeout seconds
+def first_line(vm, timeout):
+    import select
+    ready, _, _ = select.select([vm.stdout], [], [], timeout)
+    if not ready:
+        raise RuntimeError("BenchApp printed nothing within %ds" % timeout)
+    return vm.stdout.readline()
+
+def java_version(java):
+    proc = subprocess.run([java, '-version'], stdout = subprocess.PIPE, stderr = subprocess.STDOUT, universal_newlines = True)
+    return proc.stdout.strip()
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(description = 'Create a reference core of a hotspot vm with gcore.')
+    parser.add_argument('-o', '--output', required = True, help = 'output directory')
+    parser.add_argument('--java', default = shutil.which('java'), help = 'java launcher (default: java on PATH)')
+    parser.add_argument('--java-opt', dest = 'java_opts', action = 'append', default = [], help = 'vm option (repeatable)')
+    parser.add_argument('--classes', type = int, default = 10000, help = 'number of classes to load')
+    parser.add_argument('--loaders', type = int, default = 50, help = 'number of class loaders')
+    parser.add_argument('--hot', type = int, default = 200, help = 'number of classes with compiled methods')
+    parser.add_argument('--gcore', default = 'gcore', help = 'gcore executable')
+    parser.add_argument('--no-batch', action = 'store_true', help = 'compile in the background (no -Xbatch)')
+    parser.add_argument('--timeout', type = int, default = 600,
+                        help = 'seconds to wait for BenchApp to get ready and for gcore to finish')
+    args = parser.parse_args(argv)
+    if args.java is None:
+        parser.error('java not found, use --java')
+    java = os.path.realpath(args.java)
+    os.makedirs(args.output, exist_ok = True)
+
+    with tempfile.TemporaryDirectory(prefix = 'hs_bench_') as work:
+        gen_src = os.path.join(work, 'gen_src')
+        gen = os.path.join(work, 'gen')
+        app = os.path.join(work, 'app')
+        for d in (gen_src, gen, app):
+            os.makedirs(d)
+        print("generating and compiling %d classes" % args.classes)
+        javac(java, generate_sources(gen_src, args.classes), gen)
+        javac(java, [os.path.join(os.path.dirname(os.path.abspath(__file__)), 'BenchApp.java')], app)
+
+        # with -Xbatch the calls of run() wait for its compilation
+        java_opts = ([] if args.no_batch else ['-Xbatch']) + args.java_opts
+        cmd = [java] + java_opts + ['-cp', app, 'BenchApp', gen, str(args.classes), str(args.loaders), str(args.hot)]
+        start = time.time()
+        vm = subprocess.Popen(cmd, stdout = subprocess.PIPE, universal_newlines = True)
+        try:
+            line = first_line(vm, args.timeout)
+            if line.strip() != 'READY':
+                raise RuntimeError("BenchApp failed: " + line)
+            print("vm %d ready after %.1fs, dumping core" % (vm.pid, time.time() - start))
+            prefix = os.path.join(os.path.abspath(args.output), 'core')
+            subprocess.check_call([args.gcore, '-o', prefix, str(vm.pid)], stdout = subprocess.DEVNULL, timeout = args.timeout)
+        finally:
+            vm.kill()
+            vm.wait()
+
+    core = {
+        'core': prefix + '.' + str(vm.pid),
+        'executable': java,
+        'java_version': java_version(java),
+        'java_opts': java_opts,
+        'classes': args.classes,
+        'loaders': args.loaders,
+        'hot': args.hot,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    with open(os.path.join(args.output, 'core.json'), 'w') as f:
+        json.dump(core, f, indent = 1)
+    print("wrote " + core['core'])
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
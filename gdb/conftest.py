@@ -0,0 +1,168 @@
+#############################################################################
+#
+# Unit tests of the raw readers and decoders without gdb
+#
+#############################################################################
+#
+# gdb_utilities_python3.py can only be imported in gdb. The decoders and
+# indexes that work on bytes and ints are tested with the stub of the gdb
+# module below, which has just what the module needs to be sourced.
+# Types are looked up in gdb.types, tests add struct types made with
+# gdb.struct_type. Memory is read from gdb.inferior (see the inferior
+# fixture).
+#
+#    $ cd gdb && python3 -m pytest -q
+#
+#############################################################################
+
+import importlib.util
+import operator
+import os
+import sys
+import types
+
+import pytest
+
+gdb = types.ModuleType('gdb')
+
+class _error(RuntimeError):
+    pass
+class _MemoryError(_error):
+    pass
+class _GdbError(Exception):
+    pass
+gdb.error = _error
+gdb.MemoryError = _MemoryError
+gdb.GdbError = _GdbError
+
+gdb.COMMAND_USER = gdb.COMMAND_DATA = gdb.COMMAND_STATUS = 0
+for i, name in enumerate(('PTR', 'ARRAY', 'STRUCT', 'UNION', 'ENUM', 'FLAGS', 'FUNC', 'INT', 'FLT', 'VOID', 'CHAR',
+                          'BOOL', 'TYPEDEF')):
+    setattr(gdb, 'TYPE_CODE_' + name, i + 1)
+
+class _Type(object):
+    def __init__(self, name, code, sizeof, fields = (), target = None, is_signed = True):
+        self.name = name
+        self.code = code
+        self.sizeof = sizeof
+        self.is_signed = is_signed
+        self._fields = list(fields)
+        self._target = target
+    def __str__(self): return self.name
+    def strip_typedefs(self): return self
+    def pointer(self): return _Type(self.name + ' *', gdb.TYPE_CODE_PTR, 8, target = self, is_signed = False)
+    def target(self): return self._target
+    def fields(self): return self._fields
+
+class _Field(object):
+    def __init__(self, name, type, offset):
+        self.name = name
+        self.type = type
+        self.bitpos = offset * 8
+        self.bitsize = 0
+        self.is_base_class = False
+
+# a struct or union type with the given (name, type, offset) fields
+def struct_type(name, size, fields, code = gdb.TYPE_CODE_STRUCT):
+    return _Type(name, code, size, [_Field(*f) for f in fields])
+gdb.struct_type = struct_type
+
+# type name -> _Type
+gdb.types = {
+    'void': _Type('void', gdb.TYPE_CODE_VOID, 1),
+    'int': _Type('int', gdb.TYPE_CODE_INT, 4),
+    'uintptr_t': _Type('unsigned long', gdb.TYPE_CODE_INT, 8, is_signed = False),
+}
+
+def _lookup_type(name):
+    if name not in gdb.types:
+        raise gdb.error("No type named " + name + ".")
+    return gdb.types[name]
+gdb.lookup_type = _lookup_type
+
+def _parse_and_eval(expr):
+    raise gdb.error("No symbol \"" + expr + "\" in current context.")
+gdb.parse_and_eval = _parse_and_eval
+
+# Values are plain ints with a type
+class _Value(object):
+    def __init__(self, val):
+        self._val = int(val)
+        self.type = gdb.types['int']
+    def __int__(self): return self._val
+    __index__ = __int__
+    def cast(self, t):
+        res = _Value(self._val)
+        res.type = t
+        return res
+def _binary(op, reflected = False):
+    if reflected:
+        return lambda self, other: _Value(op(int(other), self._val))
+    return lambda self, other: _Value(op(self._val, int(other)))
+for name, op in (('add', operator.add), ('sub', operator.sub), ('lshift', operator.lshift), ('rshift', operator.rshift),
+                 ('and', operator.and_), ('or', operator.or_), ('xor', operator.xor)):
+    setattr(_Value, '__' + name + '__', _binary(op))
+    setattr(_Value, '__r' + name + '__', _binary(op, True))
+for name in ('eq', 'ne', 'lt', 'le', 'gt', 'ge'):
+    setattr(_Value, '__' + name + '__', (lambda op: lambda self, other: op(self._val, int(other)))(getattr(operator, name)))
+_Value.__hash__ = lambda self: hash(self._val)
+gdb.Value = _Value
+
+class _Command(object):
+    def __init__(self, *args): pass
+class _Function(object):
+    def __init__(self, *args): pass
+class _Parameter(object):
+    def __init__(self, *args): pass
+gdb.Command = _Command
+gdb.Function = _Function
+gdb.Parameter = _Parameter
+
+class _EventRegistry(object):
+    def connect(self, f): pass
+    def disconnect(self, f): pass
+class _Events(object):
+    def __getattr__(self, name): return _EventRegistry()
+gdb.events = _Events()
+
+def _execute(command, from_tty = False, to_string = False):
+    if command == 'show endian':
+        return "The target endianness is set automatically (currently little endian).\n"
+    raise gdb.error("Undefined command: \"" + command + "\".")
+gdb.execute = _execute
+gdb.write = lambda s: sys.stdout.write(s)
+gdb.string_to_argv = lambda s: s.split()
+
+# The inferior reads with reader(addr, length), which returns bytes or
+# raises gdb.MemoryError. reads records the (addr, length) of each call.
+class _Inferior(object):
+    def __init__(self, reader = None):
+        self.reads = []
+        self.reader = reader
+    def read_memory(self, addr, length):
+        self.reads.append((addr, length))
+        if self.reader is None:
+            raise gdb.MemoryError("Cannot access memory at address 0x%x" % addr)
+        return memoryview(self.reader(addr, length))
+gdb.inferior = _Inferior()
+gdb.selected_inferior = lambda: gdb.inferior
+
+sys.modules['gdb'] = gdb
+
+# gdb_utilities_python3.py sourced with the stub
+@pytest.fixture(scope = 'session')
+def u():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gdb_utilities_python3.py')
+    spec = importlib.util.spec_from_file_location('gdb_utilities_python3', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# a fresh gdb.inferior reading with the given reader
+@pytest.fixture
+def inferior():
+    def install(reader):
+        gdb.inferior = _Inferior(reader)
+        return gdb.inferior
+    yield install
+    gdb.inferior = _Inferior()
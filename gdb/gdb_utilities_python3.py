@@ -6,7 +6,24 @@
 #############################################################################
 
 import gdb
+import fnmatch
+import json
+import mmap
+import os
 import pdb
+import re
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, namedtuple
+
+# NumPy is optional. It speeds up decoding of many compressed pointers.
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 #############################################################################
 # PROVIDED FUNCTIONS
@@ -28,7 +45,25 @@ import pdb
 # Example:
 #
 #      (gdb) hs-find 0x00000000ec4a6a00
-#      {(oopDesc *)0xec4a6a00} points to instance of jdk/internal/reflect/DelegatingClassLoader
+#      0xec4a6a00 in java heap: {(oopDesc *)0xec4a6a00} points to instance of jdk/internal/reflect/DelegatingClassLoader
+#
+# Java heap addresses are decoded as the start of an object. With -i an
+# address that is not an object start is taken for an interior pointer and
+# the object containing it is searched. This walks the region containing
+# the address and is supported with G1 only.
+#
+#      (gdb) hs-find -i 0x00000000ec4a6a10
+#      0xec4a6a10 in java heap: {(oopDesc *)0xec4a6a00} points to instance of jdk/internal/reflect/DelegatingClassLoader +16
+#
+# With -w the given number of words at the address are read and the
+# values are classified, e.g. to find the oops, Metadata and code on a
+# corrupted stack.
+#
+#      (gdb) hs-find -w $sp 4
+#      0x7f5c5a7fd9a0: 0x00000000ec4a6a00  java heap
+#      0x7f5c5a7fd9a8: 0x0000000000000003
+#      0x7f5c5a7fd9b0: 0x00007f5c5a7fda10  stack of JavaThread 0x7f5c7012a800
+#      0x7f5c5a7fd9b8: 0x00007f5c611a2c3b  CodeHeap 'non-profiled nmethods'
 #
 # ---------------------------------------------------------------------
 # hs-print-class-loader-data: print all ClassLoaderData in ClassLoaderDataGraph
@@ -60,6 +95,185 @@ import pdb
 #    jdk/internal/reflect/GeneratedMethodAccessor51282
 #    [...]
 #
+# ---------------------------------------------------------------------
+# Usage Example: find the first class with a name starting with a prefix
+# ---------------------------------------------------------------------
+#
+#    (gdb) py print(next(ClassLoaderDataGraph.iter_klasses(name_prefix = 'java/lang/Thread'), None))
+#
+#    KlassRecord(klass=140120547409936, name='java/lang/Thread', cld=CLDRecord(cld=94772104545616, [...]))
+#
+# ---------------------------------------------------------------------
+# hs-find-class
+# ---------------------------------------------------------------------
+#
+# Find loaded classes by name. The name is matched exactly, as glob
+# pattern if it contains *, ? or [, or as prefix with -p. Dots in the name
+# are replaced with slashes. The first call builds an index of all class
+# names which is reused until the inferior runs again.
+#
+#    (gdb) hs-find-class java.lang.Thread
+#    java/lang/Thread (Klass *)0x800016c48 (ClassLoaderData *)0x7f5c7011f6e0 loader: <bootstrap>
+#    1 classes found (25304 class names indexed)
+#
+#    (gdb) hs-find-class jdk/internal/reflect/GeneratedMethodAccessor5128?
+#
+# ---------------------------------------------------------------------
+# hs-cld-histogram
+# ---------------------------------------------------------------------
+#
+# Count class loader data, classes, anonymous and unloading CLDs per
+# class of the loader and list the CLDs with the most classes. The
+# optional argument limits both tables (default 20).
+#
+#    (gdb) hs-cld-histogram 3
+#        CLDs  classes     anon   unload  loader class
+#       63061    63061        0        0  jdk/internal/reflect/DelegatingClassLoader
+#           1    11373        0        0  <bootstrap>
+#           1     4391        0        0  jdk/internal/loader/ClassLoaders$AppClassLoader
+#    [12 more loader classes]
+#       63122    81057      407        0  total
+#    [...]
+#
+# ---------------------------------------------------------------------
+# hs-metaspace-by-loader
+# ---------------------------------------------------------------------
+#
+# Metaspace used, committed and reserved per class of the loader and for
+# the biggest class loader data, sorted by committed size. Class loader
+# data on the unloading list is included.
+#
+#    (gdb) hs-metaspace-by-loader 2
+#        CLDs     used K committed K reserved K   chunks  loader class
+#       63061   190113     252244     252244    63061  jdk/internal/reflect/DelegatingClassLoader
+#           1    47032      47360      49152       61  <bootstrap>
+#    [...]
+#
+# ---------------------------------------------------------------------
+# hs-heap-histo
+# ---------------------------------------------------------------------
+#
+# Class histogram of the java heap like jmap -histo. The objects are
+# found by walking the spaces of G1, Parallel or Serial GC. The optional
+# argument limits the number of lines.
+#
+#    (gdb) hs-heap-histo 3
+#     num     #instances         #bytes  class name
+#    ----------------------------------------------
+#       1:        1311020      126215680  [B
+#       2:        1310497       31451928  java/lang/String
+#       3:          63061       12612200  java/lang/Class
+#    Total        3140163      203512736
+#
+# ---------------------------------------------------------------------
+# hs-find-refs
+# ---------------------------------------------------------------------
+#
+# Find the words in the java heap that reference one of the given
+# objects and print the objects containing them. The reserved region of
+# the heap is scanned in chunks. Narrow and wide encodings are searched.
+#
+#    (gdb) hs-find-refs 0xed7d9e00
+#    0xec48a00c: narrow reference to 0xed7d9e00 in {(oopDesc *)0xec48a000} points to instance of java/util/HashMap$Node +12
+#    1 references found
+#
+# ---------------------------------------------------------------------
+# hs-threads
+# ---------------------------------------------------------------------
+#
+# List all JavaThreads with state, os thread id, name and java frames
+# (x86_64 and ppc64). With -s the frames are omitted. java_threads()
+# yields the same information as JavaThreadRecords.
+#
+#    (gdb) hs-threads
+#    "main" (JavaThread *)0x7f5c7002a000 os_id=4712 _thread_blocked
+#        {(Method *)0x7f5c3c0a1f58}:java/lang/Object.wait(J)V bci:-1 line:-1 interpreted
+#        {(Method *)0x7f5c3c0a2078}:java/lang/Thread.join(J)V bci:70 line:1313 compiled
+#    [...]
+#
+# ---------------------------------------------------------------------
+# hs-interpreted-frames
+# ---------------------------------------------------------------------
+#
+# Decode the java frames of a JavaThread (default: the one of the selected
+# gdb thread) with the locals (local 0 first) and the expression stack (top
+# first) of interpreted frames. Works on x86_64 and ppc64. On ppc64 the
+# values are taken from the frame::ijava_state printed by the istate macros
+# in gdb_utilities.gdb.
+#
+#    (gdb) hs-interpreted-frames
+#    "main" (JavaThread *)0x7f5c7002a000 os_id=4712 _thread_in_vm
+#        {(Method *)0x7f5c3c4b1e10}:Test.loop(I)I bci:12 line:27 interpreted sp:0x7f5c7a1fe8d0
+#            local[0]: 0x3e8
+#            local[1]: 0x17
+#            stack[0]: 0x17
+#    [...]
+#
+# ---------------------------------------------------------------------
+# hs-symbolize-pcs: print the inlining at many pcs in one pass
+# ---------------------------------------------------------------------
+#
+# Example:
+#
+#    (gdb) hs-symbolize-pcs -o symbolized.txt perf_pcs.txt
+#
+#    $ cat symbolized.txt
+#    0x2aaaad53db7f: {(nmethod *)0x2aaaad53d810}
+#        {(Method *)0x901a1ea0}:java/lang/ThreadLocal.access$400(Ljava/lang/ThreadLocal;)I:bci1/L53
+#        [...]
+#
+# ---------------------------------------------------------------------
+# hs-snapshot: save and restore the indexes
+# ---------------------------------------------------------------------
+#
+# Save the class list, the class loader data, the code blobs with the
+# PcDescs and scopes data of the nmethods and the address map to a file.
+# Loading it in a later session on the same core restores the indexes
+# without walking the vm again. -f loads a snapshot of another vm.
+#
+#    (gdb) hs-snapshot save core.4711.snap
+#    saved 63122 CLDs, 81057 classes, 12840 code blobs (9211 nmethods with PcDescs), 4127 address regions to core.4711.snap
+#
+#    (gdb) hs-snapshot load core.4711.snap
+#
+# ---------------------------------------------------------------------
+# hs-backend, hs-export-layouts: reading the core file without gdb
+# ---------------------------------------------------------------------
+#
+# hs-backend core maps the core file and reads the memory for the raw
+# walkers directly from it instead of through gdb. hs-export-layouts writes
+# the type layouts and the addresses of globals needed by hotspot_core.py,
+# which runs the same walkers (ClassLoaderDataGraph, CodeHeaps, java heap)
+# on cores in plain Python processes.
+#
+#    (gdb) hs-backend core core.4711
+#    reading memory through core file core.4711
+#
+#    (gdb) hs-export-layouts jdk17-layouts.json
+#    $ python3 hotspot_core.py -l jdk17-layouts.json -j 8 classes cores/core.*
+#    $ python3 hotspot_core.py -l jdk17-layouts.json heap core.4711
+#
+# ---------------------------------------------------------------------
+# hs-profile: where do the commands spend their time
+# ---------------------------------------------------------------------
+#
+# Count memory reads, bytes read, parse_and_eval and lookup_type calls and
+# constructed wrappers, time the commands and functions of this module and
+# report the hit rates of the caches. The report is printed as table or as
+# JSON. Profiling has no overhead when it is off. Memory that gdb reads for
+# gdb.Values is not in the reads. The getField and deref calls of the
+# wrappers, which read through gdb.Values, are counted as val reads.
+#
+#    (gdb) hs-profile on
+#    (gdb) hs-print-all-class-loader-data
+#    (gdb) hs-profile off
+#    (gdb) hs-profile report
+#    [...]
+#    command                           calls   seconds    reads   KiB read   read s    evals   eval s  lookups val reads  wrappers
+#    hs-print-all-class-loader-data        1    41.207   252410      39104    3.118   189367   30.412       12     63120    441683
+#    [...]
+#    (gdb) hs-profile report json profile.json
+#
 # !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
 # !!! LEGACY FUNCTIONS BELOW -- IMPLEMENTATION IS OUTDATED - NEED TO BE REVISED!!!
 # !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
@@ -118,12 +332,109 @@ import pdb
 #############################################################################
 
 
+#############################################################################
+#
+# Caches
+#
+#############################################################################
+
+# Data decoded from the inferior is cached to avoid reading and decoding it
+# again and again. This is safe as long as the inferior does not execute,
+# which is always the case when analyzing a core file. Every cache registers
+# a function to clear it. The functions are called when the inferior resumes
+# or when object files are (un)loaded, e.g. because another core is loaded.
+_cache_clear_functions = []
+
+def register_cache(clear):
+    _cache_clear_functions.append(clear)
+    return clear
+
+def clear_caches(event = None):
+    for clear in _cache_clear_functions:
+        clear()
+
+gdb.events.cont.connect(clear_caches)
+gdb.events.new_objfile.connect(clear_caches)
+if hasattr(gdb.events, 'clear_objfiles'): gdb.events.clear_objfiles.connect(clear_caches)
+if hasattr(gdb.events, 'memory_changed'): gdb.events.memory_changed.connect(clear_caches)
+
+# LRUCache: a cache with a bounded number of entries. When it is full the
+# least recently used entry is evicted. Hits and misses are counted for
+# hs-profile.
+class LRUCache(object):
+    # all LRUCaches by name
+    instances = OrderedDict()
+    def __init__(self, max_size, name):
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        LRUCache.instances[name] = self
+        register_cache(self.clear)
+    def get(self, key):
+        res = self._entries.get(key)
+        if res is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+        return res
+    def put(self, key, val):
+        self._entries[key] = val
+        self._entries.move_to_end(key)
+        if len(self._entries) > self._max_size:
+            self._entries.popitem(last = False)
+    def clear(self):
+        self._entries.clear()
+    def __len__(self): return len(self._entries)
+
+
+#############################################################################
+#
+# Lazy initialization
+#
+#############################################################################
+
+# Types, vm globals and constants are resolved when they are used for the
+# first time and memoized until the caches are cleared. Sourcing this file
+# is cheap therefore and works even if no core is loaded yet. Only the
+# subsystems that are actually used in a session are initialized.
+
+# LazyValue: class attribute computed by compute(cls) on first access
+class LazyValue(object):
+    _unset = object()
+    def __init__(self, compute):
+        self._compute = compute
+        self._value = LazyValue._unset
+        register_cache(self.reset)
+    def __get__(self, obj, cls):
+        if self._value is LazyValue._unset:
+            self._value = self._compute(cls)
+        return self._value
+    def reset(self):
+        self._value = LazyValue._unset
+
+# LazyValue for a vm global given as expression
+def vm_global(expr):
+    return LazyValue(lambda cls: gdb.parse_and_eval(expr))
+
+# LazyValue for a hotspot type (or a pointer to it)
+def hotspot_type(name, ptr_depth = 0):
+    def lookup(cls):
+        res = gdb.lookup_type(name)
+        for i in range(ptr_depth): res = res.pointer()
+        return res
+    return LazyValue(lookup)
+
 #############################################################################
 #
 # Detecting build configuration
 #
 #############################################################################
-CHECK_UNHANDLED_OOPS = False if len(gdb.parse_and_eval('ClassLoaderData::_the_null_class_loader_data')['_class_loader'].type.fields()) == 0 else True
+
+class BuildConfig(object):
+    CHECK_UNHANDLED_OOPS = LazyValue(lambda cls: len(gdb.parse_and_eval('ClassLoaderData::_the_null_class_loader_data')['_class_loader'].type.fields()) != 0)
 
 #############################################################################
 #
@@ -131,90 +442,104 @@ CHECK_UNHANDLED_OOPS = False if len(gdb.parse_and_eval('ClassLoaderData::_the_nu
 #
 #############################################################################
 
-UseCompressedOops = gdb.parse_and_eval('UseCompressedClassPointers')
+class Options(object):
+    UseCompressedOops = vm_global('UseCompressedOops')
+    UseCompressedClassPointers = vm_global('UseCompressedClassPointers')
+    UseG1GC = vm_global('UseG1GC')
+    UseParallelGC = vm_global('UseParallelGC')
+    UseSerialGC = vm_global('UseSerialGC')
+    MinObjAlignmentInBytes = vm_global('MinObjAlignmentInBytes')
 
 #############################################################################
 #
 # Hotspot types
 #
+# Use T.<name> to get the gdb.Type, e.g. T.Klass_tp for Klass*.
+#
 #############################################################################
-char_t  = gdb.lookup_type('char')                             # char
-jbyte_t   = gdb.lookup_type('jbyte')                          # jbyte
-jubyte_t   = gdb.lookup_type('jubyte')                        # jubyte
-int_t   = gdb.lookup_type('int')                              # int
-int_tp   = int_t.pointer()                                    # int
-long_t   = gdb.lookup_type('long')                            # long
-jint_t   = gdb.lookup_type('jint')                            # jint
-juint_t   = gdb.lookup_type('juint')                          # juint
-uint_t   = gdb.lookup_type('unsigned int')                    # unsigned int
-intptr_t  = gdb.lookup_type('intptr_t')                       # intptr_t
-uintptr_t  = gdb.lookup_type('uintptr_t')                     # uintptr_t
-u_char_t= gdb.lookup_type('unsigned char')                    # u_char
-u_char_tp= u_char_t.pointer()                                 # u_char*
-void_tp = gdb.lookup_type('void').pointer()                   # void*
-char_tp = char_t.pointer()                                    # char*
-intptr_tp  = intptr_t.pointer()                               # intptr*
-address_t = gdb.lookup_type('address')                        # address_t
-address_tp = address_t.pointer()                              # address_t
-size_t = gdb.lookup_type('size_t')                            # size_t
-ptrdiff_t = gdb.lookup_type('ptrdiff_t')                      # ptrdiff_t
-MemRegion_t = gdb.lookup_type('MemRegion')                    # MemRegion
-CollectedHeap_t = gdb.lookup_type('CollectedHeap')            # CollectedHeap
-CollectedHeap_tp = gdb.lookup_type('CollectedHeap').pointer() # CollectedHeap*
-HeapBlock_tp = gdb.lookup_type('HeapBlock').pointer()         # HeapBlock*
-CodeHeap_tp = gdb.lookup_type('CodeHeap').pointer()           # CodeHeap*
-CodeBlob_tp = gdb.lookup_type('CodeBlob').pointer()           # CodeBlob*
-nmethod_tp = gdb.lookup_type('nmethod').pointer()             # nmethod*
-PcDescCache_tp = gdb.lookup_type('PcDescCache').pointer()     # PcDescCache*
-PcDesc_tp = gdb.lookup_type('PcDesc').pointer()               # PcDesc*
-MetaspaceObj_tp = gdb.lookup_type('MetaspaceObj').pointer()   # MetaspaceObj*
-Metadata_tp = gdb.lookup_type('Metadata').pointer()           # Metadata*
-Metadata_tpp = gdb.lookup_type('Metadata').pointer().pointer()# Metadata**
-ConstantPool_t  = gdb.lookup_type('ConstantPool')             # ConstantPool
-ConstantPool_tp = gdb.lookup_type('ConstantPool').pointer()   # ConstantPool
-Klass_t = gdb.lookup_type('Klass')                            # Klass
-Klass_tp = gdb.lookup_type('Klass').pointer()                 # Klass*
-oopDesc_tp = gdb.lookup_type('oopDesc').pointer()             # oopDesc*
-narrowOop_tp = gdb.lookup_type('narrowOop').pointer()         # narrowOop*
-ClassLoaderData_t = gdb.lookup_type('ClassLoaderData')        # ClassLoaderData
-ClassLoaderData_tp = gdb.lookup_type('ClassLoaderData').pointer() # ClassLoaderData*
-ClassLoaderDataGraph_t = gdb.lookup_type('ClassLoaderDataGraph')  # ClassLoaderDataGraph
-ClassLoaderDataGraph_tp = gdb.lookup_type('ClassLoaderDataGraph').pointer() # ClassLoaderDataGraph*
-Method_t  = gdb.lookup_type('Method')                         # Method
-Method_tp = gdb.lookup_type('Method').pointer()               # Method
-ConstMethod_t  = gdb.lookup_type('ConstMethod')               # ConstMethod
-ConstMethod_tp = gdb.lookup_type('ConstMethod').pointer()     # ConstMethod*
-Symbol_tp  = gdb.lookup_type('Symbol').pointer()              # Symbol*
-Symbol_tpp = gdb.lookup_type('Symbol').pointer().pointer()    # Symbol**
-oopDesc_tpp = gdb.lookup_type('oopDesc').pointer()            # oopDesc**
-Compile_tp = gdb.lookup_type('Compile').pointer()             # Compile*
-compiledVFrame_tp = gdb.lookup_type('compiledVFrame').pointer() # compiledVFrame*
+
+class T(object):
+    char_t = hotspot_type('char')                                      # char
+    jbyte_t = hotspot_type('jbyte')                                    # jbyte
+    jubyte_t = hotspot_type('jubyte')                                  # jubyte
+    int_t = hotspot_type('int')                                        # int
+    int_tp = hotspot_type('int', 1)                                    # int*
+    long_t = hotspot_type('long')                                      # long
+    jint_t = hotspot_type('jint')                                      # jint
+    juint_t = hotspot_type('juint')                                    # juint
+    uint_t = hotspot_type('unsigned int')                              # unsigned int
+    intptr_t = hotspot_type('intptr_t')                                # intptr_t
+    uintptr_t = hotspot_type('uintptr_t')                              # uintptr_t
+    u_char_t = hotspot_type('unsigned char')                           # u_char
+    u_char_tp = hotspot_type('unsigned char', 1)                       # u_char*
+    void_tp = hotspot_type('void', 1)                                  # void*
+    char_tp = hotspot_type('char', 1)                                  # char*
+    intptr_tp = hotspot_type('intptr_t', 1)                            # intptr*
+    address_t = hotspot_type('address')                                # address_t
+    address_tp = hotspot_type('address', 1)                            # address_t*
+    size_t = hotspot_type('size_t')                                    # size_t
+    ptrdiff_t = hotspot_type('ptrdiff_t')                              # ptrdiff_t
+    MemRegion_t = hotspot_type('MemRegion')                            # MemRegion
+    CollectedHeap_t = hotspot_type('CollectedHeap')                    # CollectedHeap
+    CollectedHeap_tp = hotspot_type('CollectedHeap', 1)                # CollectedHeap*
+    HeapBlock_tp = hotspot_type('HeapBlock', 1)                        # HeapBlock*
+    CodeHeap_tp = hotspot_type('CodeHeap', 1)                          # CodeHeap*
+    CodeBlob_tp = hotspot_type('CodeBlob', 1)                          # CodeBlob*
+    nmethod_tp = hotspot_type('nmethod', 1)                            # nmethod*
+    PcDescCache_tp = hotspot_type('PcDescCache', 1)                    # PcDescCache*
+    PcDesc_t = hotspot_type('PcDesc')                                  # PcDesc
+    PcDesc_tp = hotspot_type('PcDesc', 1)                              # PcDesc*
+    MetaspaceObj_tp = hotspot_type('MetaspaceObj', 1)                  # MetaspaceObj*
+    Metadata_tp = hotspot_type('Metadata', 1)                          # Metadata*
+    Metadata_tpp = hotspot_type('Metadata', 2)                         # Metadata**
+    ConstantPool_t = hotspot_type('ConstantPool')                      # ConstantPool
+    ConstantPool_tp = hotspot_type('ConstantPool', 1)                  # ConstantPool*
+    Klass_t = hotspot_type('Klass')                                    # Klass
+    Klass_tp = hotspot_type('Klass', 1)                                # Klass*
+    oopDesc_tp = hotspot_type('oopDesc', 1)                            # oopDesc*
+    narrowOop_tp = hotspot_type('narrowOop', 1)                        # narrowOop*
+    ClassLoaderData_t = hotspot_type('ClassLoaderData')                # ClassLoaderData
+    ClassLoaderData_tp = hotspot_type('ClassLoaderData', 1)            # ClassLoaderData*
+    ClassLoaderDataGraph_t = hotspot_type('ClassLoaderDataGraph')      # ClassLoaderDataGraph
+    ClassLoaderDataGraph_tp = hotspot_type('ClassLoaderDataGraph', 1)  # ClassLoaderDataGraph*
+    Method_t = hotspot_type('Method')                                  # Method
+    Method_tp = hotspot_type('Method', 1)                              # Method*
+    ConstMethod_t = hotspot_type('ConstMethod')                        # ConstMethod
+    ConstMethod_tp = hotspot_type('ConstMethod', 1)                    # ConstMethod*
+    Symbol_t = hotspot_type('Symbol')                                  # Symbol
+    Symbol_tp = hotspot_type('Symbol', 1)                              # Symbol*
+    Symbol_tpp = hotspot_type('Symbol', 2)                             # Symbol**
+    oopDesc_tpp = hotspot_type('oopDesc', 2)                           # oopDesc**
+    Compile_tp = hotspot_type('Compile', 1)                            # Compile*
+    JavaThread_t = hotspot_type('JavaThread')                          # JavaThread
+    JavaCallWrapper_t = hotspot_type('JavaCallWrapper')                # JavaCallWrapper
+    compiledVFrame_tp = hotspot_type('compiledVFrame', 1)              # compiledVFrame*
+    # effective type for oops in the java heap
+    effOopType = LazyValue(lambda cls: cls.narrowOop_tp if Options.UseCompressedOops else cls.oopDesc_tp)
 
 # global definitions from globalDefinitions.hpp
-badInt           = gdb.parse_and_eval('-3').cast(jint_t);                       # generic "bad int" value
-badAddressVal    = gdb.parse_and_eval('-2').cast(long_t);                       # generic "bad address" value
-badOopVal        = gdb.parse_and_eval('-1').cast(long_t);                       # generic "bad oop" value
-badHeapOopVal    = gdb.parse_and_eval('(intptr_t) 0x2BAD4B0BBAADBABELL').cast(intptr_t); # value used to zap heap after GC
-badHandleValue   = gdb.parse_and_eval('0xBC').cast(int_t);                     # value used to zap vm handle area
-badResourceValue = gdb.parse_and_eval('0xAB').cast(int_t);                     # value used to zap resource area
-freeBlockPad     = gdb.parse_and_eval('0xBA').cast(int_t);                     # value used to pad freed blocks.
-uninitBlockPad   = gdb.parse_and_eval('0xF1').cast(int_t);                     # value used to zap newly malloc'd blocks.
-badJNIHandleVal  = gdb.parse_and_eval('(intptr_t) 0xFEFEFEFEFEFEFEFELL').cast(intptr_t); # value used to zap jni handle area
-badHeapWordVal   = gdb.parse_and_eval('0xBAADBABE').cast(juint_t);               # value used to zap heap after GC
-badCodeHeapNewVal= gdb.parse_and_eval('0xCC').cast(int_t);                     # value used to zap Code heap at allocation
-badCodeHeapFreeVal = gdb.parse_and_eval('0xDD').cast(int_t);                   # value used to zap Code heap at deallocation
-
-badAddress       = badAddressVal.cast(intptr_t).cast(address_t)
-badOop           = badOopVal.cast(intptr_t).cast(oopDesc_tp)
-badHeapWord      = badHeapWordVal
-badJNIHandle     = badJNIHandleVal.cast(oopDesc_tp)
-
-# effective type for oops in the java heap
-effOopType = narrowOop_tp if UseCompressedOops else oopDesc_tp
+class globalDefinitions(object):
+    badInt           = LazyValue(lambda cls: gdb.parse_and_eval('-3').cast(T.jint_t))        # generic "bad int" value
+    badAddressVal    = LazyValue(lambda cls: gdb.parse_and_eval('-2').cast(T.long_t))        # generic "bad address" value
+    badOopVal        = LazyValue(lambda cls: gdb.parse_and_eval('-1').cast(T.long_t))        # generic "bad oop" value
+    badHeapOopVal    = LazyValue(lambda cls: gdb.parse_and_eval('(intptr_t) 0x2BAD4B0BBAADBABELL').cast(T.intptr_t)) # value used to zap heap after GC
+    badHandleValue   = LazyValue(lambda cls: gdb.parse_and_eval('0xBC').cast(T.int_t))       # value used to zap vm handle area
+    badResourceValue = LazyValue(lambda cls: gdb.parse_and_eval('0xAB').cast(T.int_t))       # value used to zap resource area
+    freeBlockPad     = LazyValue(lambda cls: gdb.parse_and_eval('0xBA').cast(T.int_t))       # value used to pad freed blocks.
+    uninitBlockPad   = LazyValue(lambda cls: gdb.parse_and_eval('0xF1').cast(T.int_t))       # value used to zap newly malloc'd blocks.
+    badJNIHandleVal  = LazyValue(lambda cls: gdb.parse_and_eval('(intptr_t) 0xFEFEFEFEFEFEFEFELL').cast(T.intptr_t)) # value used to zap jni handle area
+    badHeapWordVal   = LazyValue(lambda cls: gdb.parse_and_eval('0xBAADBABE').cast(T.juint_t)) # value used to zap heap after GC
+    badCodeHeapNewVal= LazyValue(lambda cls: gdb.parse_and_eval('0xCC').cast(T.int_t))       # value used to zap Code heap at allocation
+    badCodeHeapFreeVal = LazyValue(lambda cls: gdb.parse_and_eval('0xDD').cast(T.int_t))     # value used to zap Code heap at deallocation
+
+    badAddress       = LazyValue(lambda cls: cls.badAddressVal.cast(T.intptr_t).cast(T.address_t))
+    badOop           = LazyValue(lambda cls: cls.badOopVal.cast(T.intptr_t).cast(T.oopDesc_tp))
+    badHeapWord      = LazyValue(lambda cls: cls.badHeapWordVal)
+    badJNIHandle     = LazyValue(lambda cls: cls.badJNIHandleVal.cast(T.oopDesc_tp))
 
 class JavaValue(object):
-    InvocationEntryBci = gdb.Value(-1).cast(int_t)
-    InvalidOSREntryBci = gdb.Value(-2).cast(int_t)
+    InvocationEntryBci = LazyValue(lambda cls: gdb.Value(-1).cast(T.int_t))
+    InvalidOSREntryBci = LazyValue(lambda cls: gdb.Value(-2).cast(T.int_t))
 
 #############################################################################
 #
@@ -269,6 +594,431 @@ def gdbval2str(val):
         res = "(" + str(val.type) + ")" + res
     return res
 
+# format a Python bool like gdb formats a C++ bool
+def bool2str(b):
+    return "true" if b else "false"
+
+
+#############################################################################
+#
+# Raw memory access
+#
+#############################################################################
+
+# Reading a block of memory with one call is much cheaper than reading the
+# same data through gdb.Value objects which costs a round-trip into gdb for
+# every value.
+
+# PageCache
+#
+# Read-through cache of the memory of the inferior in pages of page_size
+# bytes. The missing pages of a read are read with one call into gdb per run
+# of adjacent pages, so many small reads become a few big ones. The least
+# recently used pages are evicted if more than max_pages are cached. Reads
+# of bypass_size bytes or more, e.g. the chunks of heap scans, are not
+# cached. If a page cannot be read in full, e.g. at the end of a mapping,
+# the requested bytes are read directly.
+class PageCache(object):
+    page_size = 64 << 10
+    max_pages = 1024  # 64 MiB
+    bypass_size = 1 << 20
+    def __init__(self):
+        self._pages = OrderedDict()  # page number -> bytes
+        self._unreadable = set()     # page numbers
+        self.hits = 0
+        self.misses = 0
+        register_cache(self.clear)
+    def clear(self):
+        self._pages.clear()
+        self._unreadable.clear()
+    def size(self):
+        return len(self._pages) * PageCache.page_size
+    def read(self, addr, length):
+        if length <= 0 or length >= PageCache.bypass_size:
+            return PageCache._read_inferior(addr, length)
+        page_size = PageCache.page_size
+        first = addr // page_size
+        last = (addr + length - 1) // page_size
+        pages = self._pages
+        missing = [p for p in range(first, last + 1) if p not in pages]
+        if missing:
+            if not self._unreadable.isdisjoint(missing):
+                return PageCache._read_inferior(addr, length)
+            self.misses += len(missing)
+            self._fill(missing)
+            if not self._unreadable.isdisjoint(missing):
+                return PageCache._read_inferior(addr, length)
+        self.hits += last - first + 1 - len(missing)
+        offset = addr - first * page_size
+        if first == last:
+            pages.move_to_end(first)
+            res = pages[first][offset:offset + length]
+        else:
+            for p in range(first, last + 1): pages.move_to_end(p)
+            res = b''.join(pages[p] for p in range(first, last + 1))[offset:offset + length]
+        while len(pages) > PageCache.max_pages:
+            pages.popitem(last = False)
+        return res
+    # read the missing pages, adjacent ones with one call
+    def _fill(self, missing):
+        page_size = PageCache.page_size
+        i = 0
+        while i < len(missing):
+            j = i + 1
+            while j < len(missing) and missing[j] == missing[j-1] + 1:
+                j += 1
+            try:
+                buf = PageCache._read_inferior(missing[i] * page_size, (j - i) * page_size)
+                for k in range(i, j):
+                    self._pages[missing[k]] = buf[(k-i)*page_size:(k-i+1)*page_size]
+            except gdb.MemoryError:
+                if j - i == 1:
+                    self._unreadable.add(missing[i])
+                else:
+                    # find the unreadable pages by bisection
+                    mid = (i + j) // 2
+                    self._fill(missing[i:mid])
+                    self._fill(missing[mid:j])
+            i = j
+    @staticmethod
+    def _read_inferior(addr, length):
+        return gdb.selected_inferior().read_memory(addr, length).tobytes()
+
+page_cache = PageCache()
+
+# Backends
+#
+# All raw reads go through the current backend. GdbBackend reads the
+# memory of the inferior through the page_cache. CoreFileBackend maps the ELF core file with
+# hotspot_core.ElfCore and reads it without a round-trip into gdb. Memory
+# that is neither in the core nor in a file mapped by the process is still
+# read by gdb. hs-backend switches the backend. The backend is reset to gdb
+# when the program changes, i.e. when the object files are cleared (e.g.
+# another core is loaded) or an inferior is added, but not when only the
+# caches are cleared.
+class GdbBackend(object):
+    def __str__(self): return "gdb"
+    def read_memory(self, addr, length):
+        return page_cache.read(addr, length)
+
+class CoreFileBackend(GdbBackend):
+    def __init__(self, path):
+        self._core = hotspot_core.ElfCore(path)
+    def __str__(self): return "core file " + self._core.path
+    def read_memory(self, addr, length):
+        try:
+            return bytes(self._core.read(addr, length))
+        except hotspot_core.CoreMemoryError:
+            return super(CoreFileBackend, self).read_memory(addr, length)
+
+_backend = GdbBackend()
+
+def backend():
+    return _backend
+
+def set_backend(b):
+    global _backend
+    _backend = b
+
+def _reset_backend(event = None):
+    set_backend(GdbBackend())
+
+if hasattr(gdb.events, 'clear_objfiles'): gdb.events.clear_objfiles.connect(_reset_backend)
+if hasattr(gdb.events, 'new_inferior'): gdb.events.new_inferior.connect(_reset_backend)
+
+
+# hotspot_vm.py with the walkers of the vm (see GdbVM below) and
+# hotspot_core.py are next to this file. Its directory is taken from the
+# name of the file gdb is sourcing or, for a script auto-loaded for an
+# objfile, from the objfile.
+def _find_module_dir():
+    for name in (_find_module_dir.__code__.co_filename, globals().get('__file__')):
+        if name and os.path.isfile(name):
+            return os.path.dirname(os.path.abspath(name))
+    objfile = gdb.current_objfile()
+    if objfile is not None and objfile.filename:
+        return os.path.dirname(os.path.abspath(objfile.filename))
+    return None
+
+_module_dir = _find_module_dir()
+if _module_dir is not None and _module_dir not in sys.path:
+    sys.path.append(_module_dir)
+try:
+    import hotspot_vm
+    import hotspot_core
+except ImportError as e:
+    raise ImportError("%s: hotspot_vm.py and hotspot_core.py are expected next to gdb_utilities_python3.py. "
+                      "Source it with its path or add its directory to sys.path." % e)
+
+# read length bytes at addr from the inferior
+def read_memory(addr, length):
+    return _backend.read_memory(addr, length)
+
+# byte order of the inferior: 'little' or 'big' (see int.from_bytes)
+_target_byteorder = None
+
+def target_byteorder():
+    global _target_byteorder
+    if _target_byteorder is None:
+        show_endian = gdb.execute('show endian', to_string = True)
+        _target_byteorder = 'big' if 'big endian' in show_endian else 'little'
+    return _target_byteorder
+
+def _clear_target_byteorder():
+    global _target_byteorder
+    _target_byteorder = None
+
+register_cache(_clear_target_byteorder)
+
+# read n pointers at addr with one read_memory call and return them as ints
+def read_pointers(addr, n):
+    if n == 0: return []
+    fmt = ('>' if target_byteorder() == 'big' else '<') + str(n) + ('Q' if T.void_tp.sizeof == 8 else 'I')
+    return list(struct.unpack(fmt, read_memory(addr, n*T.void_tp.sizeof)))
+
+# Decode a buffer of 32 bit compressed pointers (e.g. narrowOops or narrow
+# klass ids) with the given base and shift in one operation. 0 is decoded
+# as 0. The result is a numpy.ndarray of uint64 if NumPy is available and
+# an array('Q') otherwise.
+def decode_narrow(buf, base, shift):
+    if numpy is not None:
+        dt = numpy.dtype('>u4' if target_byteorder() == 'big' else '<u4')
+        narrow = numpy.frombuffer(buf, dtype = dt).astype(numpy.uint64)
+        wide = (narrow << numpy.uint64(shift)) + numpy.uint64(base)
+        return numpy.where(narrow != 0, wide, numpy.uint64(0))
+    narrow = array('I', bytes(buf))
+    if target_byteorder() != sys.byteorder: narrow.byteswap()
+    return array('Q', [0 if n == 0 else base + (n << shift) for n in narrow])
+
+# Decode a buffer of uncompressed pointers like decode_narrow
+def decode_wide(buf):
+    if numpy is not None:
+        return numpy.frombuffer(buf, dtype = numpy.dtype(('>u' if target_byteorder() == 'big' else '<u') + str(T.void_tp.sizeof)))
+    wide = array('Q' if T.void_tp.sizeof == 8 else 'I', bytes(buf))
+    if target_byteorder() != sys.byteorder: wide.byteswap()
+    return wide
+
+# Yield (address, value) for the words of the given width (4 or 8) in
+# [start, end) that are equal to one of the values. start must be aligned
+# to width. The range is read in chunks, so it can be bigger than the
+# memory of the host. Chunks that cannot be read are split and the
+# unreadable parts are skipped.
+def find_words(start, end, width, values, chunk_size = 4 << 20):
+    big_endian = target_byteorder() == 'big'
+    fmt = ('>' if big_endian else '<') + ('I' if width == 4 else 'Q')
+    if numpy is not None:
+        dt = numpy.dtype(('>u' if big_endian else '<u') + str(width))
+        np_values = numpy.array(sorted(values), dtype = dt)
+    else:
+        patterns = [(v, struct.pack(fmt, v)) for v in values]
+    addr = start
+    while addr < end:
+        n = min(chunk_size, end - addr)
+        try:
+            buf = read_memory(addr, n)
+        except gdb.MemoryError:
+            if chunk_size > find_words.min_chunk_size:
+                for hit in find_words(addr, addr + n, width, values, find_words.min_chunk_size):
+                    yield hit
+            addr += n
+            continue
+        if numpy is not None:
+            words = numpy.frombuffer(buf, dtype = dt, count = n // width)
+            for i in numpy.flatnonzero(numpy.isin(words, np_values)):
+                yield (addr + int(i)*width, int(words[i]))
+        else:
+            for v, pattern in patterns:
+                i = buf.find(pattern)
+                while i >= 0:
+                    if i % width == 0: yield (addr + i, v)
+                    i = buf.find(pattern, i + 1)
+        addr += n
+find_words.min_chunk_size = 64 << 10
+
+# convert a gdb.Value, a GdbValWrapper or an int into an int
+def as_int(val):
+    if isinstance(val, GdbValWrapper):
+        val = val.unwrap()
+    if isinstance(val, gdb.Value):
+        if val.type.strip_typedefs().code == gdb.TYPE_CODE_PTR:
+            val = val.cast(T.uintptr_t)
+        val = int(val)
+    return val
+
+#
+# StructLayout: offsets and struct formats of the fields of a gdb.Type.
+#
+# The layout of a type is computed once and shared. Fields of base classes
+# are included with their plain name. Fields of embedded structs, unions and
+# elements of arrays get qualified names, e.g. '_header._used' for
+# HeapBlock or '_pc_descs[2]' for PcDescCache. Bit fields are not included.
+#
+class StructLayout(object):
+    # str(type) -> StructLayout
+    _layouts = {}
+    # struct format characters for signed integral types by size
+    _int_formats = {1: 'b', 2: 'h', 4: 'i', 8: 'q'}
+    # arrays with more elements only get an entry for the array itself
+    max_array_elements = 64
+    @classmethod
+    def of(cls, gdbtype):
+        gdbtype = gdbtype.strip_typedefs()
+        key = str(gdbtype)
+        res = cls._layouts.get(key)
+        if res is None:
+            res = StructLayout(gdbtype)
+            cls._layouts[key] = res
+        return res
+    @classmethod
+    def clear_cache(cls):
+        cls._layouts = {}
+    def __init__(self, gdbtype):
+        self.name = str(gdbtype)
+        self._type = gdbtype
+        self._byteorder = '>' if target_byteorder() == 'big' else '<'
+        self._fields = {}  # name -> (offset, struct format or None, gdb.Type)
+        self._add_fields(gdbtype, 0, '')
+    def size(self): return self._type.sizeof
+    def has(self, name): return name in self._fields
+    def offset(self, name): return self._fields[name][0]
+    def field_type(self, name): return self._fields[name][2]
+    def field_size(self, name): return self._fields[name][2].sizeof
+    def format(self, name): return self._fields[name][1]
+    def field_names(self): return self._fields.keys()
+    # the layout for hotspot_core.Layout: fields as name -> [offset,
+    # struct format or None, size]
+    def export(self):
+        return {'size': self.size(),
+                'fields': dict((name, [f[0], f[1], f[2].sizeof]) for name, f in self._fields.items())}
+    def _add_fields(self, gdbtype, offset, prefix):
+        for f in gdbtype.fields():
+            if not hasattr(f, 'bitpos'): continue  # static member
+            if f.bitsize != 0: continue            # bit field
+            f_offset = offset + f.bitpos // 8
+            f_type = f.type.strip_typedefs()
+            if f.is_base_class or not f.name:
+                # base class or anonymous struct/union
+                self._add_fields(f_type, f_offset, prefix)
+                continue
+            name = prefix + f.name
+            self._add(name, f_offset, f.type)
+    def _add(self, name, offset, gdbtype):
+        t = gdbtype.strip_typedefs()
+        self._fields[name] = (offset, self._scalar_format(t), gdbtype)
+        if t.code == gdb.TYPE_CODE_STRUCT or t.code == gdb.TYPE_CODE_UNION:
+            self._add_fields(t, offset, name + '.')
+        elif t.code == gdb.TYPE_CODE_ARRAY:
+            lo, hi = t.range()
+            elt_type = t.target()
+            if hi - lo + 1 <= StructLayout.max_array_elements:
+                for i in range(hi - lo + 1):
+                    self._add(name + '[' + str(i) + ']', offset + i*elt_type.sizeof, elt_type)
+    def _scalar_format(self, t):
+        code = t.code
+        if code == gdb.TYPE_CODE_PTR:
+            return self._byteorder + self._int_formats[t.sizeof].upper()
+        if code == gdb.TYPE_CODE_FLT:
+            return self._byteorder + ('f' if t.sizeof == 4 else 'd')
+        if (code == gdb.TYPE_CODE_INT or code == gdb.TYPE_CODE_ENUM or
+            code == gdb.TYPE_CODE_CHAR or code == gdb.TYPE_CODE_BOOL):
+            if t.sizeof not in self._int_formats: return None
+            fmt = self._int_formats[t.sizeof]
+            if not StructLayout._is_signed(t): fmt = fmt.upper()
+            return self._byteorder + fmt
+        return None
+    @staticmethod
+    def _is_signed(t):
+        if hasattr(t, 'is_signed'): return t.is_signed
+        if t.code == gdb.TYPE_CODE_BOOL: return False
+        name = str(t)
+        return not (name.startswith('unsigned') or name in ('char16_t', 'char32_t'))
+
+register_cache(StructLayout.clear_cache)
+
+#
+# RawStruct: an object read from the inferior with one read_memory call.
+#
+# Fields are unpacked from the bytes buffer as Python ints. If just a few
+# fields of a big object are needed, read_fields reads only the bytes
+# spanning these fields. See hotspot_vm.RawStruct.
+#
+class RawStruct(hotspot_vm.RawStruct):
+    def __init__(self, layout, buf, addr, buf_offset = 0, vm = None):
+        super(RawStruct, self).__init__(layout, buf, addr, buf_offset, vm or GdbVM.get())
+    @staticmethod
+    def read(addr, gdbtype):
+        return GdbVM.get().read_struct(addr, StructLayout.of(gdbtype))
+    @staticmethod
+    def read_fields(addr, gdbtype, names):
+        return GdbVM.get().read_fields(addr, StructLayout.of(gdbtype), names)
+
+# GdbVM
+#
+# The hotspot_vm.HotSpotVM of the inferior: memory is read with
+# read_memory (i.e. through the current backend), layouts are StructLayouts
+# and globals are evaluated by gdb. The walkers of the ClassLoaderDataGraph,
+# the CodeHeaps, the JavaThreads and the java heap below delegate to it,
+# so they are the same code that hotspot_core.py runs on core files
+# without gdb. The instance with its caches (layouts, globals, decoded
+# strings) is dropped with the other caches.
+class GdbVM(hotspot_vm.HotSpotVM):
+    memory_errors = (gdb.MemoryError,)
+    # types that cannot be looked up by name
+    _types = {'GrowableArray<CodeHeap*>': lambda: gdb.parse_and_eval('CodeCache::_heaps').type.strip_typedefs().target()}
+    _instance = None
+    @classmethod
+    def get(cls):
+        if cls._instance is None:
+            cls._instance = GdbVM()
+        return cls._instance
+    @classmethod
+    def clear_cache(cls):
+        cls._instance = None
+    def __init__(self):
+        super(GdbVM, self).__init__(target_byteorder(), T.void_tp.sizeof)
+        self._layouts = {}  # type name -> StructLayout
+        self._globals = {}  # name -> int
+    def read(self, addr, length):
+        return read_memory(addr, length)
+    def layout(self, type_name):
+        res = self._layouts.get(type_name)
+        if res is None:
+            lookup = GdbVM._types.get(type_name)
+            try:
+                gdbtype = lookup() if lookup is not None else gdb.lookup_type(type_name)
+            except gdb.error:
+                raise KeyError(type_name)
+            res = self._layouts[type_name] = StructLayout.of(gdbtype)
+        return res
+    def has_global(self, name):
+        try:
+            self.global_value(name)
+            return True
+        except KeyError:
+            return False
+    def global_value(self, name):
+        res = self._globals.get(name)
+        if res is None:
+            try:
+                res = as_int(gdb.parse_and_eval(name))
+            except gdb.error:
+                raise KeyError(name)
+            self._globals[name] = res
+        return res
+    def klass_decoding(self):
+        if self._klass_decoding is None:
+            if Options.UseCompressedClassPointers:
+                self._klass_decoding = (True, as_int(Universe.narrow_klass_base()), as_int(Universe.narrow_klass_shift()))
+            else:
+                self._klass_decoding = (False, 0, 0)
+        return self._klass_decoding
+    def message(self, text):
+        print(text)
+    def error(self, text):
+        return gdb.GdbError(text)
+
+register_cache(GdbVM.clear_cache)
+
 
 #############################################################################
 #
@@ -284,29 +1034,49 @@ def gdbval2str(val):
 #
 # The class is actually just needed because gdb.Value cannot be subclassed.
 #
+# Reading fields with getField costs one trip into gdb per field. It
+# returns the field as gdb.Value, i.e. as lvalue that gdb reads lazily.
+# Wrappers that need just the values of scalar fields should use
+# getRawField instead. It reads only the bytes of the field with
+# read_memory and returns the value as Python int. raw() reads the whole
+# object into a RawStruct with one read_memory call; getRawField then takes
+# the fields from it.
+#
 # Subclassing GdbValWrapper...
 #
 # ...is easy: just make sure you provide a constructor that takes a gdb.Value
-# and its gdb.Type as an optional parameter, with T as default Value, where
-# T is the gdb.Type of the values the new subclass is wrapping. The constructor
-# must call the constructor of its superclass passing value and type:
+# and its gdb.Type as an optional parameter, with the name of TT as default
+# Value, where TT is the gdb.Type in T of the values the new subclass is
+# wrapping. The type is looked up by name when the first instance is
+# constructed. The constructor must call the constructor of its superclass
+# passing value and type:
 #
 #   class <subclass name>(GdbValWrapper):
-#       def __init__(self, klass, gdbtype = T):
+#       def __init__(self, klass, gdbtype = 'TT'):
 #           super(<subclass name>, self).__init__(klass, gdbtype)
 #
 #
 #
 class GdbValWrapper(object):
-    def __init__(self, gdbval, gdbtype = void_tp, ptr_target_type = None, ptr_type = None):
+    def __init__(self, gdbval, gdbtype = 'void_tp', ptr_target_type = None, ptr_type = None):
         if not isinstance(gdbval, gdb.Value):
             # GdbValWrapper is for gdb.Values only!
             raise Exception(repr(gdbval) + " is not an gdb.Value instance!")
+        if isinstance(gdbtype, str):
+            gdbtype = getattr(T, gdbtype)
         if gdbtype.code == gdb.TYPE_CODE_PTR and (gdbval.type.code != gdb.TYPE_CODE_PTR and gdbval.type.code != gdb.TYPE_CODE_INT):
             raise Exception("Error: must provide address to construct " + self.__class__.__name__)
         self._gdbval = gdbval.cast(gdbtype)
         self._ptr_target_type = ptr_target_type
         self._ptr_type = ptr_type
+        self._raw = None
+    # Wrapper of the object read into the RawStruct raw, e.g. an element of
+    # a table that was read with one call. raw() returns raw.
+    @classmethod
+    def of_raw(cls, raw):
+        res = cls(gdb.Value(raw.address()))
+        res._raw = raw
+        return res
     def __str__(self):
         return "{"+gdbval2str(self._gdbval)+"}"
     def extended_str(self):
@@ -338,6 +1108,36 @@ class GdbValWrapper(object):
         else:
             obj = self._gdbval
         return obj[name]
+    # address and type of the object the wrapped value refers to (if it is a
+    # pointer) or that it is
+    def obj_address(self):
+        if self._gdbval.type.code == gdb.TYPE_CODE_PTR:
+            return as_int(self._gdbval)
+        return as_int(self._gdbval.address)
+    def obj_type(self):
+        if self._gdbval.type.code == gdb.TYPE_CODE_PTR:
+            return self._gdbval.type.target()
+        return self._gdbval.type
+    def raw(self):
+        if self._raw is None:
+            self._raw = RawStruct.read(self.obj_address(), self.obj_type())
+        return self._raw
+    # Value of a scalar field as Python int. It is taken from raw() if the
+    # object was read already. Otherwise just the bytes of the field are
+    # read (through the page_cache with the gdb backend).
+    def getRawField(self, name):
+        if self._raw is not None:
+            raw = self._raw
+        else:
+            layout = StructLayout.of(self.obj_type())
+            if not layout.has(name) or layout.format(name) is None:
+                return as_int(self.getField(name))
+            raw = RawStruct.read_fields(self.obj_address(), self.obj_type(), (name,))
+        if not raw.has(name):
+            return as_int(self.getField(name))
+        return raw.get(name)
+    def getRawFieldAddress(self, name):
+        return self.raw().field_address(name)
     # dereference the underlying pointer and construct new object using the given constructor
     def deref(self):
         if self._ptr_target_type is None:
@@ -349,7 +1149,7 @@ class GdbValWrapper(object):
         return self._ptr_type(self._gdbval.address)
 
 # Constants
-NULL = GdbValWrapper(gdb.Value(0),void_tp)
+NULL = GdbValWrapper(gdb.Value(0),'void_tp')
 
 
 #############################################################################
@@ -377,13 +1177,13 @@ class hspp (gdb.Command):
     def invoke (self, val_str, from_tty):
         val = gdb.parse_and_eval(val_str)
         
-        if val.type == Symbol_tp:
+        if val.type == T.Symbol_tp:
             m = Symbol(val)
             gpp(m)
-        elif val.type == Method_tp:
+        elif val.type == T.Method_tp:
             m = Method(val)
             gpp(m)
-        elif val.type == compiledVFrame_tp:
+        elif val.type == T.compiledVFrame_tp:
             m = compiledVFrame(val)
             gpp(m)
         else:
@@ -398,17 +1198,45 @@ hspp ()
 # Example:
 #
 #      (gdb) hs-find 0x00000000ec4a6a00
-#      {(oopDesc *)0xec4a6a00} points to instance of jdk/internal/reflect/DelegatingClassLoader
+#      0xec4a6a00 in java heap: {(oopDesc *)0xec4a6a00} points to instance of jdk/internal/reflect/DelegatingClassLoader
+#
+# Java heap addresses are decoded as the start of an object. With -i an
+# address that is not an object start is taken for an interior pointer and
+# the object containing it is searched. This walks the region containing
+# the address and is supported with G1 only.
+#
+#      (gdb) hs-find -i 0x00000000ec4a6a10
+#      0xec4a6a10 in java heap: {(oopDesc *)0xec4a6a00} points to instance of jdk/internal/reflect/DelegatingClassLoader +16
+#
+# With -w the given number of words at the address are read and the
+# values are classified, e.g. to find the oops, Metadata and code on a
+# corrupted stack.
+#
+#      (gdb) hs-find -w $sp 4
+#      0x7f5c5a7fd9a0: 0x00000000ec4a6a00  java heap
+#      0x7f5c5a7fd9a8: 0x0000000000000003
+#      0x7f5c5a7fd9b0: 0x00007f5c5a7fda10  stack of JavaThread 0x7f5c7012a800
+#      0x7f5c5a7fd9b8: 0x00007f5c611a2c3b  CodeHeap 'non-profiled nmethods'
 #
 
 class hs_find (gdb.Command):
-    """TODO: Documentation for hs-find"""
+    """Find what an address points to. Usage: hs-find [-i] <addr> | hs-find -w <addr> <number of words>"""
 
     def __init__ (self):
         super (hs_find, self).__init__ ("hs-find", gdb.COMMAND_USER)
 
-    def invoke (self, addr, from_tty):
-        Universe.find(gdb.parse_and_eval(addr))
+    def invoke (self, argument, from_tty):
+        argv = gdb.string_to_argv(argument)
+        if argv and argv[0] == '-w':
+            if len(argv) != 3:
+                raise gdb.GdbError("Usage: hs-find [-i] <addr> | hs-find -w <addr> <number of words>")
+            AddressMap.get().print_words(as_int(gdb.parse_and_eval(argv[1])), int(gdb.parse_and_eval(argv[2])))
+        elif argv and argv[0] == '-i':
+            if len(argv) != 2:
+                raise gdb.GdbError("Usage: hs-find [-i] <addr> | hs-find -w <addr> <number of words>")
+            Universe.find(gdb.parse_and_eval(argv[1]), interior = True)
+        else:
+            Universe.find(gdb.parse_and_eval(argument))
 
 hs_find ()
 
@@ -419,12 +1247,12 @@ hs_find ()
 
 # CollectedHeap*
 class CollectedHeapP(GdbValWrapper):
-    def __init__(self, val, gdbtype = CollectedHeap_tp):
+    def __init__(self, val, gdbtype = 'CollectedHeap_tp'):
         super(CollectedHeapP, self).__init__(val, gdbtype, CollectedHeap)
 
 # CollectedHeap
 class CollectedHeap(GdbValWrapper):
-    def __init__(self, val, gdbtype = CollectedHeap_t):
+    def __init__(self, val, gdbtype = 'CollectedHeap_t'):
         super(CollectedHeap, self).__init__(val, gdbtype, None, CollectedHeapP)
         self._reserved = MemRegion(val['_reserved'])
     def is_in_reserved(self, p): return self._reserved.contains(p)
@@ -433,13 +1261,13 @@ class CollectedHeap(GdbValWrapper):
 
 # MemRegion
 class MemRegion(GdbValWrapper):
-    def __init__(self, val, gdbtype = MemRegion_t):
+    def __init__(self, val, gdbtype = 'MemRegion_t'):
         super(MemRegion, self).__init__(val, gdbtype)
         self._start = val['_start']
         self._word_size = val['_word_size']
     def end(self): return self._start + self._word_size;
     def contains(self, addr):
-        return addr >= self._start.cast(void_tp) and addr < self.end().cast(void_tp)
+        return addr >= self._start.cast(T.void_tp) and addr < self.end().cast(T.void_tp)
     def extended_str(self):
         return "["+ str(self._start) +"," + str(self.end()) + "]"
 
@@ -448,11 +1276,11 @@ class MemRegion(GdbValWrapper):
 #############################################################################
 
 class Universe(object):
-    _narrow_klass_shift = gdb.parse_and_eval('CompressedKlassPointers::_narrow_klass._shift')
-    _narrow_klass_base = gdb.parse_and_eval('CompressedKlassPointers::_narrow_klass._base')
-    _narrow_oop_shift = gdb.parse_and_eval('CompressedOops::_narrow_oop._shift')
-    _narrow_oop_base = gdb.parse_and_eval('CompressedOops::_narrow_oop._base')
-    _heap = CollectedHeapP(gdb.parse_and_eval("Universe::_collectedHeap")).deref()
+    _narrow_klass_shift = vm_global('CompressedKlassPointers::_narrow_klass._shift')
+    _narrow_klass_base = vm_global('CompressedKlassPointers::_narrow_klass._base')
+    _narrow_oop_shift = vm_global('CompressedOops::_narrow_oop._shift')
+    _narrow_oop_base = vm_global('CompressedOops::_narrow_oop._base')
+    _heap = LazyValue(lambda cls: CollectedHeapP(gdb.parse_and_eval("Universe::_collectedHeap")).deref())
     @classmethod
     def narrow_klass_shift(cls):
         return cls._narrow_klass_shift
@@ -466,13 +1294,8 @@ class Universe(object):
     def narrow_oop_base(cls):
         return cls._narrow_oop_base
     @classmethod
-    def find(cls, addr):
-        if not isinstance(addr, gdb.Value):
-            # must be wrapped
-            addr = addr.unwrap()
-        if cls._heap.is_in_reserved(addr): print(oopDescP(addr).extended_str())
-        # TODO: add Metaspace, Codecache, ...
-        else: print(gdbval2str(addr) + " NOT FOUND")
+    def find(cls, addr, interior = False):
+        print(AddressMap.get().describe(as_int(addr), interior))
 
 #############################################################################
 # Klass
@@ -480,7 +1303,7 @@ class Universe(object):
 
 # Pointer to Klass, i.e. Klass*
 class KlassP(GdbValWrapper):
-    def __init__(self, val, gdbtype = Klass_tp):
+    def __init__(self, val, gdbtype = 'Klass_tp'):
         super(KlassP, self).__init__(val, gdbtype, Klass)
     def next_link(self):
         return self.deref().next_link()
@@ -488,22 +1311,30 @@ class KlassP(GdbValWrapper):
         return self.deref().extended_str()
 
 class Klass(GdbValWrapper):
-    def __init__(self, val, gdbtype = Klass_t):
+    def __init__(self, val, gdbtype = 'Klass_t'):
         super(Klass, self).__init__(val, gdbtype)
-        self._name = Symbol(self.getField('_name'))
+        self._name = Symbol(gdb.Value(self.getRawField('_name')))
     def next_link(self):
-        return KlassP(self.getField('_next_link'))
+        return KlassP(gdb.Value(self.getRawField('_next_link')))
     @staticmethod
     def is_null(nk):
         return nk == 0
     @staticmethod
     def decode_klass_not_null(v):
           shift = Universe.narrow_klass_shift()
-          result = (Universe.narrow_klass_base().cast(uintptr_t) + (v.cast(uintptr_t) << shift)).cast(void_tp).cast(Klass_tp)
+          result = (Universe.narrow_klass_base().cast(T.uintptr_t) + (v.cast(T.uintptr_t) << shift)).cast(T.void_tp).cast(T.Klass_tp)
           return KlassP(result)
     @staticmethod
     def decode_klass(v):
         return NULL if Klass.is_null(v) else Klass.decode_klass_not_null(v)
+    # decode the narrow klass ids in the buffer, see decode_narrow
+    @staticmethod
+    def decode_klasses(buf):
+        return decode_narrow(buf, as_int(Universe.narrow_klass_base()), as_int(Universe.narrow_klass_shift()))
+    # the name of the Klass at the given address or None
+    @staticmethod
+    def name_at(klass):
+        return GdbVM.get().klass_name(klass)
     def extended_str(self):
         if self._name != NULL: return self._name.extended_str()
         else: return "special klass (e.g. klassKlass)"
@@ -513,26 +1344,30 @@ class Klass(GdbValWrapper):
 #############################################################################
 
 class oopDescP(GdbValWrapper):
-    def __init__(self, oopVal, gdbtype = oopDesc_tp):
+    def __init__(self, oopVal, gdbtype = 'oopDesc_tp'):
         super(oopDescP, self).__init__(oopVal, gdbtype)
+    # address of the Klass of the object at the given address
+    @staticmethod
+    def klass_at(obj):
+        return GdbVM.get().klass_at(obj)
     def get_Klass(self):
         md = self.unwrap().dereference()['_metadata']
-        if UseCompressedOops:
+        if Options.UseCompressedClassPointers:
             return Klass.decode_klass(md['_compressed_klass'])
         else:
             return md['_klass']
     def field_base(self, offset):
         #return (void*)&((char*)this)[offset]
-        this_charP = self.unwrap().cast(char_tp)
+        this_charP = self.unwrap().cast(T.char_tp)
         arry_elt = this_charP + offset
-        result = arry_elt.cast(void_tp)
+        result = arry_elt.cast(T.void_tp)
         return result
     def metadata_field_addr(self, offset):
-        return self.field_base(offset).cast(Metadata_tpp)
+        return self.field_base(offset).cast(T.Metadata_tpp)
     def metadata_field(self, offset):
         return self.metadata_field_addr(offset).dereference()
     def obj_field_addr(self, offset):
-        return self.field_base(offset).cast(effOopType)
+        return self.field_base(offset).cast(T.effOopType)
     @staticmethod
     def is_null(v):
         return v == 0
@@ -540,16 +1375,31 @@ class oopDescP(GdbValWrapper):
     def decode_heap_oop_not_null(v):
         base = Universe.narrow_oop_base()
         shift = Universe.narrow_oop_shift()
-        #result = (oop)(void*)((uintptr_t)base + ((uintptr_t)v << shift));
-        result = (base.cast(uintptr_t) + (v.cast(uintptr_t) << shift)).cast(void_tp).cast(oopDesc_tp)
+        #result = (oop)(void*)((T.uintptr_t)base + ((T.uintptr_t)v << shift));
+        result = (base.cast(T.uintptr_t) + (v.cast(T.uintptr_t) << shift)).cast(T.void_tp).cast(T.oopDesc_tp)
         return result
     @staticmethod
     def decode_heap_oop(v):
         return NULL if oopDescP.is_null(v) else oopDescP.decode_heap_oop_not_null(v)
+    # decode the narrowOops in the buffer, see decode_narrow
+    @staticmethod
+    def decode_heap_oops(buf):
+        return decode_narrow(buf, as_int(Universe.narrow_oop_base()), as_int(Universe.narrow_oop_shift()))
+    # the oop in the field at offset of the object at obj (ints)
+    @staticmethod
+    def obj_field_raw(obj, offset):
+        return int(oopDescP.load_decode_heap_oops(obj + offset, 1)[0])
+    # read and decode the n oops of the heap at addr, e.g. the elements of
+    # an object array
+    @staticmethod
+    def load_decode_heap_oops(addr, n):
+        if Options.UseCompressedOops:
+            return oopDescP.decode_heap_oops(read_memory(addr, 4*n))
+        return decode_wide(read_memory(addr, T.void_tp.sizeof*n))
     @staticmethod
     def load_decode_heap_oop(p):
         val = p.dereference()
-        if UseCompressedOops: return oopDescP.decode_heap_oop(val)
+        if Options.UseCompressedOops: return oopDescP.decode_heap_oop(val)
         else: return val
     def obj_field(self, offset):
         return oopDescP(oopDescP.load_decode_heap_oop(self.obj_field_addr(offset)))
@@ -566,8 +1416,8 @@ class oopDescP(GdbValWrapper):
 #############################################################################
 
 class java_lang_Class(object):
-    _klass_offset = gdb.parse_and_eval('java_lang_Class::_klass_offset')
-    _class_loader_offset = gdb.parse_and_eval('java_lang_Class::_class_loader_offset')
+    _klass_offset = vm_global('java_lang_Class::_klass_offset')
+    _class_loader_offset = vm_global('java_lang_Class::_class_loader_offset')
     @classmethod
     def class_loader(cls, java_class):
         ll = java_class.obj_field(cls._class_loader_offset)
@@ -577,6 +1427,749 @@ class java_lang_Class(object):
         k = KlassP(java_class.metadata_field(cls._klass_offset))
         return k
 
+#############################################################################
+#
+# java_lang_String, java_lang_Thread
+#
+#############################################################################
+
+class java_lang_String(object):
+    _value_offset = vm_global('java_lang_String::_value_offset')
+    _coder_offset = LazyValue(lambda cls: cls._find_coder_offset())
+    @staticmethod
+    def _find_coder_offset():
+        try:
+            return int(gdb.parse_and_eval('java_lang_String::_coder_offset'))
+        except gdb.error:
+            return None  # jdk 8: the value is a char[]
+    # the Python string of the java.lang.String at the given address
+    @classmethod
+    def as_str(cls, obj):
+        value = oopDescP.obj_field_raw(obj, int(cls._value_offset))
+        if value == 0: return None
+        length_offset = T.void_tp.sizeof + (4 if Options.UseCompressedClassPointers else T.void_tp.sizeof)
+        length = int.from_bytes(read_memory(value + length_offset, 4), target_byteorder(), signed = True)
+        latin1 = False
+        if cls._coder_offset is not None:
+            latin1 = read_memory(obj + cls._coder_offset, 1)[0] == 0
+        base = (length_offset + 4 + 7) & -8
+        if latin1:
+            return read_memory(value + base, length).decode('latin-1')
+        codec = 'utf-16-be' if target_byteorder() == 'big' else 'utf-16-le'
+        return read_memory(value + base, 2*length).decode(codec, 'replace')
+
+class java_lang_Thread(object):
+    _name_offset = vm_global('java_lang_Thread::_name_offset')
+    # the name of the java.lang.Thread at the given address
+    @classmethod
+    def name(cls, obj):
+        name = oopDescP.obj_field_raw(obj, int(cls._name_offset))
+        return None if name == 0 else java_lang_String.as_str(name)
+
+#############################################################################
+#
+# Threads
+#
+#############################################################################
+
+class Threads(object):
+    # addresses of all JavaThreads
+    @staticmethod
+    def addresses():
+        return GdbVM.get().java_thread_addresses()
+
+#############################################################################
+#
+# Java heap walking
+#
+#############################################################################
+
+HeapSpace = hotspot_vm.HeapSpace
+
+# HeapWalker
+#
+# The hotspot_vm.HeapWalker of the inferior. It iterates the objects in
+# the spaces of the java heap of G1, Parallel and Serial GC reading the
+# spaces in big chunks (see hotspot_vm.py).
+#
+# Example: count the instances of java/lang/String
+#
+#    (gdb) py w = HeapWalker(); print(sum(1 for o, k, s in w.objects() if w.klass_info(k)[1] == 'java/lang/String'))
+#
+class HeapWalker(hotspot_vm.HeapWalker):
+    def __init__(self):
+        super(HeapWalker, self).__init__(GdbVM.get())
+
+# hs-heap-histo
+#
+# Class histogram of the java heap like jmap -histo computed with the
+# HeapWalker.
+class hs_heap_histo (gdb.Command):
+    """Class histogram of the java heap. Usage: hs-heap-histo [<N>]"""
+
+    def __init__ (self):
+        super (hs_heap_histo, self).__init__ ("hs-heap-histo", gdb.COMMAND_USER)
+
+    def invoke (self, argument, from_tty):
+        argv = gdb.string_to_argv(argument)
+        try:
+            top = int(argv[0]) if argv else None
+        except ValueError:
+            raise gdb.GdbError("Usage: hs-heap-histo [<N>]")
+        walker = HeapWalker()
+        histo = {}  # Klass* -> [instances, bytes]
+        for addr, klass, size in walker.objects():
+            e = histo.get(klass)
+            if e is None:
+                histo[klass] = [1, size]
+            else:
+                e[0] += 1
+                e[1] += size
+        rows = sorted(histo.items(), key = lambda e: -e[1][1])
+        print(" num     #instances         #bytes  class name")
+        print("----------------------------------------------")
+        for i, (klass, e) in enumerate(rows[:top]):
+            print("%4d: %14d %14d  %s" % (i + 1, e[0], e[1], walker.klass_info(klass)[1]))
+        print("Total %14d %14d" % (sum(e[0] for e in histo.values()), sum(e[1] for e in histo.values())))
+        for space, addr, reason in walker.failures:
+            print("warning: stopped walking %s at 0x%x: %s" % (space, addr, reason))
+
+
+hs_heap_histo ()
+
+# hs-find-refs
+#
+# Scans the reserved region of the java heap for words referencing the
+# given objects. With compressed oops both the narrow and the wide
+# encoding are searched. All targets are searched in one pass. Then the
+# objects containing the references are found with the HeapWalker.
+class hs_find_refs (gdb.Command):
+    """Find references to objects in the java heap. Usage: hs-find-refs <oop> [<oop> ...]"""
+
+    def __init__ (self):
+        super (hs_find_refs, self).__init__ ("hs-find-refs", gdb.COMMAND_USER)
+
+    def invoke (self, argument, from_tty):
+        argv = gdb.string_to_argv(argument)
+        if not argv:
+            raise gdb.GdbError("Usage: hs-find-refs <oop> [<oop> ...]")
+        targets = [as_int(gdb.parse_and_eval(a)) for a in argv]
+        reserved = Universe._heap._reserved
+        start = as_int(reserved._start)
+        end = start + as_int(reserved._word_size) * T.void_tp.sizeof
+        hits = []  # (address, target, encoding)
+        wide = set(targets)
+        for addr, v in find_words(start, end, T.void_tp.sizeof, wide):
+            hits.append((addr, v, 'wide'))
+        narrow = hs_find_refs.narrow_encodings(targets)
+        if narrow:
+            for addr, v in find_words(start, end, 4, narrow):
+                hits.append((addr, narrow[v], 'narrow'))
+        hits.sort()
+        containing = HeapWalker().containing_objects(h[0] for h in hits) if hits else {}
+        for addr, target, encoding in hits:
+            obj = containing[addr]
+            if obj is None:
+                where = "not in a parsable object"
+            else:
+                where = "in " + oopDescP(gdb.Value(obj[0]).cast(T.oopDesc_tp)).extended_str() + " +" + str(addr - obj[0])
+            print("0x%x: %s reference to 0x%x %s" % (addr, encoding, target, where))
+        print("%d references found" % len(hits))
+
+    # narrowOop -> oop for the targets that can be encoded as narrowOop
+    @staticmethod
+    def narrow_encodings(targets):
+        res = {}
+        if not Options.UseCompressedOops: return res
+        base = as_int(Universe.narrow_oop_base())
+        shift = as_int(Universe.narrow_oop_shift())
+        for t in targets:
+            if t == 0: continue  # narrow null is not a reference
+            offset = t - base
+            if offset >= 0 and offset & ((1 << shift) - 1) == 0 and (offset >> shift) < (1 << 32):
+                res[offset >> shift] = t
+        return res
+
+
+hs_find_refs ()
+
+#############################################################################
+#
+# Address classification
+#
+#############################################################################
+
+# A range [start, end) of the address space of the vm
+AddressRegion = namedtuple('AddressRegion', ['start', 'end', 'kind', 'name'])
+
+# AddressMap
+#
+# Index of the address ranges of the java heap, the CodeHeaps, the
+# metaspace, the CDS archive, the stacks of the JavaThreads and the
+# sections of libjvm. It is built once and dropped with the caches. Lookups
+# are done with bisect, so classifying many addresses is cheap. Ranges are
+# assumed to be disjoint, except that a nested range wins over the
+# enclosing one. hs-snapshot load passes the regions of a snapshot.
+class AddressMap(object):
+    _instance = None
+    def __init__(self, regions = None):
+        if regions is None:
+            regions = AddressMap._collect_regions()
+        regions = [r for r in regions if r.end > r.start]
+        regions.sort()
+        self._regions = regions
+        self._starts = [r.start for r in regions]
+        # maximum end of the regions up to each index
+        self._max_ends = []
+        max_end = 0
+        for r in regions:
+            max_end = max(max_end, r.end)
+            self._max_ends.append(max_end)
+    @staticmethod
+    def _collect_regions():
+        regions = []
+        for collect in (AddressMap._heap_regions, AddressMap._code_regions, AddressMap._metaspace_regions,
+                        AddressMap._cds_regions, AddressMap._stack_regions, AddressMap._libjvm_regions):
+            try:
+                regions.extend(collect())
+            except (gdb.error, gdb.MemoryError):
+                # the vm does not have it or it is not yet initialized
+                pass
+        return regions
+    @classmethod
+    def get(cls):
+        if cls._instance is None:
+            cls._instance = AddressMap()
+        return cls._instance
+    # use a map of the given AddressRegions until the caches are cleared,
+    # e.g. the regions of a snapshot
+    @classmethod
+    def install(cls, regions):
+        cls._instance = AddressMap(regions)
+        return cls._instance
+    @classmethod
+    def clear_cache(cls):
+        cls._instance = None
+    def regions(self):
+        return self._regions
+    # the innermost AddressRegion containing addr or None
+    def find(self, addr):
+        i = bisect_right(self._starts, addr) - 1
+        while i >= 0 and self._max_ends[i] > addr:
+            r = self._regions[i]
+            if addr < r.end: return r
+            i -= 1
+        return None
+    # description of what addr points to. A java heap address is decoded
+    # as the start of an object. With interior = True the object containing
+    # it is searched if it is not (see _heap_detail).
+    def describe(self, addr, interior = False):
+        r = self.find(addr)
+        if r is None:
+            return "0x%x NOT FOUND" % addr
+        res = "0x%x in %s" % (addr, r.name)
+        try:
+            detail = self._detail(r, addr, interior)
+        except (gdb.error, gdb.MemoryError, gdb.GdbError):
+            detail = None
+        return res if detail is None else res + ": " + detail
+    def _detail(self, r, addr, interior):
+        if r.kind == 'java heap':
+            return self._heap_detail(addr, interior)
+        if r.kind == 'CodeHeap':
+            blob = CodeCache.find_blob_unsafe(addr)
+            if blob == NULL: return None
+            res = blob.name() + " " + gdbval2str(blob)
+            if blob.is_nmethod():
+                method = blob.as_nmethod().method()
+                if not method.is_null_ptr(): res += " " + method.extended_str()
+            return res + " +" + str(addr - as_int(blob.header_begin()))
+        if r.kind == 'libjvm':
+            return gdb.execute('info symbol 0x%x' % addr, to_string = True).strip()
+        return None
+    # The object at addr. If interior is set and the klass of the header
+    # at addr is not in the metaspace or the CDS archive, addr is taken for
+    # an interior pointer and the object containing it is searched by
+    # walking the G1 region containing addr. Other heaps have no bounded
+    # way to find the start of an object, there the header is decoded.
+    def _heap_detail(self, addr, interior):
+        obj = oopDescP(gdb.Value(addr).cast(T.oopDesc_tp))
+        if not interior or self._is_metadata(oopDescP.klass_at(addr)):
+            return obj.extended_str()
+        try:
+            walker = HeapWalker()
+            space = walker.g1_region_at(addr)
+            if space is None: return obj.extended_str()
+            start = walker.containing_objects([addr], [space])[addr]
+        except (gdb.GdbError, KeyError):
+            # the walker does not support this vm
+            return obj.extended_str()
+        if start is None: return "not in a parsable object"
+        return oopDescP(gdb.Value(start[0]).cast(T.oopDesc_tp)).extended_str() + " +" + str(addr - start[0])
+    # True if p is in the metaspace or in the CDS archive or if their ranges
+    # are unknown
+    def _is_metadata(self, p):
+        if not any(r.kind in ('metaspace', 'CDS') for r in self._regions): return True
+        r = self.find(p)
+        return r is not None and r.kind in ('metaspace', 'CDS')
+    # print the given number of words at addr and classify their values
+    def print_words(self, addr, n):
+        w = T.void_tp.sizeof
+        words = decode_wide(read_memory(addr, n*w))
+        for i in range(n):
+            v = int(words[i])
+            r = self.find(v)
+            print("0x%x: 0x%016x  %s" % (addr + i*w, v, "" if r is None else r.name))
+    @staticmethod
+    def _heap_regions():
+        reserved = Universe._heap._reserved
+        start = as_int(reserved._start)
+        return [AddressRegion(start, start + as_int(reserved._word_size) * T.void_tp.sizeof, 'java heap', 'java heap')]
+    @staticmethod
+    def _code_regions():
+        return [AddressRegion(as_int(h.begin()), as_int(h.end()), 'CodeHeap', "CodeHeap '" + h.name() + "'")
+                for h in CodeCache.heaps()]
+    @staticmethod
+    def _metaspace_regions():
+        res = []
+        # jdk 16 and newer
+        for expr, name in (('metaspace::MetaspaceContext::_nonclass_space_context', 'metaspace'),
+                           ('metaspace::MetaspaceContext::_class_space_context', 'class space')):
+            try:
+                context = gdb.parse_and_eval(expr)
+            except gdb.error:
+                break
+            if as_int(context) == 0: continue
+            node = context.dereference()['_vslist'].dereference()['_first_node']
+            while as_int(node) != 0:
+                node = node.dereference()
+                base = as_int(node['_base'])
+                res.append(AddressRegion(base, base + as_int(node['_word_size']) * T.void_tp.sizeof, 'metaspace', name))
+                node = node['_next']
+        else:
+            return res
+        # older vms
+        for expr, name in (('Metaspace::_space_list', 'metaspace'), ('Metaspace::_class_space_list', 'class space')):
+            vsl = gdb.parse_and_eval(expr)
+            if as_int(vsl) == 0: continue
+            node = vsl.dereference()['_virtual_space_list']
+            while as_int(node) != 0:
+                node = node.dereference()
+                vs = node['_virtual_space']
+                res.append(AddressRegion(as_int(vs['_low_boundary']), as_int(vs['_high_boundary']), 'metaspace', name))
+                node = node['_next']
+        return res
+    @staticmethod
+    def _cds_regions():
+        base = as_int(gdb.parse_and_eval('MetaspaceObj::_shared_metaspace_base'))
+        top = as_int(gdb.parse_and_eval('MetaspaceObj::_shared_metaspace_top'))
+        return [AddressRegion(base, top, 'CDS', 'CDS archive')] if base != 0 else []
+    @staticmethod
+    def _stack_regions():
+        res = []
+        for t in Threads.addresses():
+            raw = RawStruct.read_fields(t, T.JavaThread_t, ('_stack_base', '_stack_size'))
+            base = raw.get('_stack_base')
+            res.append(AddressRegion(base - raw.get('_stack_size'), base, 'stack', 'stack of JavaThread 0x%x' % t))
+        return res
+    _section_re = re.compile(r'\s*(0x[0-9a-f]+) - (0x[0-9a-f]+) is (\S+) in (\S*libjvm\S*)')
+    @staticmethod
+    def _libjvm_regions():
+        res = []
+        for line in gdb.execute('info files', to_string = True).splitlines():
+            m = AddressMap._section_re.match(line)
+            if m:
+                res.append(AddressRegion(int(m.group(1), 16), int(m.group(2), 16), 'libjvm', 'libjvm ' + m.group(3)))
+        return res
+
+register_cache(AddressMap.clear_cache)
+
+#############################################################################
+#
+# Java threads and their stacks
+#
+#############################################################################
+
+# A java frame. A compiled frame yields one JavaFrame per scope, innermost
+# first. kind is 'interpreted' or 'compiled'. method is the address of the
+# Method, bci and line are -1 if unknown. locals and expressions are the
+# words of the local variables (local 0 first) and of the expression stack
+# (top first) of interpreted frames. They are None for compiled frames.
+JavaFrame = namedtuple('JavaFrame', ['kind', 'sp', 'pc', 'method', 'method_str', 'bci', 'line', 'locals', 'expressions'])
+# A JavaThread with its state, os thread id, name and JavaFrames (top first)
+JavaThreadRecord = namedtuple('JavaThreadRecord', ['thread', 'state', 'os_id', 'name', 'frames'])
+
+# A physical frame while walking a stack
+FrameState = namedtuple('FrameState', ['sp', 'unextended_sp', 'fp', 'pc'])
+# The state of an interpreted frame. The expression stack is [tos, stack_end).
+InterpreterState = namedtuple('InterpreterState', ['method', 'bcp', 'locals', 'tos', 'stack_end'])
+
+# LazyValue for a constant of class frame. The default is used if the
+# debug info does not have it.
+def frame_constant(name, default):
+    def compute(cls):
+        try:
+            return int(gdb.parse_and_eval('frame::' + name))
+        except gdb.error:
+            return default
+    return LazyValue(compute)
+
+# FrameLayout
+#
+# Platform dependent part of walking stacks: finding the sender of a frame,
+# the JavaCallWrapper of an entry frame and the state of interpreted
+# frames. Subclasses exist for x86_64 and ppc64.
+class FrameLayout(object):
+    # the layout for the architecture of the inferior
+    @staticmethod
+    def current():
+        try:
+            arch = gdb.selected_inferior().architecture().name()
+        except AttributeError:
+            arch = gdb.newest_frame().architecture().name()
+        if 'x86-64' in arch: return X86_64FrameLayout()
+        if arch.startswith('powerpc') or arch.startswith('rs6000'): return PPC64FrameLayout()
+        raise gdb.GdbError("Walking frames on " + arch + " is not supported")
+    def __init__(self):
+        self.w = T.void_tp.sizeof
+    def word(self, addr):
+        return read_pointers(addr, 1)[0]
+    def signed(self, v):
+        bits = 8 * self.w
+        return v - (1 << bits) if v >> (bits - 1) else v
+    # Newer vms keep some slots of interpreted frames relativized, i.e. as
+    # offset in words to fp. Small values are taken as such offsets.
+    def derelativize(self, fp, v):
+        v = self.signed(v)
+        return fp + v * self.w if -(1 << 20) < v < (1 << 20) else v
+
+# X86_64FrameLayout
+#
+# Offsets of frame slots in words relative to the frame pointer. See
+# frame_x86.hpp.
+class X86_64FrameLayout(FrameLayout):
+    link_offset                          = 0
+    return_addr_offset                   = 1
+    sender_sp_offset                     = 2
+    interpreter_frame_sender_sp_offset   = frame_constant('interpreter_frame_sender_sp_offset', -1)
+    interpreter_frame_last_sp_offset     = frame_constant('interpreter_frame_last_sp_offset', -2)
+    interpreter_frame_method_offset      = frame_constant('interpreter_frame_method_offset', -3)
+    # jdk 9 added the mirror slot, the following ones are 1 less before
+    interpreter_frame_locals_offset      = frame_constant('interpreter_frame_locals_offset', -7)
+    interpreter_frame_bcp_offset         = frame_constant('interpreter_frame_bcp_offset', -8)
+    interpreter_frame_initial_sp_offset  = frame_constant('interpreter_frame_initial_sp_offset', -9)
+    entry_frame_call_wrapper_offset      = frame_constant('entry_frame_call_wrapper_offset', -6)
+    # the newest frame of a gdb thread
+    def registers(self, frame):
+        sp = as_int(frame.read_register('rsp'))
+        return FrameState(sp, sp, as_int(frame.read_register('rbp')), frame.pc())
+    # the frame recorded in a JavaFrameAnchor
+    def anchor_frame(self, sp, fp, pc):
+        if pc == 0: pc = self.word(sp - self.w)
+        return FrameState(sp, sp, fp, pc)
+    def _slot(self, f, offset):
+        return self.word(f.fp + offset * self.w)
+    def interpreted_sender(self, f):
+        return FrameState(f.fp + self.sender_sp_offset * self.w,
+                          self._slot(f, self.interpreter_frame_sender_sp_offset),
+                          self._slot(f, self.link_offset),
+                          self._slot(f, self.return_addr_offset))
+    def compiled_sender(self, f, frame_size):
+        sp = f.unextended_sp + frame_size
+        return FrameState(sp, sp, self.word(sp - self.sender_sp_offset * self.w),
+                          self.word(sp - self.return_addr_offset * self.w))
+    def entry_frame_call_wrapper(self, f):
+        return self._slot(f, self.entry_frame_call_wrapper_offset)
+    def interpreter_state(self, f):
+        last_sp = self._slot(f, self.interpreter_frame_last_sp_offset)
+        return InterpreterState(self._slot(f, self.interpreter_frame_method_offset),
+                                self._slot(f, self.interpreter_frame_bcp_offset),
+                                self.derelativize(f.fp, self._slot(f, self.interpreter_frame_locals_offset)),
+                                f.sp if last_sp == 0 else self.derelativize(f.fp, last_sp),
+                                self.derelativize(f.fp, self._slot(f, self.interpreter_frame_initial_sp_offset)))
+
+# PPC64FrameLayout
+#
+# Every frame starts with an abi frame holding the back chain (the sp of
+# the sender) and the slot where its callee saves the return pc (lr). The
+# frame::ijava_state of an interpreted frame and the frame::entry_frame_locals
+# of an entry frame are located right below the sp of the sender. This is
+# what the istate macros in gdb_utilities.gdb print.
+class PPC64FrameLayout(FrameLayout):
+    abi_lr_offset = 2  # words, see frame::abi_minframe
+    def registers(self, frame):
+        sp = as_int(frame.read_register('r1'))
+        return FrameState(sp, sp, self.word(sp), frame.pc())
+    def anchor_frame(self, sp, fp, pc):
+        if pc == 0: pc = self.word(sp + self.abi_lr_offset * self.w)
+        return FrameState(sp, sp, self.word(sp), pc)
+    def _sender(self, f):
+        return FrameState(f.fp, f.fp, self.word(f.fp), self.word(f.fp + self.abi_lr_offset * self.w))
+    def interpreted_sender(self, f):
+        return self._sender(f)
+    def compiled_sender(self, f, frame_size):
+        return self._sender(f)
+    def _locals_struct(self, f, type_name, names):
+        t = gdb.lookup_type(type_name)
+        return RawStruct.read_fields(f.fp - t.sizeof, t, names)
+    def entry_frame_call_wrapper(self, f):
+        return self._locals_struct(f, 'frame::entry_frame_locals', ('call_wrapper_address',)).get('call_wrapper_address')
+    def interpreter_state(self, f):
+        istate = self._locals_struct(f, 'frame::ijava_state', ('method', 'bcp', 'locals', 'esp', 'monitors'))
+        return InterpreterState(istate.get('method'),
+                                istate.get('bcp'),
+                                self.derelativize(f.fp, istate.get('locals')),
+                                self.derelativize(f.fp, istate.get('esp')) + self.w,  # esp is the first free slot
+                                self.derelativize(f.fp, istate.get('monitors')))
+
+# JavaStackWalker
+#
+# Walks the java frames of JavaThreads. The walk starts at the last java
+# frame recorded in the JavaFrameAnchor of the thread. Threads that were
+# executing java code have no last java frame. For these the registers
+# of the corresponding gdb thread are used. Entry frames are passed using
+# the anchor saved in their JavaCallWrapper. The platform dependent parts
+# are delegated to a FrameLayout.
+#
+# One walker should be used for many threads. It caches the CodeBlobs,
+# nmethods, Methods, their names and line numbers. The PcDescs and scopes
+# of the nmethods are cached globally.
+class JavaStackWalker(object):
+    # expression stacks with more words are taken as broken
+    max_expressions = 1024
+    def __init__(self, max_frames = 4096):
+        self._max_frames = max_frames
+        self._layout = None     # see layout()
+        self._w = T.void_tp.sizeof
+        self._blobs = {}        # blob start -> (kind, frame size in bytes, nmethod or None)
+        self._method_strs = {}  # Method* -> Method.extended_str()
+        self._lines = {}        # (Method*, bci) -> line
+        self._methods = {}      # Method* -> (code base, code size, max locals)
+        self._states = None     # JavaThreadState value -> name
+        self._call_stub_return_address = as_int(gdb.parse_and_eval('StubRoutines::_call_stub_return_address'))
+        self._gdb_frames = None  # os thread id -> FrameState
+    # The FrameLayout of the inferior. It is resolved when the first stack
+    # is walked, so threads can be listed without frames on all platforms.
+    def layout(self):
+        if self._layout is None:
+            self._layout = FrameLayout.current()
+        return self._layout
+    # JavaThreadRecords of all JavaThreads
+    def threads(self, frames = True):
+        for t in Threads.addresses():
+            yield self.thread_record(t, frames)
+    def thread_record(self, thread, frames = True):
+        raw = RawStruct.read(thread, T.JavaThread_t)
+        state = raw.get('_thread_state')
+        os_id = None
+        osthread = raw.get('_osthread')
+        if osthread != 0:
+            os_type = raw.layout().field_type('_osthread').strip_typedefs().target()
+            os_id = RawStruct.read_fields(osthread, os_type, ('_thread_id',)).get('_thread_id')
+        name = None
+        try:
+            thread_obj = raw.get_oop('_threadObj')
+            if thread_obj != 0: name = java_lang_Thread.name(thread_obj)
+        except (gdb.error, gdb.MemoryError):
+            pass
+        java_frames = self.frames(raw, os_id) if frames else []
+        return JavaThreadRecord(thread, self._state_name(raw, state), os_id, name, java_frames)
+    def _state_name(self, raw, state):
+        if self._states is None:
+            enum_type = raw.layout().field_type('_thread_state').strip_typedefs().unqualified()
+            self._states = dict((f.enumval, f.name) for f in enum_type.fields())
+        return self._states.get(state, str(state))
+    # (kind, frame size in bytes, nmethod or None) of the blob containing pc
+    # or None if pc is not in the code cache
+    def _blob(self, pc):
+        heap = CodeCache.heap_for(pc)
+        if heap is None: return None
+        index = heap.index()
+        i = index.find(pc)
+        if i < 0: return None
+        start, end, kind = index.entry(i)
+        res = self._blobs.get(start)
+        if res is None:
+            blob = CodeBlob(gdb.Value(start))
+            nm = blob.as_nmethod() if kind == "nmethod" else None
+            frame_size = blob.getRawField('_frame_size') * self._w
+            res = (kind, frame_size, nm)
+            self._blobs[start] = res
+        return res
+    # the newest frame in the code cache of the gdb thread with the given
+    # os thread id
+    def _gdb_frame(self, os_id):
+        if self._gdb_frames is None:
+            self._gdb_frames = {}
+            selected = gdb.selected_thread()
+            try:
+                for t in gdb.selected_inferior().threads():
+                    t.switch()
+                    frame = gdb.newest_frame()
+                    while frame is not None and CodeCache.heap_for(frame.pc()) is None:
+                        try:
+                            frame = frame.older()
+                        except gdb.error:
+                            frame = None
+                    if frame is not None:
+                        self._gdb_frames[t.ptid[1]] = self.layout().registers(frame)
+            finally:
+                if selected is not None: selected.switch()
+        return self._gdb_frames.get(os_id)
+    # the JavaFrames of the JavaThread read into raw
+    def frames(self, raw, os_id):
+        sp = raw.get('_anchor._last_Java_sp')
+        if sp == 0:
+            f = self._gdb_frame(os_id)
+            if f is None: return []
+        else:
+            f = self.layout().anchor_frame(sp, raw.get('_anchor._last_Java_fp'), raw.get('_anchor._last_Java_pc'))
+        res = []
+        try:
+            self._walk(f, res)
+        except (gdb.error, gdb.MemoryError):
+            pass  # the stack is broken, return the frames found so far
+        return res
+    def _walk(self, f, res):
+        L = self.layout()
+        for _ in range(self._max_frames):
+            blob = self._blob(f.pc)
+            if blob is None: return
+            kind, frame_size, nm = blob
+            if kind == "Interpreter":
+                res.append(self._interpreted_frame(f))
+                f = L.interpreted_sender(f)
+                continue
+            if f.pc == self._call_stub_return_address:
+                # entry frame: continue with the java frames before the call
+                wrapper = L.entry_frame_call_wrapper(f)
+                anchor = RawStruct.read_fields(wrapper, T.JavaCallWrapper_t,
+                                               ('_anchor._last_Java_sp', '_anchor._last_Java_fp', '_anchor._last_Java_pc'))
+                sp = anchor.get('_anchor._last_Java_sp')
+                if sp == 0: return
+                f = L.anchor_frame(sp, anchor.get('_anchor._last_Java_fp'), anchor.get('_anchor._last_Java_pc'))
+                continue
+            if frame_size <= 0: return
+            if nm is not None:
+                self._compiled_frames(nm, f, res)
+            f = L.compiled_sender(f, frame_size)
+    def _method_str(self, method):
+        res = self._method_strs.get(method)
+        if res is None:
+            res = Method(gdb.Value(method).cast(T.Method_tp)).extended_str()
+            self._method_strs[method] = res
+        return res
+    def _line(self, method, bci):
+        if bci < 0: return -1
+        key = (method, bci)
+        res = self._lines.get(key)
+        if res is None:
+            res = LineNumberTable.of(Method(gdb.Value(method).cast(T.Method_tp))).line_number_from_bci(bci)
+            self._lines[key] = res
+        return res
+    # (code base, code size, max locals) of a Method
+    def _method_code(self, method):
+        res = self._methods.get(method)
+        if res is None:
+            const_method = RawStruct.read_fields(method, T.Method_t, ('_constMethod',)).get('_constMethod')
+            cm = RawStruct.read_fields(const_method, T.ConstMethod_t, ('_code_size', '_max_locals'))
+            res = (const_method + T.ConstMethod_t.sizeof, cm.get('_code_size'), cm.get('_max_locals'))
+            self._methods[method] = res
+        return res
+    def _interpreted_frame(self, f):
+        w = self._w
+        istate = self.layout().interpreter_state(f)
+        method = istate.method
+        code_base, code_size, max_locals = self._method_code(method)
+        bci = istate.bcp - code_base
+        if not 0 <= bci < max(code_size, 1): bci = -1  # e.g. native methods
+        # local i is at locals - i*w
+        local_words = []
+        if max_locals > 0:
+            local_words = list(decode_wide(read_memory(istate.locals - (max_locals - 1) * w, max_locals * w)))
+            local_words.reverse()
+        expressions = []
+        n = (istate.stack_end - istate.tos) // w
+        if 0 < n <= JavaStackWalker.max_expressions:
+            expressions = list(decode_wide(read_memory(istate.tos, n * w)))
+        return JavaFrame('interpreted', f.sp, f.pc, method, self._method_str(method), bci, self._line(method, bci),
+                         [int(v) for v in local_words], [int(v) for v in expressions])
+    def _compiled_frames(self, nm, f, res):
+        pcdesc = nm.pc_desc_at(gdb.Value(f.pc))
+        scopes = [] if pcdesc == NULL else nm.inlining_at(pcdesc)
+        if not scopes:
+            method = nm.getRawField('_method')
+            if method == 0: return
+            res.append(JavaFrame('compiled', f.sp, f.pc, method, self._method_str(method), -1, -1, None, None))
+            return
+        for method, bci in scopes:
+            m = method.obj_address()
+            bci = int(bci)
+            res.append(JavaFrame('compiled', f.sp, f.pc, m, self._method_str(m), bci, self._line(m, bci), None, None))
+
+# Generator of JavaThreadRecords of all JavaThreads
+def java_threads(frames = True):
+    return JavaStackWalker().threads(frames)
+
+# hs-threads
+#
+# Lists the JavaThreads with their state, os thread id, name and java
+# frames. All threads are walked with one JavaStackWalker.
+class hs_threads (gdb.Command):
+    """List the JavaThreads and their java frames. Usage: hs-threads [-s]"""
+
+    def __init__ (self):
+        super (hs_threads, self).__init__ ("hs-threads", gdb.COMMAND_USER)
+
+    def invoke (self, argument, from_tty):
+        argv = gdb.string_to_argv(argument)
+        if argv not in ([], ['-s']):
+            raise gdb.GdbError("Usage: hs-threads [-s]")
+        n = 0
+        for t in java_threads(frames = not argv):
+            n += 1
+            print('"%s" (JavaThread *)0x%x os_id=%s %s' % (t.name, t.thread, t.os_id, t.state))
+            for f in t.frames:
+                print("    %s bci:%d line:%d %s" % (f.method_str, f.bci, f.line, f.kind))
+        print("%d JavaThreads" % n)
+
+
+hs_threads ()
+
+# hs-interpreted-frames
+#
+# Decodes the java frames of one JavaThread including the locals and the
+# expression stacks of its interpreted frames. Without argument the
+# JavaThread of the selected gdb thread is decoded.
+class hs_interpreted_frames (gdb.Command):
+    """Decode the interpreted frames of a JavaThread. Usage: hs-interpreted-frames [<JavaThread *>]"""
+
+    def __init__ (self):
+        super (hs_interpreted_frames, self).__init__ ("hs-interpreted-frames", gdb.COMMAND_USER)
+
+    def invoke (self, argument, from_tty):
+        walker = JavaStackWalker()
+        if argument.strip():
+            thread = as_int(gdb.parse_and_eval(argument))
+        else:
+            lwp = gdb.selected_thread().ptid[1]
+            threads = [t.thread for t in walker.threads(frames = False) if t.os_id == lwp]
+            if not threads:
+                raise gdb.GdbError("The selected thread is not a JavaThread")
+            thread = threads[0]
+        t = walker.thread_record(thread)
+        print('"%s" (JavaThread *)0x%x os_id=%s %s' % (t.name, t.thread, t.os_id, t.state))
+        for f in t.frames:
+            print("    %s bci:%d line:%d %s sp:0x%x" % (f.method_str, f.bci, f.line, f.kind, f.sp))
+            if f.kind != 'interpreted': continue
+            for i, v in enumerate(f.locals):
+                print("        local[%d]: 0x%x" % (i, v))
+            for i, v in enumerate(f.expressions):
+                print("        stack[%d]: 0x%x" % (i, v))
+
+
+hs_interpreted_frames ()
+
 #############################################################################
 # ClassLoaderData
 #
@@ -592,34 +2185,40 @@ class java_lang_Class(object):
 
 # Pointer to ClassLoaderData, i.e. ClassLoaderData*
 class ClassLoaderDataP(GdbValWrapper):
-    def __init__(self, val, gdbtype = ClassLoaderData_tp):
+    def __init__(self, val, gdbtype = 'ClassLoaderData_tp'):
         super(ClassLoaderDataP, self).__init__(val, gdbtype, ClassLoaderData)
     def next(self):
         return self.deref().next()
     def extended_str(self):
         cld = self.deref()
-        return str(self) + " anon:" + str(cld._is_anonymous) + " loader: " + cld._class_loader.extended_str()
+        return str(self) + " anon:" + bool2str(cld._is_anonymous) + " loader: " + cld._class_loader.extended_str()
     def print_ext(self):
         print(self.extended_str())
 
 # ClassLoaderData
 class ClassLoaderData(GdbValWrapper):
-    def __init__(self, val, gdbtype = ClassLoaderData_t):
+    def __init__(self, val, gdbtype = 'ClassLoaderData_t'):
         super(ClassLoaderData, self).__init__(val, gdbtype)
-        self._klasses = KlassP(val['_klasses'])
-        self._class_loader = oopDescP(val['_class_loader'])
-        self._is_anonymous = val['_is_anonymous']
+        self._klasses = KlassP(gdb.Value(self.getRawField('_klasses')))
+        self._class_loader = oopDescP(gdb.Value(ClassLoaderData.class_loader_raw(self.raw())))
+        self._is_anonymous = ClassLoaderData.is_anonymous_raw(self.raw())
     def next(self):
-        return ClassLoaderDataP(self.getField('_next'))
+        return ClassLoaderDataP(gdb.Value(self.getRawField('_next')))
     def classes_do(self, f):
         k = self._klasses
         while k != NULL:
             f(k)
             k = k.next_link()
     def extended_str(self):
-        return str(self) + " anon:" + str(self._is_anonymous) + " loader: " + self._class_loader.extended_str()
+        return str(self) + " anon:" + bool2str(self._is_anonymous) + " loader: " + self._class_loader.extended_str()
     def print_ext(self):
         print(self.extended_str())
+    # the class loader oop from the RawStruct of a ClassLoaderData
+    @staticmethod
+    def class_loader_raw(raw):
+        return raw.get_oop('_class_loader')
+    is_unloading_raw = staticmethod(hotspot_vm.HotSpotVM.cld_is_unloading)
+    is_anonymous_raw = staticmethod(hotspot_vm.HotSpotVM.cld_is_anonymous)
 
 #############################################################################
 # ClassLoaderDataGraph
@@ -657,13 +2256,28 @@ class ClassLoaderData(GdbValWrapper):
 
 # Pointer to ClassLoaderDataGraph, i.e. ClassLoaderDataGraph*
 class ClassLoaderDataGraphP(GdbValWrapper):
-    def __init__(self, val, gdbtype = ClassLoaderDataGraph_tp):
+    def __init__(self, val, gdbtype = 'ClassLoaderDataGraph_tp'):
         super(ClassLoaderDataGraphP, self).__init__(val, gdbtype, ClassLoaderDataGraph)
 
+# Records yielded by ClassLoaderDataGraph.iter_clds and iter_klasses.
+# Addresses are ints. The cld of a KlassRecord is the CLDRecord of its
+# ClassLoaderData.
+CLDRecord = hotspot_vm.CLDRecord
+KlassRecord = hotspot_vm.KlassRecord
+
 # ClassLoaderDataGraph
+#
+# Besides the callback based cld_do and classes_do there are the generators
+# iter_clds and iter_klasses. They yield records with prefetched fields.
+# Each object is read with one read_memory call. Optional filters are
+# applied while walking, so that a caller can stop as soon as it has found
+# what it is looking for, e.g.
+#
+#    (gdb) py print(next(ClassLoaderDataGraph.iter_klasses(name_prefix = 'java/lang/Thread'), None))
+#
 class ClassLoaderDataGraph(GdbValWrapper):
-    _head = ClassLoaderDataP(gdb.parse_and_eval('ClassLoaderDataGraph::_head'))
-    _unloading = ClassLoaderDataP(gdb.parse_and_eval('ClassLoaderDataGraph::_unloading'))
+    _head = LazyValue(lambda cls: ClassLoaderDataP(gdb.parse_and_eval('ClassLoaderDataGraph::_head')))
+    _unloading = LazyValue(lambda cls: ClassLoaderDataP(gdb.parse_and_eval('ClassLoaderDataGraph::_unloading')))
     @classmethod
     def cld_do(cls, cl):
         cld = cls._head
@@ -676,9 +2290,44 @@ class ClassLoaderDataGraph(GdbValWrapper):
         while cld != NULL:
             cld.deref().classes_do(f)
             cld = cld.next()
+    # like cld_do for the CLDs being unloaded (only older vms have this list)
+    @classmethod
+    def unloading_cld_do(cls, cl):
+        try:
+            cld = cls._unloading
+        except gdb.error:
+            return
+        while cld != NULL:
+            cl(cld)
+            cld = cld.next()
     @classmethod
     def extended_str(cls):
         raise Exception('TODO')
+    # Yield a CLDRecord for each ClassLoaderData. loader_name selects CLDs
+    # by the name of the class of their loader ('<bootstrap>' for the
+    # boot loader). predicate is called with the record.
+    @classmethod
+    def iter_clds(cls, loader_name = None, predicate = None):
+        return GdbVM.get().iter_clds(loader_name, predicate)
+    # Like iter_clds for the list of CLDs being unloaded. Only older vms
+    # have this list.
+    @classmethod
+    def iter_unloading_clds(cls, loader_name = None, predicate = None):
+        return GdbVM.get().iter_unloading_clds(loader_name, predicate)
+    # Yield a KlassRecord for each Klass of the CLDs selected by
+    # loader_name. name_prefix selects klasses by name. predicate is
+    # called with the record.
+    @classmethod
+    def iter_klasses(cls, name_prefix = None, loader_name = None, predicate = None):
+        return GdbVM.get().iter_klasses(name_prefix, loader_name, predicate)
+    # Yield a KlassRecord for each Klass of the given CLDRecord
+    @staticmethod
+    def iter_cld_klasses(cld):
+        return GdbVM.get().iter_cld_klasses(cld)
+    # number of klasses in the list starting with the given Klass*
+    @staticmethod
+    def klass_count(k):
+        return GdbVM.get().klass_count(k)
 
 class hs_print_all_class_loader_data (gdb.Command):
     """TODO: Documentation for hs-print-all-class-loader-data"""
@@ -692,6 +2341,133 @@ class hs_print_all_class_loader_data (gdb.Command):
 
 hs_print_all_class_loader_data ()
 
+# ClassNameIndex maps class names to the list of (Klass*, ClassLoaderData*)
+# of all loaded classes with that name. It is built with one walk over the
+# ClassLoaderDataGraph when it is first needed and dropped with the other
+# caches when the inferior runs again. hs-snapshot load builds it from the
+# records of a snapshot.
+class ClassNameIndex(object):
+    _instance = None
+    def __init__(self, records = None):
+        if records is None:
+            records = ClassLoaderDataGraph.iter_klasses()
+        self._by_name = {}   # name -> [KlassRecord]
+        for rec in records:
+            if rec.name is None: continue
+            self._by_name.setdefault(rec.name, []).append(rec)
+        self._names = sorted(self._by_name)
+    @classmethod
+    def get(cls):
+        if cls._instance is None:
+            cls._instance = ClassNameIndex()
+        return cls._instance
+    # use an index of the given KlassRecords until the caches are cleared,
+    # e.g. the records of a snapshot
+    @classmethod
+    def install(cls, records):
+        cls._instance = ClassNameIndex(records)
+        return cls._instance
+    @classmethod
+    def clear_cache(cls):
+        cls._instance = None
+    def size(self):
+        return len(self._names)
+    def lookup(self, name):
+        return self._by_name.get(name, [])
+    def lookup_prefix(self, prefix):
+        res = []
+        i = bisect_left(self._names, prefix)
+        while i < len(self._names) and self._names[i].startswith(prefix):
+            res.extend(self._by_name[self._names[i]])
+            i += 1
+        return res
+    def lookup_glob(self, pattern):
+        # the literal part of the pattern narrows the search
+        literal = re.split(r'[*?\[]', pattern, 1)[0]
+        if literal == pattern:
+            return self.lookup(pattern)
+        if pattern == literal + '*':
+            return self.lookup_prefix(literal)
+        regex = re.compile(fnmatch.translate(pattern))
+        res = []
+        i = bisect_left(self._names, literal)
+        while i < len(self._names) and self._names[i].startswith(literal):
+            if regex.match(self._names[i]):
+                res.extend(self._by_name[self._names[i]])
+            i += 1
+        return res
+
+register_cache(ClassNameIndex.clear_cache)
+
+class hs_find_class (gdb.Command):
+    """Find loaded classes by name. Usage: hs-find-class [-p] <name or glob pattern>"""
+
+    def __init__ (self):
+        super (hs_find_class, self).__init__ ("hs-find-class", gdb.COMMAND_USER)
+
+    def invoke (self, argument, from_tty):
+        argv = gdb.string_to_argv(argument)
+        prefix = len(argv) == 2 and argv[0] == '-p'
+        if len(argv) != 1 and not prefix:
+            raise gdb.GdbError("Usage: hs-find-class [-p] <name or glob pattern>")
+        pattern = argv[-1].replace('.', '/')
+        index = ClassNameIndex.get()
+        recs = index.lookup_prefix(pattern) if prefix else index.lookup_glob(pattern)
+        for rec in recs:
+            print("%s (Klass *)0x%x (ClassLoaderData *)0x%x loader: %s%s" %
+                  (rec.name, rec.klass, rec.cld.cld, rec.cld.loader_name, " anon" if rec.cld.is_anonymous else ""))
+        print("%d classes found (%d class names indexed)" % (len(recs), index.size()))
+
+
+hs_find_class ()
+
+# hs-cld-histogram
+#
+# Aggregates the ClassLoaderDataGraph by the class of the loaders in one
+# walk. CLDs on the unloading list of older vms are counted as unloading.
+class hs_cld_histogram (gdb.Command):
+    """Histogram of class loader data by loader class. Usage: hs-cld-histogram [<N>]"""
+
+    def __init__ (self):
+        super (hs_cld_histogram, self).__init__ ("hs-cld-histogram", gdb.COMMAND_USER)
+
+    def invoke (self, argument, from_tty):
+        argv = gdb.string_to_argv(argument)
+        try:
+            top = int(argv[0]) if argv else 20
+        except ValueError:
+            raise gdb.GdbError("Usage: hs-cld-histogram [<N>]")
+        by_loader = {}  # loader name -> [clds, classes, anonymous, unloading]
+        by_cld = []     # (classes, CLDRecord, unloading)
+        def count(cld, unloading):
+            n = ClassLoaderDataGraph.klass_count(cld.klasses)
+            by_cld.append((n, cld, unloading or cld.is_unloading))
+            e = by_loader.setdefault(cld.loader_name, [0, 0, 0, 0])
+            e[0] += 1
+            e[1] += n
+            if cld.is_anonymous: e[2] += 1
+            if unloading or cld.is_unloading: e[3] += 1
+        for cld in ClassLoaderDataGraph.iter_clds():
+            count(cld, False)
+        for cld in ClassLoaderDataGraph.iter_unloading_clds():
+            count(cld, True)
+        print("%8s %8s %8s %8s  %s" % ("CLDs", "classes", "anon", "unload", "loader class"))
+        loaders = sorted(by_loader.items(), key = lambda e: (-e[1][1], -e[1][0]))
+        for name, e in loaders[:top]:
+            print("%8d %8d %8d %8d  %s" % (e[0], e[1], e[2], e[3], name))
+        if len(loaders) > top:
+            print("[%d more loader classes]" % (len(loaders) - top))
+        print("%8d %8d %8d %8d  total" % tuple(sum(e[i] for e in by_loader.values()) for i in range(4)))
+        print("")
+        print("%8s  %s" % ("classes", "ClassLoaderData"))
+        by_cld.sort(key = lambda e: -e[0])
+        for n, cld, unloading in by_cld[:top]:
+            print("%8d  (ClassLoaderData *)0x%x loader: %s%s%s" %
+                  (n, cld.cld, cld.loader_name, " anon" if cld.is_anonymous else "", " unloading" if unloading else ""))
+
+
+hs_cld_histogram ()
+
 
 #############################################################################
 #############################################################################
@@ -700,25 +2476,164 @@ hs_print_all_class_loader_data ()
 #############################################################################
 
 class MetaspaceObj(GdbValWrapper):
-    def __init__(self, val, gdbtype = MetaspaceObj_tp):
+    def __init__(self, val, gdbtype = 'MetaspaceObj_tp'):
         super(MetaspaceObj, self).__init__(val, gdbtype)
 
 class Metadata(MetaspaceObj):
-    def __init__(self, val, gdbtype = Metadata_tp):
+    def __init__(self, val, gdbtype = 'Metadata_tp'):
         super(Metadata, self).__init__(val, gdbtype)
 
+#############################################################################
+# Metaspace usage
+#############################################################################
+
+# Metaspace usage of a ClassLoaderData in bytes
+MetaspaceUsage = namedtuple('MetaspaceUsage', ['used', 'committed', 'reserved', 'chunks'])
+
+# ClassLoaderMetaspace
+#
+# Computes the MetaspaceUsage of a ClassLoaderData. The types are taken
+# from the fields, so the different layouts are handled:
+#
+#  - jdk 8:   Metaspace with SpaceManagers _vsm and _class_vsm counting
+#             _allocated_blocks_words and _allocated_chunks_words
+#  - jdk 11:  ClassLoaderMetaspace with SpaceManagers counting _used_words
+#             and _capacity_words
+#  - jdk 16+: ClassLoaderMetaspace with MetaspaceArenas. Their chunk lists
+#             are walked. The size of a chunk is given by its _level.
+#
+# With SpaceManagers committed and reserved are both the capacity of the
+# chunks.
+class ClassLoaderMetaspace(object):
+    max_chunk_word_size = LazyValue(lambda cls: cls._max_chunk_word_size())
+    @staticmethod
+    def _max_chunk_word_size():
+        try:
+            return int(gdb.parse_and_eval('metaspace::chunklevel::MAX_CHUNK_WORD_SIZE'))
+        except gdb.error:
+            return 4*1024*1024 // T.void_tp.sizeof
+    # usage of the ClassLoaderData at the given address or None if it
+    # has no metaspace yet
+    @staticmethod
+    def usage_at(cld):
+        raw = RawStruct.read_fields(cld, T.ClassLoaderData_t, ('_metaspace',))
+        ms = raw.get('_metaspace')
+        if ms == 0: return None
+        ms_raw = RawStruct.read(ms, ClassLoaderMetaspace._target_type(raw, '_metaspace'))
+        usage = [0, 0, 0, 0]
+        for name in ('_vsm', '_class_vsm', '_non_class_space_arena', '_class_space_arena'):
+            if not ms_raw.has(name) or ms_raw.get(name) == 0: continue
+            part_raw = RawStruct.read(ms_raw.get(name), ClassLoaderMetaspace._target_type(ms_raw, name))
+            if name.endswith('_vsm'):
+                part = ClassLoaderMetaspace._space_manager_usage(part_raw)
+            else:
+                part = ClassLoaderMetaspace._arena_usage(part_raw)
+            for i in range(4): usage[i] += part[i]
+        return MetaspaceUsage(*usage)
+    @staticmethod
+    def _target_type(raw, name):
+        return raw.layout().field_type(name).strip_typedefs().target()
+    # RawStructs with the given fields of the chunks in the list starting
+    # at the pointer field name of raw
+    @staticmethod
+    def _chunks(raw, name, fields):
+        chunk_type = ClassLoaderMetaspace._target_type(raw, name)
+        fields = fields + ('_next',)
+        c = raw.get(name)
+        while c != 0:
+            chunk = RawStruct.read_fields(c, chunk_type, fields)
+            yield chunk
+            c = chunk.get('_next')
+    @staticmethod
+    def _space_manager_usage(raw):
+        w = T.void_tp.sizeof
+        if raw.has('_used_words'):
+            # jdk 11
+            capacity = raw.get('_capacity_words')
+            chunks = sum(1 for c in ClassLoaderMetaspace._chunks(raw, '_chunk_list', ()))
+            return (raw.get('_used_words')*w, capacity*w, capacity*w, chunks)
+        # jdk 8
+        capacity = raw.get('_allocated_chunks_words')
+        return (raw.get('_allocated_blocks_words')*w, capacity*w, capacity*w, raw.get('_allocated_chunks_count'))
+    @staticmethod
+    def _arena_usage(raw):
+        w = T.void_tp.sizeof
+        used = committed = reserved = chunks = 0
+        for c in ClassLoaderMetaspace._chunks(raw, '_chunks._first', ('_level', '_used_words', '_committed_words')):
+            used += c.get('_used_words')
+            committed += c.get('_committed_words')
+            reserved += ClassLoaderMetaspace.max_chunk_word_size >> c.get('_level')
+            chunks += 1
+        return (used*w, committed*w, reserved*w, chunks)
+
+# hs-metaspace-by-loader
+#
+# Metaspace usage of all class loader data including the ones on the
+# unloading list. Aggregated by loader class and sorted by committed size.
+class hs_metaspace_by_loader (gdb.Command):
+    """Metaspace usage by class loader. Usage: hs-metaspace-by-loader [<N>]"""
+
+    def __init__ (self):
+        super (hs_metaspace_by_loader, self).__init__ ("hs-metaspace-by-loader", gdb.COMMAND_USER)
+
+    def invoke (self, argument, from_tty):
+        argv = gdb.string_to_argv(argument)
+        try:
+            top = int(argv[0]) if argv else 20
+        except ValueError:
+            raise gdb.GdbError("Usage: hs-metaspace-by-loader [<N>]")
+        by_loader = {}  # loader name -> [clds, used, committed, reserved, chunks]
+        by_cld = []     # (MetaspaceUsage, CLDRecord, unloading)
+        def account(cld, unloading):
+            usage = ClassLoaderMetaspace.usage_at(cld.cld) or MetaspaceUsage(0, 0, 0, 0)
+            by_cld.append((usage, cld, unloading or cld.is_unloading))
+            e = by_loader.setdefault(cld.loader_name, [0, 0, 0, 0, 0])
+            e[0] += 1
+            for i in range(4): e[i + 1] += usage[i]
+        for cld in ClassLoaderDataGraph.iter_clds():
+            account(cld, False)
+        for cld in ClassLoaderDataGraph.iter_unloading_clds():
+            account(cld, True)
+        K = 1024
+        print("%8s %10s %10s %10s %8s  %s" % ("CLDs", "used K", "committed K", "reserved K", "chunks", "loader class"))
+        loaders = sorted(by_loader.items(), key = lambda e: -e[1][2])
+        for name, e in loaders[:top]:
+            print("%8d %10d %10d %10d %8d  %s" % (e[0], e[1]//K, e[2]//K, e[3]//K, e[4], name))
+        if len(loaders) > top:
+            print("[%d more loader classes]" % (len(loaders) - top))
+        total = [sum(e[i] for e in by_loader.values()) for i in range(5)]
+        print("%8d %10d %10d %10d %8d  total" % (total[0], total[1]//K, total[2]//K, total[3]//K, total[4]))
+        print("")
+        print("%10s %10s  %s" % ("used K", "committed K", "ClassLoaderData"))
+        by_cld.sort(key = lambda e: -e[0].committed)
+        for usage, cld, unloading in by_cld[:top]:
+            print("%10d %10d  (ClassLoaderData *)0x%x loader: %s%s%s" %
+                  (usage.used//K, usage.committed//K, cld.cld, cld.loader_name,
+                   " anon" if cld.is_anonymous else "", " unloading" if unloading else ""))
+
+
+hs_metaspace_by_loader ()
+
 #############################################################################
 # Symbol
 #############################################################################
 
 # Symbol
+#
+# The strings of symbols are cached by address. Symbols are immutable, so
+# each one needs to be read and decoded just once. Klass, Method and hspp
+# all get their names through Symbol.extended_str().
 class Symbol(MetaspaceObj):
-    def __init__(self, val, gdbtype = Symbol_tp):
+    def __init__(self, val, gdbtype = 'Symbol_tp'):
         super(Symbol, self).__init__(val, gdbtype)
     def length(self):
         return self.getField('_length_and_refcount') >> 16
     def extended_str(self):
-        return self.getField('_body').address.cast(char_tp).string('utf-8', 'ignore', self.length().__int__())
+        return Symbol.as_str(int(self.unwrap()))
+    # the string of the Symbol at addr, cached until the caches are cleared
+    @staticmethod
+    def as_str(addr):
+        return GdbVM.get().symbol_str(addr)
 
 
 #############################################################################
@@ -726,7 +2641,7 @@ class Symbol(MetaspaceObj):
 #############################################################################
 
 class ConstantPool(Metadata):
-    def __init__(self, cpoop, gdbtype = ConstantPool_tp):
+    def __init__(self, cpoop, gdbtype = 'ConstantPool_tp'):
         super(ConstantPool, self).__init__(cpoop, gdbtype)
     def pool_holder(self):
         return KlassP(self.getField('_pool_holder'))
@@ -739,10 +2654,10 @@ class ConstMethod(Metadata):
     _has_linenumber_table = 1
     _has_checked_exceptions = 2
     _has_localvariable_table = 4
-    def __init__(self, val, gdbtype = ConstMethod_tp):
+    def __init__(self, val, gdbtype = 'ConstMethod_tp'):
         super(ConstMethod, self).__init__(val, gdbtype)
         self._constants = ConstantPool(self.getField('_constants'))
-    def code_base(self): return (self+1).unwrap().cast(address_t)
+    def code_base(self): return (self+1).unwrap().cast(T.address_t)
     def code_end(self): return self.code_base() + self.code_size()
     def code_size(self): return self.getField('_code_size')
     def has_linenumber_table(self):
@@ -752,13 +2667,20 @@ class ConstMethod(Metadata):
         assert self.has_linenumber_table(), "called only if table is present"
         res = self.code_end()
         return res
+    # The bytes from the line number table to the end of the ConstMethod
+    # read with one read_memory call.
+    def compressed_linenumber_table_bytes(self):
+        assert self.has_linenumber_table(), "called only if table is present"
+        start = as_int(self.code_end())
+        end = self.obj_address() + self.getRawField('_constMethod_size') * T.void_tp.sizeof
+        return read_memory(start, end - start)
 
 #############################################################################
 # Method
 #############################################################################
 
 class Method(Metadata):
-    def __init__(self, val, gdbtype = Method_tp):
+    def __init__(self, val, gdbtype = 'Method_tp'):
         super(Method, self).__init__(val, gdbtype)
         self._constMethod = ConstMethod(self.getField('_constMethod'))
     def constMethod(self): return self._constMethod
@@ -768,29 +2690,13 @@ class Method(Metadata):
     def compressed_linenumber_table(self): return self.constMethod().compressed_linenumber_table()
     def line_number_from_bci(self, bci):
         assert bci == 0 or (0 <= bci and bci < self.code_size()), "illegal bci"
-        best_bci  =  0
-        best_line = -1
-
-        if (self.has_linenumber_table()):
-          # The line numbers are a short array of 2-tuples [start_pc, line_number].
-          # Not necessarily sorted and not necessarily one-to-one.
-            stream = CompressedLineNumberReadStream(self.compressed_linenumber_table())
-            while (stream.read_pair()):
-                if (stream.bci() == bci):
-                    # perfect match
-                    return stream.line()
-                else:
-                    # update best_bci/line
-                    if (stream.bci() < bci and stream.bci() >= best_bci):
-                        best_bci  = stream.bci()
-                        best_line = stream.line()
-        return best_line
+        return LineNumberTable.of(self).line_number_from_bci(int(bci))
 
     def extended_str(self):
         res = self.__str__() + ':'
 
-        cpool_base = (self.constants().unwrap().cast(char_tp)
-                      + ConstantPool_t.sizeof).cast(intptr_tp)
+        cpool_base = (self.constants().unwrap().cast(T.char_tp)
+                      + T.ConstantPool_t.sizeof).cast(T.intptr_tp)
 
         # print holder klass
         cnsts = self.constants()
@@ -800,22 +2706,64 @@ class Method(Metadata):
         # print the name
         sig_idx = self._constMethod.getField('_name_index')
         addr_in_cpool = ((cpool_base)[sig_idx]).address
-        nameSym = Symbol(addr_in_cpool.cast(Symbol_tpp).dereference())
+        nameSym = Symbol(addr_in_cpool.cast(T.Symbol_tpp).dereference())
         res += nameSym.extended_str()
 
         # print the signature
         sig_idx = self._constMethod.getField('_signature_index')
         addr_in_cpool = ((cpool_base)[sig_idx]).address
-        sigSym = Symbol(addr_in_cpool.cast(Symbol_tpp).dereference())
+        sigSym = Symbol(addr_in_cpool.cast(T.Symbol_tpp).dereference())
         res += sigSym.extended_str()
         return res
 
+#############################################################################
+# LineNumberTable
+#
+# The compressed line number table of a Method decoded once into arrays
+# sorted by bci. Decoded tables are cached by Method address.
+#############################################################################
+
+class LineNumberTable(object):
+    _cache = LRUCache(4096, 'LineNumberTable')
+    def __init__(self, method):
+        first_lines = {}  # bci -> line of the first pair with that bci
+        last_lines  = {}  # bci -> line of the last pair with that bci
+        if (method.has_linenumber_table()):
+            # The line numbers are a short array of 2-tuples [start_pc, line_number].
+            # Not necessarily sorted and not necessarily one-to-one.
+            stream = CompressedLineNumberReadStream(method.constMethod().compressed_linenumber_table_bytes())
+            while (stream.read_pair()):
+                first_lines.setdefault(stream.bci(), stream.line())
+                last_lines[stream.bci()] = stream.line()
+        self._bcis = array('i', sorted(first_lines))
+        self._first_lines = array('i', [first_lines[bci] for bci in self._bcis])
+        self._last_lines  = array('i', [last_lines[bci] for bci in self._bcis])
+    @classmethod
+    def of(cls, method):
+        key = method.obj_address()
+        res = cls._cache.get(key)
+        if res is None:
+            res = LineNumberTable(method)
+            cls._cache.put(key, res)
+        return res
+    # Same result as the linear search in Method::line_number_from_bci():
+    # the line of the first pair matching bci or else of the last pair with
+    # the greatest bci below it.
+    def line_number_from_bci(self, bci):
+        i = bisect_left(self._bcis, bci)
+        if i < len(self._bcis) and self._bcis[i] == bci:
+            # perfect match
+            return self._first_lines[i]
+        if i > 0:
+            return self._last_lines[i-1]
+        return -1
+
 #############################################################################
 # compiledVFrame
 #############################################################################
 
 class compiledVFrame(GdbValWrapper):
-    def __init__(self, val, gdbtype = compiledVFrame_tp):
+    def __init__(self, val, gdbtype = 'compiledVFrame_tp'):
         super(compiledVFrame, self).__init__(val, gdbtype)
 
     def extended_str(self):
@@ -829,6 +2777,24 @@ class compiledVFrame(GdbValWrapper):
         res += m.extended_str()
         return res
 
+#############################################################################
+#
+# GrowableArray: wraps a pointer to a GrowableArray in the hotspot debuggee
+#
+#############################################################################
+
+class GrowableArray(GdbValWrapper):
+    # GrowableArray is a template, so the type of the value is used
+    def __init__(self, val, gdbtype = None):
+        super(GrowableArray, self).__init__(val, val.type if gdbtype is None else gdbtype)
+    def length(self):
+        return self.getRawField('_len')
+    def data(self):
+        return self.getRawField('_data')
+    # the elements of an array of pointers as ints
+    def pointers(self):
+        return read_pointers(self.data(), self.length())
+
 #############################################################################
 #
 # _GrowableArray provides similar functionality as GrowableArray.
@@ -890,21 +2856,33 @@ class VirtualSpace(object):
     def high(self): return self._high
 
 class HeapBlock(GdbValWrapper):
-    def __init__(self, block, gdbtype = HeapBlock_tp):
+    def __init__(self, block, gdbtype = 'HeapBlock_tp'):
         super(HeapBlock, self).__init__(block, gdbtype)
     def free(self):
-        res = not (self.getField('_header')['_used'])
+        res = self.getRawField('_header._used') == 0
         return res
     def allocated_space(self):
-        res = (self + 1).unwrap().cast(void_tp)
+        res = (self + 1).unwrap().cast(T.void_tp)
         return res
 
 class CodeHeap(GdbValWrapper):
-    def __init__(self, heap, gdbtype = CodeHeap_tp):
+    def __init__(self, heap, gdbtype = 'CodeHeap_tp'):
         super(CodeHeap, self).__init__(heap, gdbtype)
+        heap = self.unwrap()
         self._memory   = VirtualSpace(heap['_memory']['_low'], heap['_memory']['_high'])
         self._segmap   = VirtualSpace(heap['_segmap']['_low'], heap['_segmap']['_high'])
         self._log2_segment_size = heap['_log2_segment_size']
+        self._index = None
+    def name(self):
+        return GdbVM.get().code_heap_name(as_int(self.unwrap()))
+    def index(self):
+        if self._index is None:
+            self._index = self.build_index()
+        return self._index
+    # use the given CodeBlobIndex instead of building one, e.g. the index
+    # restored from a snapshot
+    def install_index(self, index):
+        self._index = index
     def begin(self):
         res = self._memory.low()
         return res
@@ -915,22 +2893,25 @@ class CodeHeap(GdbValWrapper):
         res = self.begin() <= p and p < self.end()
         return res
     def segment_for(self, p):
-        res = ((p.cast(char_tp) - self._memory.low()) >> self._log2_segment_size).cast(size_t)
+        res = ((p.cast(T.char_tp) - self._memory.low()) >> self._log2_segment_size).cast(T.size_t)
         return res
     def block_at(self, i):
-        res = (self._memory.low() + (i << self._log2_segment_size)).cast(HeapBlock_tp)
+        res = (self._memory.low() + (i << self._log2_segment_size)).cast(T.HeapBlock_tp)
         return HeapBlock(res)
     def find_start(self, p):
         if not self.contains(p):
             return 0
 
-        i = self.segment_for(p)
+        i = as_int(self.segment_for(p))
 
-        b = self._segmap.low().cast(address_t)
-        if b[i] == 0xFF:
+        # the segment map is read through the page cache
+        segmap = as_int(self._segmap.low())
+        b = read_memory(segmap + i, 1)[0]
+        if b == 0xFF:
             return NULL
-        while b[i] > 0:
-            i -= b[i].cast(int_t)
+        while b > 0:
+            i -= b
+            b = read_memory(segmap + i, 1)[0]
 
         h = self.block_at(i)
 
@@ -938,17 +2919,58 @@ class CodeHeap(GdbValWrapper):
             return NULL
 
         return h.allocated_space()
+    def number_of_segments(self):
+        if self.raw().has('_next_segment'):
+            # segments beyond _next_segment have never been allocated
+            return self.getRawField('_next_segment')
+        return as_int(self.end() - self.begin()) >> self._log2_segment_size
+    # Walk all HeapBlocks once and index the CodeBlobs in the used ones
+    # (see hotspot_vm.HotSpotVM.code_heap_blobs).
+    def build_index(self):
+        return CodeBlobIndex(GdbVM.get().code_heap_blobs(as_int(self.unwrap())))
+
+# CodeBlobIndex: address sorted CodeBlobs of a CodeHeap for lookups by bisect
+class CodeBlobIndex(object):
+    def __init__(self, entries):
+        entries.sort()
+        self._starts = [e[0] for e in entries]
+        self._ends   = [e[1] for e in entries]
+        self._kinds  = [e[2] for e in entries]
+    # index from sorted columns, e.g. the memoryviews of a snapshot
+    @classmethod
+    def from_columns(cls, starts, ends, kinds):
+        res = cls.__new__(cls)
+        res._starts = starts
+        res._ends   = ends
+        res._kinds  = kinds
+        return res
+    def length(self): return len(self._starts)
+    def entry(self, i): return (self._starts[i], self._ends[i], self._kinds[i])
+    def entries(self): return zip(self._starts, self._ends, self._kinds)
+    # return the index of the blob containing pc or -1
+    def find(self, pc):
+        i = bisect_right(self._starts, pc) - 1
+        if i >= 0 and pc < self._ends[i]:
+            return i
+        return -1
+    # return the address of the blob containing pc or None
+    def find_blob(self, pc):
+        i = self.find(pc)
+        return None if i < 0 else self._starts[i]
+    def nmethods(self):
+        return [start for start, end, kind in self.entries() if kind == "nmethod"]
 
 class CodeBlob(GdbValWrapper):
-    def __init__(self, blob, gdbtype = CodeBlob_tp):
+    def __init__(self, blob, gdbtype = 'CodeBlob_tp'):
         super(CodeBlob, self).__init__(blob, gdbtype)
-        self._size                    = self.getField('_size')
-        self._instructions_offset     = self.getField('_instructions_offset')
+        if self.is_null_ptr(): return
+        self._size                    = self.getRawField('_size')
+        self._instructions_offset     = self.getRawField('_instructions_offset')
     def header_begin(self):
-        res = self.unwrap().cast(address_t)
+        res = self.unwrap().cast(T.address_t)
         return res
     def data_end(self):
-        res = (self.header_begin() + self._size).cast(address_t)
+        res = (self.header_begin() + self._size).cast(T.address_t)
         return res
     def instructions_begin(self):
         res = self.header_begin() + self._instructions_offset
@@ -957,7 +2979,7 @@ class CodeBlob(GdbValWrapper):
         res = self.header_begin() <= addr and addr < self.data_end()
         return res
     def oop_at(self, index):
-        index = index.cast(int_t)
+        index = int(index)
         if index == 0: return NULL
         return self.oop_addr_at(index).dereference()
     def oop_addr_at(self, index):
@@ -965,23 +2987,58 @@ class CodeBlob(GdbValWrapper):
         oopat_idx = begin[index-1]
         res = oopat_idx.address
         return res
+    def name(self):
+        return CodeBlob.name_at(self.getRawField('_name'))
+    # the name at the given address (names are static strings)
+    @staticmethod
+    def name_at(name_addr):
+        return GdbVM.get().c_string(name_addr)
     def is_nmethod(self):
-        return self.getField('_name').string() == "nmethod"
+        return self.name() == "nmethod"
     def as_nmethod(self):
         assert self.is_nmethod(), gdbval2str(self) + " is not a nmethod"
         return nmethod(self.unwrap())
 
+# CodeCache
+#
+# Newer vms have a segmented code cache with separate CodeHeaps for
+# non-nmethods, profiled and non-profiled nmethods in CodeCache::_heaps.
+# Older vms have just CodeCache::_heap. The blobs of each CodeHeap are
+# indexed when the first lookup in that heap is done. A lookup is
+# dispatched to the heap containing the pc by a range check. The heaps and
+# their indexes are dropped with the other caches when the inferior resumes.
 class CodeCache(object):
-    @staticmethod
-    def find_blob_unsafe(start):
-        heapAsGdbVal = gdb.parse_and_eval("CodeCache::_heap")
-        _heap = CodeHeap(heapAsGdbVal)
-        result = CodeBlob(_heap.find_start(start))
-
-        if result != NULL and not result.blob_contains(start.cast(address_t)):
-            result = NULL
+    _heaps = None
+    _heap_begins = None
+    @classmethod
+    def heaps(cls):
+        if cls._heaps is None:
+            heaps = [CodeHeap(gdb.Value(h)) for h in GdbVM.get().code_heaps()]
+            heaps.sort(key = lambda h: as_int(h.begin()))
+            cls._heaps = heaps
+            cls._heap_begins = [as_int(h.begin()) for h in heaps]
+        return cls._heaps
+    @classmethod
+    def heap_for(cls, pc):
+        heaps = cls.heaps()
+        i = bisect_right(cls._heap_begins, pc) - 1
+        if i >= 0 and pc < as_int(heaps[i].end()):
+            return heaps[i]
+        return None
+    @classmethod
+    def clear_cache(cls):
+        cls._heaps = None
+        cls._heap_begins = None
+    @classmethod
+    def find_blob_unsafe(cls, start):
+        pc = as_int(start)
+        heap = cls.heap_for(pc)
+        blob = None if heap is None else heap.index().find_blob(pc)
+        if blob is None:
+            return NULL
+        return CodeBlob(gdb.Value(blob))
 
-        return result
+register_cache(CodeCache.clear_cache)
 
 #############################################################################
 #
@@ -994,7 +3051,7 @@ class NM_print_inlining_at (gdb.Function):
     def __init__(self):
         super (NM_print_inlining_at, self).__init__("NM_print_inlining_at")
     def invoke (self, pc):
-        pc = pc.cast(address_t)
+        pc = pc.cast(T.address_t)
         blob = CodeCache.find_blob_unsafe(pc)
         if blob == NULL or not blob.is_nmethod(): return NULL
         nm = blob.as_nmethod()
@@ -1007,30 +3064,169 @@ class NM_print_inlining_at (gdb.Function):
             print("No approximate pcdesc found for " + gdbval2str(pc))
             return NULL
 
-        # ported from java_lang_Throwable::fill_in_stack_trace(Handle throwable, TRAPS)
-        decode_offset = pcdesc.scope_decode_offset()
-        while (decode_offset != 0):
-            stream = DebugInfoReadStream(nm, decode_offset)
-            decode_offset = stream.read_int()
-            method = Method(nm.oop_at(stream.read_int()))
-            bci = stream.read_bci()
+        for method, bci in nm.inlining_at(pcdesc):
             line = method.line_number_from_bci(bci)
-            gdb.write(method.extended_str() + ":bci"+str(bci) + "/L" + str(line))
-            print
+            gdb.write(method.extended_str() + ":bci"+str(bci) + "/L" + str(line) + "\n")
 
         return gdb.Value(0) # success
 
 NM_print_inlining_at()
 
+# ---------------------------------------------------------------------
+# hs-symbolize-pcs: print the inlining at many pcs in one pass
+# ---------------------------------------------------------------------
+#
+# Example:
+#
+#    (gdb) hs-symbolize-pcs -o symbolized.txt perf_pcs.txt
+#
+# The pcs are read from the given file. Every token starting with 0x is
+# taken as pc. Lines without such a token are taken as pc if their first
+# token is a hex number (like in the output of 'perf script'). Without a
+# file the pcs of all frames of all threads are symbolized.
+#
+# The pcs are deduplicated and grouped by nmethod. Names of Methods and
+# line numbers are computed once per run. Results are written to the
+# output file (default: the gdb console) as they are produced.
+#
+class hs_symbolize_pcs (gdb.Command):
+    """Symbolize many pcs in one pass. Usage: hs-symbolize-pcs [-o <output file>] [<file with pcs>]"""
+
+    def __init__ (self):
+        super (hs_symbolize_pcs, self).__init__ ("hs-symbolize-pcs", gdb.COMMAND_USER)
+
+    def invoke (self, argument, from_tty):
+        argv = gdb.string_to_argv(argument)
+        out_name = None
+        if len(argv) >= 2 and argv[0] == '-o':
+            out_name = argv[1]
+            argv = argv[2:]
+        if len(argv) > 1:
+            raise gdb.GdbError("Usage: hs-symbolize-pcs [-o <output file>] [<file with pcs>]")
+        pcs = hs_symbolize_pcs.read_pcs(argv[0]) if argv else hs_symbolize_pcs.thread_pcs()
+        out = open(out_name, 'w') if out_name else None
+        try:
+            PcSymbolizer(out).symbolize(pcs)
+        finally:
+            if out: out.close()
+
+    _hex_re = re.compile(r'0x[0-9a-fA-F]+')
+
+    @staticmethod
+    def read_pcs(file_name):
+        pcs = set()
+        with open(file_name) as f:
+            for line in f:
+                if line.startswith('#'): continue
+                tokens = hs_symbolize_pcs._hex_re.findall(line)
+                if tokens:
+                    pcs.update(int(t, 16) for t in tokens)
+                else:
+                    tokens = line.split()
+                    try:
+                        if tokens: pcs.add(int(tokens[0], 16))
+                    except ValueError:
+                        pass
+        return pcs
+
+    # pcs of all frames gdb can unwind in all threads
+    @staticmethod
+    def thread_pcs():
+        pcs = set()
+        selected_thread = gdb.selected_thread()
+        try:
+            for thread in gdb.selected_inferior().threads():
+                thread.switch()
+                frame = gdb.newest_frame()
+                while frame is not None:
+                    pcs.add(frame.pc())
+                    try:
+                        frame = frame.older()
+                    except gdb.error:
+                        break
+        finally:
+            if selected_thread is not None: selected_thread.switch()
+        return pcs
+
+hs_symbolize_pcs ()
+
+# PcSymbolizer resolves pcs grouped by nmethod. Method names and line
+# numbers are computed once and reused for all pcs.
+class PcSymbolizer(object):
+    def __init__(self, out = None):
+        self._out = out
+        self._method_strs = {}  # Method address -> Method.extended_str()
+        self._lines = {}        # (Method address, bci) -> line number
+    def write(self, s):
+        if self._out: self._out.write(s)
+        else: gdb.write(s)
+    def method_str(self, method):
+        key = method.obj_address()
+        res = self._method_strs.get(key)
+        if res is None:
+            res = method.extended_str()
+            self._method_strs[key] = res
+        return res
+    # the line of bci in method or -1 for the negative bcis of method
+    # entries (see JavaValue.InvocationEntryBci)
+    def line(self, method, bci):
+        if bci < 0: return -1
+        key = (method.obj_address(), bci)
+        res = self._lines.get(key)
+        if res is None:
+            res = method.line_number_from_bci(bci)
+            self._lines[key] = res
+        return res
+    def symbolize(self, pcs):
+        blobs = {}  # blob address or None -> pcs
+        for pc in sorted(set(pcs)):
+            heap = CodeCache.heap_for(pc)
+            blob = None if heap is None else heap.index().find_blob(pc)
+            blobs.setdefault(blob, []).append(pc)
+        for pc in blobs.pop(None, []):
+            self.write(hex(pc) + ": not in CodeCache\n")
+        for blob_addr, blob_pcs in blobs.items():
+            blob = CodeBlob(gdb.Value(blob_addr))
+            if not blob.is_nmethod():
+                for pc in blob_pcs:
+                    self.write(hex(pc) + ": " + blob.name() + " " + str(blob) + "\n")
+                continue
+            nm = blob.as_nmethod()
+            for pc in blob_pcs:
+                self.symbolize_nmethod_pc(nm, pc)
+            if self._out: self._out.flush()
+    def symbolize_nmethod_pc(self, nm, pc):
+        self.write(hex(pc) + ": " + str(nm) + "\n")
+        pcdesc = nm.pc_desc_at(gdb.Value(pc))
+        if pcdesc == NULL:
+            self.write("    no pcdesc found\n")
+            return
+        for method, bci in nm.inlining_at(pcdesc):
+            self.write("    " + self.method_str(method) + ":bci" + str(bci) + "/L" + str(self.line(method, bci)) + "\n")
+
+# The buffer of a compressed stream is either a gdb.Value pointing into
+# the inferior or a bytes object that was read from the inferior in one go.
+# With a bytes buffer the values are decoded with plain int arithmetic
+# which is orders of magnitude faster than reading and decoding byte by
+# byte through gdb.Value objects.
 class CompressedStream(object):
     BitsPerByte = 8
     lg_H = gdb.Value(6)
     H = 1<<lg_H
     L = (1<<BitsPerByte)-H
     MAX_i = 4
+    # int versions of the constants above for decoding bytes buffers
+    lg_H_int = 6
+    L_int = (1<<BitsPerByte)-(1<<lg_H_int)
     def __init__(self, buffer, position):
-        self._buffer   = buffer.cast(u_char_tp)
-        self._position = position
+        self._is_bytes = isinstance(buffer, (bytes, bytearray, memoryview))
+        if self._is_bytes:
+            self._buffer   = buffer
+            self._position = int(position)
+        else:
+            self._buffer   = buffer.cast(T.u_char_tp)
+            self._position = position
+    def is_bytes(self): return self._is_bytes
     def position(self): return self._position
     def set_position(self, position): self._position = position
     def buffer(self):   return self._buffer
@@ -1042,24 +3238,31 @@ class CompressedReadStream(CompressedStream):
         res = self._buffer[self._position]
         self._position += 1
         return res
-    def read_byte(self): return self.read().cast(jbyte_t)
+    def read_byte(self):
+        if self._is_bytes:
+            b = self.read()
+            return b - 256 if b >= 128 else b
+        return self.read().cast(T.jbyte_t)
     def decode_sign(self, value):
-        value = value.cast(juint_t)
-        res = ((value >> 1) ^ (-((value & 1).cast(jint_t)))).cast(jint_t)
+        if self._is_bytes:
+            value &= 0xFFFFFFFF
+            return (value >> 1) ^ -(value & 1)
+        value = value.cast(T.juint_t)
+        res = ((value >> 1) ^ (-((value & 1).cast(T.jint_t)))).cast(T.jint_t)
         return res
     def read_signed_int(self): return self.decode_sign(self.read_int())
     def read_int_mb(self, b0):
-        b0 = b0.cast(jint_t)
+        b0 = b0.cast(T.jint_t)
         pos = self.position() - 1
         buf = self.buffer() + pos
         assert buf[0] == b0 and b0 >= CompressedStream.L, "correctly called"
-        sum = b0.cast(jint_t)
+        sum = b0.cast(T.jint_t)
         # must collect more bytes:  b[1]...b[4]
-        lg_H_i = CompressedStream.lg_H.cast(int_t)
-        i = gdb.Value(0).cast(int_t)
+        lg_H_i = CompressedStream.lg_H.cast(T.int_t)
+        i = gdb.Value(0).cast(T.int_t)
         while True:
             i += 1
-            b_i = buf[i].cast(jint_t) # b_i = read(); ++i;
+            b_i = buf[i].cast(T.jint_t) # b_i = read(); ++i;
             sum += b_i << lg_H_i  # sum += b[i]*(64**i)
             if (b_i < CompressedStream.L or i == CompressedStream.MAX_i):
                 self.set_position(pos+i+1)
@@ -1067,19 +3270,44 @@ class CompressedReadStream(CompressedStream):
             lg_H_i += lg_H
 
     def read_int(self):
+        if self._is_bytes: return self.read_int_bytes()
         b0 = self.read()
         if (b0 < CompressedStream.L):  return b0
         else:         return self.read_int_mb(b0)
+    # read_int for bytes buffers
+    def read_int_bytes(self):
+        buf = self._buffer
+        pos = self._position
+        b0 = buf[pos]
+        pos += 1
+        L = CompressedStream.L_int
+        if b0 < L:
+            self._position = pos
+            return b0
+        # must collect more bytes:  b[1]...b[4]
+        sum = b0
+        lg_H_i = CompressedStream.lg_H_int
+        i = 0
+        while True:
+            i += 1
+            b_i = buf[pos]
+            pos += 1
+            sum += b_i << lg_H_i  # sum += b[i]*(64**i)
+            if b_i < L or i == CompressedStream.MAX_i:
+                self._position = pos
+                sum &= 0xFFFFFFFF
+                return sum - (1 << 32) if sum >= (1 << 31) else sum  # jint
+            lg_H_i += CompressedStream.lg_H_int
 
 class CompressedLineNumberReadStream(CompressedReadStream):
     def __init__(self, buf):
         super(CompressedLineNumberReadStream, self).__init__(buf)
-        self._bci = gdb.Value(0)
-        self._line = gdb.Value(0)
+        self._bci = 0 if self._is_bytes else gdb.Value(0)
+        self._line = 0 if self._is_bytes else gdb.Value(0)
     def bci(self): return self._bci
     def line(self): return self._line
     def read_pair(self):
-        next = self.read_byte().cast(jubyte_t)
+        next = self.read() if self._is_bytes else self.read_byte().cast(T.jubyte_t)
         # Check for terminator
         if (next == 0): return False
         if (next == 0xFF):
@@ -1094,10 +3322,11 @@ class CompressedLineNumberReadStream(CompressedReadStream):
 
 class DebugInfoReadStream(CompressedReadStream):
     def __init__(self, code, offset, obj_pool = NULL):
-        super(DebugInfoReadStream, self).__init__(code.scopes_data_begin(), offset)
+        super(DebugInfoReadStream, self).__init__(code.scopes_data(), offset)
         self._code = code
         self._obj_pool = obj_pool
     def read_bci(self):
+        if self._is_bytes: return self.read_int() + int(JavaValue.InvocationEntryBci)
         return self.read_int() + JavaValue.InvocationEntryBci
 
 class NM_pc_desc_at (gdb.Function):
@@ -1109,28 +3338,60 @@ class NM_pc_desc_at (gdb.Function):
         if blob == NULL or not blob.is_nmethod(): return NULL
         nm = blob.as_nmethod()
         res = nm.pc_desc_at(pc)
-        if (res == NULL): return NULL.cast(PcDesc_tp)
+        if (res == NULL): return NULL.cast(T.PcDesc_tp)
         return res.unwrap()
 
 NM_pc_desc_at()
 
 class nmethod(CodeBlob):
-    def __init__(self, nm, gdbtype = nmethod_tp):
+    # scopes data by scopes_data_begin
+    _scopes_data_cache = LRUCache(1024, 'nmethod scopes data')
+    def __init__(self, nm, gdbtype = 'nmethod_tp'):
         super (nmethod, self).__init__(nm, gdbtype)
-        self._pc_desc_cache = PcDescCache(self.getField('_pc_desc_cache').address)
-        self._scopes_pcs_offset   = self.getField('_scopes_pcs_offset')
-        self._dependencies_offset = self.getField('_dependencies_offset')
-        self._scopes_data_offset = self.getField('_scopes_data_offset')
-        self._scopes_pcs_begin  = (self.header_begin() + self._scopes_pcs_offset).cast(PcDesc_tp)
-        self._scopes_pcs_end    = (self.header_begin() + self._dependencies_offset).cast(PcDesc_tp)
-        self._scopes_data_begin = (self.header_begin() + self._scopes_data_offset).cast(address_t)
-        self._oops_offset     = self.getField('_oops_offset')
+        self._pc_desc_cache = None
+        self._scopes_pcs_offset   = self.getRawField('_scopes_pcs_offset')
+        self._dependencies_offset = self.getRawField('_dependencies_offset')
+        self._scopes_data_offset = self.getRawField('_scopes_data_offset')
+        self._scopes_pcs_begin  = (self.header_begin() + self._scopes_pcs_offset).cast(T.PcDesc_tp)
+        self._scopes_pcs_end    = (self.header_begin() + self._dependencies_offset).cast(T.PcDesc_tp)
+        self._scopes_data_begin = (self.header_begin() + self._scopes_data_offset).cast(T.address_t)
+        self._oops_offset     = self.getRawField('_oops_offset')
+        self._metadata_offset = self.getRawField('_metadata_offset') if self.raw().has('_metadata_offset') else None
+        self._scopes_data = None
+        self._pc_desc_table = None
     def oops_begin(self):
-        res = (self.header_begin() + self._oops_offset).cast(oopDesc_tpp)
+        res = (self.header_begin() + self._oops_offset).cast(T.oopDesc_tpp)
         return res
+    # the Metadata* at the given index of the metadata section (1 based
+    # like oop_at, 0 is NULL)
+    def metadata_at(self, index):
+        index = int(index)
+        if index == 0: return NULL
+        addr = self.obj_address() + self._metadata_offset + (index - 1) * T.void_tp.sizeof
+        return gdb.Value(read_pointers(addr, 1)[0]).cast(T.Metadata_tp)
     def scopes_data_begin(self):
         res = self._scopes_data_begin
         return res
+    # scopes data [scopes_data_begin, scopes_pcs_begin) read with one read_memory call
+    def scopes_data(self):
+        if self._scopes_data is None:
+            start = as_int(self._scopes_data_begin)
+            self._scopes_data = nmethod._scopes_data_cache.get(start)
+            if self._scopes_data is None:
+                self._scopes_data = Snapshot.scopes_data(self.obj_address())
+            if self._scopes_data is None:
+                self._scopes_data = read_memory(start, as_int(self._scopes_pcs_begin) - start)
+                nmethod._scopes_data_cache.put(start, self._scopes_data)
+        return self._scopes_data
+    def pc_desc_cache(self):
+        if self._pc_desc_cache is None:
+            self._pc_desc_cache = PcDescCache(gdb.Value(self.getRawFieldAddress('_pc_desc_cache')))
+        return self._pc_desc_cache
+    # The decoded PcDescs of this nmethod or None if they cannot be read
+    def pc_desc_table(self):
+        if self._pc_desc_table is None:
+            self._pc_desc_table = PcDescTable.of(self)
+        return self._pc_desc_table
     def scopes_pcs_begin(self):
         res = PcDesc(self._scopes_pcs_begin)
         return res
@@ -1140,14 +3401,18 @@ class nmethod(CodeBlob):
     def find_pc_desc_internal(self, pc, approximate):
         base_address = self.instructions_begin()
         if ((pc < base_address) or
-            (pc - base_address) >= PcDesc.upper_offset_limit.cast(ptrdiff_t)):
+            (pc - base_address) >= PcDesc.upper_offset_limit.cast(T.ptrdiff_t)):
             return NULL  # PC is wildly out of range
 
-        pc_offset = (pc - base_address).cast(int_t)
+        pc_offset = (pc - base_address).cast(T.int_t)
+
+        table = self.pc_desc_table()
+        if table is not None:
+            return table.find_pc_desc(int(pc_offset), approximate)
 
         # Check the PcDesc cache if it contains the desired PcDesc
         # (This as an almost 100% hit rate.)
-        res = self._pc_desc_cache.find_pc_desc(pc_offset, approximate)
+        res = self.pc_desc_cache().find_pc_desc(pc_offset, approximate)
         if (res != NULL):
             return res
 
@@ -1160,7 +3425,7 @@ class nmethod(CodeBlob):
         if (lower >= upper):  return NULL  # native method; no PcDescs at all
 
         # Use the last successful return as a split point.
-        mid = self._pc_desc_cache.last_pc_desc()
+        mid = self.pc_desc_cache().last_pc_desc()
         if (mid.pc_offset() < pc_offset):
             lower = mid
         else:
@@ -1198,20 +3463,108 @@ class nmethod(CodeBlob):
         else:
             return NULL
     def find_pc_desc(self, pc, approximate):
-        desc = self._pc_desc_cache.last_pc_desc()
-        if desc != NULL and desc.pc_offset() == pc - self.instructions_begin():
-            return desc
+        if self.pc_desc_table() is None:
+            desc = self.pc_desc_cache().last_pc_desc()
+            if desc != NULL and desc.pc_offset() == pc - self.instructions_begin():
+                return desc
         return self.find_pc_desc_internal(pc, approximate)
     def pc_desc_at(self, pc, approximate = False):
-        pc = pc.cast(address_t)
+        pc = pc.cast(T.address_t)
         res =  self.find_pc_desc(pc, approximate)
         if res != NULL: return res
         # not found -> approximate
         return self.find_pc_desc(pc, True)
-    def method(self): return Method(self.getField('_method'))
+    def method(self): return Method(gdb.Value(self.getRawField('_method')))
+    # (Method, bci) for each scope at the given PcDesc, innermost first
+    # ported from java_lang_Throwable::fill_in_stack_trace(Handle throwable, TRAPS)
+    def inlining_at(self, pcdesc):
+        res = []
+        decode_offset = pcdesc.scope_decode_offset()
+        while (decode_offset != 0):
+            stream = DebugInfoReadStream(self, decode_offset)
+            decode_offset = stream.read_int()
+            # Methods are in the metadata section since jdk 8
+            index = stream.read_int()
+            method = Method(self.oop_at(index) if self._metadata_offset is None else self.metadata_at(index))
+            bci = stream.read_bci()
+            res.append((method, bci))
+        return res
     def extended_str (self):
         return self.__str__() + ':' + self.method().extended_str()
 
+#
+# PcDescTable: all PcDescs of a nmethod read from [scopes_pcs_begin,
+# scopes_pcs_end) with one read_memory call and decoded into int arrays.
+# Exact and approximate lookups are done by bisect instead of the radix
+# search in nmethod::find_pc_desc_internal. Tables are cached by nmethod.
+#
+class PcDescTable(object):
+    _cache = LRUCache(1024, 'PcDescTable')
+    # decoded columns
+    _columns = ('_pc_offset', '_scope_decode_offset', '_obj_decode_offset', '_flags')
+    @classmethod
+    def of(cls, nm):
+        key = nm.obj_address()
+        res = cls._cache.get(key)
+        if res is None:
+            try:
+                res = PcDescTable(nm, Snapshot.pc_descs(key))
+            except gdb.MemoryError:
+                return None
+            cls._cache.put(key, res)
+        return res
+    # buf: the PcDescs if already read, e.g. from a snapshot
+    def __init__(self, nm, buf = None):
+        self._layout = StructLayout.of(T.PcDesc_t)
+        self._elt_size = self._layout.size()
+        self._begin = as_int(nm._scopes_pcs_begin)
+        n = (as_int(nm._scopes_pcs_end) - self._begin) // self._elt_size
+        self._buf = read_memory(self._begin, n * self._elt_size) if buf is None else buf
+        rows = struct.Struct(self._row_format()).iter_unpack(self._buf) if n > 0 else []
+        cols = list(zip(*rows)) or [(), (), (), ()]
+        self._pc_offsets            = array('i', cols[0])
+        self._scope_decode_offsets  = array('i', cols[1])
+        self._obj_decode_offsets    = array('i', cols[2])
+        self._flags                 = array('i', cols[3])
+    # struct format for the columns of a PcDesc
+    def _row_format(self):
+        fields = []
+        for name in PcDescTable._columns:
+            if not self._layout.has(name) or self._layout.format(name) is None:
+                name = name + '.word'  # union PcDescFlags of older vms
+            fields.append((self._layout.offset(name), self._layout.format(name)))
+        res = fields[0][1][0]  # byte order
+        pos = 0
+        for offset, fmt in fields:
+            res += 'x' * (offset - pos) + fmt[1:]
+            pos = offset + struct.calcsize(fmt)
+        return res + 'x' * (self._elt_size - pos)
+    def length(self): return len(self._pc_offsets)
+    # the raw PcDescs
+    def buffer(self): return self._buf
+    def pc_offset(self, i): return self._pc_offsets[i]
+    def scope_decode_offset(self, i): return self._scope_decode_offsets[i]
+    def obj_decode_offset(self, i): return self._obj_decode_offsets[i]
+    def flags(self, i): return self._flags[i]
+    # The index of the PcDesc for pc_offset or -1. The first PcDesc is a
+    # sentinel and is never returned.
+    def find(self, pc_offset, approximate):
+        n = len(self._pc_offsets)
+        if n <= 1: return -1  # native method; no PcDescs at all
+        i = bisect_left(self._pc_offsets, pc_offset, 1, n - 1)
+        if self._pc_offsets[i] == pc_offset:
+            return i
+        if approximate and self._pc_offsets[i-1] < pc_offset and pc_offset <= self._pc_offsets[i]:
+            return i
+        return -1
+    # PcDesc wrapper for index i. Its fields are read from the table.
+    def pc_desc(self, i):
+        addr = self._begin + i * self._elt_size
+        return PcDesc.of_raw(RawStruct(self._layout, self._buf[i*self._elt_size:(i+1)*self._elt_size], addr))
+    def find_pc_desc(self, pc_offset, approximate):
+        i = self.find(pc_offset, approximate)
+        return NULL if i < 0 else self.pc_desc(i)
+
 def match_desc(pc, pc_offset, approximate):
     if (not approximate):
         return pc.pc_offset() == pc_offset
@@ -1220,7 +3573,7 @@ def match_desc(pc, pc_offset, approximate):
 
 class PcDescCache(GdbValWrapper):
     cache_size = 4
-    def __init__(self, cache, gdbtype = PcDescCache_tp):
+    def __init__(self, cache, gdbtype = 'PcDescCache_tp'):
         super (PcDescCache, self).__init__(cache, gdbtype)
         self._last_pc_desc = PcDesc(self.getField("_last_pc_desc"))
         self._pc_descs = self.getField("_pc_descs")
@@ -1247,8 +3600,465 @@ class PcDescCache(GdbValWrapper):
 
 class PcDesc(GdbValWrapper):
     lower_offset_limit = gdb.Value(-1)
-    upper_offset_limit = gdb.Value(-1).cast(uint_t) >> 1
-    def __init__(self, desc, gdbtype = PcDesc_tp):
+    upper_offset_limit = LazyValue(lambda cls: gdb.Value(-1).cast(T.uint_t) >> 1)
+    def __init__(self, desc, gdbtype = 'PcDesc_tp'):
         super (PcDesc, self).__init__(desc, gdbtype)
-    def pc_offset(self): return self.getField("_pc_offset")
-    def scope_decode_offset(self): return self.getField("_scope_decode_offset")
+    def pc_offset(self): return self.getRawField("_pc_offset")
+    def scope_decode_offset(self): return self.getRawField("_scope_decode_offset")
+
+#############################################################################
+#
+# Snapshots of the indexes
+#
+#############################################################################
+
+# Snapshot
+#
+# hs-snapshot save writes the class list, the class loader data, the
+# CodeBlobs of the CodeHeaps with the PcDescs and scopes data of the
+# nmethods and the AddressMap to a file. hs-snapshot load maps the file and
+# restores the indexes from it instead of walking the vm again. PcDescs and
+# scopes data are taken from the snapshot when an nmethod is decoded.
+#
+# The file has a header with the magic and the offset and length of a JSON
+# directory, then the sections and then the directory. A section is a
+# column: an array of fixed size items in the byte order of the host
+# aligned to 8 bytes. It is used in place through a memoryview of the
+# mapped file. Strings are stored once in the section 'strings' separated
+# by NUL and are referenced by their index.
+class Snapshot(object):
+    magic = b'HSSNAP01'
+    _header = struct.Struct('<8sQQ')
+    _current = None
+    def __init__(self, path, mm, directory):
+        self._path = path
+        self._mm = mm
+        view = memoryview(mm)
+        self._cols = {}
+        for name, (offset, typecode, count) in directory['sections'].items():
+            self._cols[name] = view[offset:offset + count * array(typecode).itemsize].cast(typecode)
+        self._strings = bytes(self._cols['strings']).decode('utf-8').split('\0')
+    # identifies the vm a snapshot was taken of
+    @staticmethod
+    def vm_key():
+        heaps = ' '.join('%x-%x' % (as_int(h.begin()), as_int(h.end())) for h in CodeCache.heaps())
+        return '%x %s' % (as_int(ClassLoaderDataGraph._head), heaps)
+    @staticmethod
+    def save(path):
+        strings = {}
+        def string(s):
+            res = strings.get(s)
+            if res is None:
+                res = strings[s] = len(strings)
+            return res
+        cols = OrderedDict()
+        for name, typecode in (('cld', 'Q'), ('cld_loader', 'Q'), ('cld_loader_name', 'I'), ('cld_flags', 'B'), ('cld_klasses', 'Q'),
+                               ('klass', 'Q'), ('klass_name', 'i'), ('klass_cld', 'I'),
+                               ('blob_start', 'Q'), ('blob_end', 'Q'), ('blob_kind', 'I'),
+                               ('nm_start', 'Q'), ('nm_pcs_end', 'Q'), ('nm_scopes_end', 'Q'), ('pcs', 'B'), ('scopes', 'B'),
+                               ('region_start', 'Q'), ('region_end', 'Q'), ('region_kind', 'I'), ('region_name', 'I')):
+            cols[name] = array(typecode)
+        # class loader data and classes like ClassNameIndex
+        for cld in ClassLoaderDataGraph.iter_clds():
+            i = len(cols['cld'])
+            cols['cld'].append(cld.cld)
+            cols['cld_loader'].append(cld.loader)
+            cols['cld_loader_name'].append(string(cld.loader_name))
+            cols['cld_flags'].append((1 if cld.is_anonymous else 0) | (2 if cld.is_unloading else 0))
+            cols['cld_klasses'].append(cld.klasses)
+            for rec in ClassLoaderDataGraph.iter_cld_klasses(cld):
+                cols['klass'].append(rec.klass)
+                cols['klass_name'].append(-1 if rec.name is None else string(rec.name))
+                cols['klass_cld'].append(i)
+        # the heaps are sorted and disjoint, so are the blobs of all heaps
+        for heap in CodeCache.heaps():
+            for start, end, kind in heap.index().entries():
+                cols['blob_start'].append(start)
+                cols['blob_end'].append(end)
+                cols['blob_kind'].append(string(kind))
+                if kind != 'nmethod': continue
+                try:
+                    nm = nmethod(gdb.Value(start))
+                    table = nm.pc_desc_table()
+                    scopes = nm.scopes_data()
+                except gdb.MemoryError:
+                    continue
+                if table is None: continue
+                cols['nm_start'].append(start)
+                cols['pcs'].frombytes(table.buffer())
+                cols['nm_pcs_end'].append(len(cols['pcs']))
+                cols['scopes'].frombytes(scopes)
+                cols['nm_scopes_end'].append(len(cols['scopes']))
+        for r in AddressMap.get().regions():
+            cols['region_start'].append(r.start)
+            cols['region_end'].append(r.end)
+            cols['region_kind'].append(string(r.kind))
+            cols['region_name'].append(string(r.name))
+        cols['strings'] = array('B', '\0'.join(sorted(strings, key = strings.get)).encode('utf-8'))
+        sections = {}
+        with open(path, 'wb') as f:
+            f.write(b'\0' * Snapshot._header.size)
+            for name, col in cols.items():
+                f.write(b'\0' * (-f.tell() % 8))
+                sections[name] = [f.tell(), col.typecode, len(col)]
+                col.tofile(f)
+            directory = json.dumps({'byteorder': sys.byteorder, 'key': Snapshot.vm_key(), 'sections': sections}).encode('utf-8')
+            pos = f.tell()
+            f.write(directory)
+            f.seek(0)
+            f.write(Snapshot._header.pack(Snapshot.magic, pos, len(directory)))
+        return cols
+    # Map the snapshot in path and restore the indexes from it. Unless force
+    # is set it must have been taken of the current vm.
+    @staticmethod
+    def load(path, force = False):
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        magic, pos, length = Snapshot._header.unpack_from(mm, 0)
+        if magic != Snapshot.magic:
+            raise gdb.GdbError(path + " is not a snapshot")
+        directory = json.loads(mm[pos:pos + length].decode('utf-8'))
+        if directory['byteorder'] != sys.byteorder:
+            raise gdb.GdbError(path + " was saved on a host with different byte order")
+        if not force and directory['key'] != Snapshot.vm_key():
+            raise gdb.GdbError(path + " was not taken of this vm (use -f to load it anyway)")
+        res = Snapshot(path, mm, directory)
+        res.restore()
+        Snapshot._current = res
+        return res
+    def restore(self):
+        c = self._cols
+        strings = self._strings
+        clds = [CLDRecord(cld, loader, strings[name], bool(flags & 1), bool(flags & 2), klasses)
+                for cld, loader, name, flags, klasses
+                in zip(c['cld'], c['cld_loader'], c['cld_loader_name'], c['cld_flags'], c['cld_klasses'])]
+        ClassNameIndex.install(KlassRecord(k, None if name < 0 else strings[name], clds[i])
+                               for k, name, i in zip(c['klass'], c['klass_name'], c['klass_cld']))
+        starts = c['blob_start']
+        for heap in CodeCache.heaps():
+            lo = bisect_left(starts, as_int(heap.begin()))
+            hi = bisect_left(starts, as_int(heap.end()))
+            heap.install_index(CodeBlobIndex.from_columns(starts[lo:hi], c['blob_end'][lo:hi],
+                                                          [strings[k] for k in c['blob_kind'][lo:hi]]))
+        AddressMap.install([AddressRegion(start, end, strings[kind], strings[name]) for start, end, kind, name
+                            in zip(c['region_start'], c['region_end'], c['region_kind'], c['region_name'])])
+    def counts(self):
+        c = self._cols
+        return (len(c['cld']), len(c['klass']), len(c['blob_start']), len(c['nm_start']), len(c['region_start']))
+    # bytes of the column data for the nmethod at start or None
+    def _nmethod_data(self, start, ends, data):
+        starts = self._cols['nm_start']
+        i = bisect_left(starts, start)
+        if i == len(starts) or starts[i] != start:
+            return None
+        ends = self._cols[ends]
+        return self._cols[data][ends[i-1] if i > 0 else 0:ends[i]]
+    # PcDescs of the nmethod at nm_start from the loaded snapshot or None
+    @classmethod
+    def pc_descs(cls, nm_start):
+        return None if cls._current is None else cls._current._nmethod_data(nm_start, 'nm_pcs_end', 'pcs')
+    # scopes data of the nmethod at nm_start from the loaded snapshot or None
+    @classmethod
+    def scopes_data(cls, nm_start):
+        return None if cls._current is None else cls._current._nmethod_data(nm_start, 'nm_scopes_end', 'scopes')
+    @classmethod
+    def clear_cache(cls):
+        cls._current = None
+
+register_cache(Snapshot.clear_cache)
+
+class hs_snapshot (gdb.Command):
+    """Save the decoded indexes to a file or restore them. Usage: hs-snapshot save <file> | hs-snapshot load [-f] <file>"""
+
+    def __init__ (self):
+        super (hs_snapshot, self).__init__ ("hs-snapshot", gdb.COMMAND_USER)
+
+    def invoke (self, argument, from_tty):
+        argv = gdb.string_to_argv(argument)
+        counts = "%d CLDs, %d classes, %d code blobs (%d nmethods with PcDescs), %d address regions"
+        try:
+            if len(argv) == 2 and argv[0] == 'save':
+                cols = Snapshot.save(argv[1])
+                print(("saved " + counts + " to %s") % (len(cols['cld']), len(cols['klass']), len(cols['blob_start']),
+                                                         len(cols['nm_start']), len(cols['region_start']), argv[1]))
+            elif len(argv) in (2, 3) and argv[0] == 'load' and (len(argv) == 2 or argv[1] == '-f'):
+                snapshot = Snapshot.load(argv[-1], force = len(argv) == 3)
+                print(("loaded " + counts + " from %s") % (snapshot.counts() + (argv[-1],)))
+            else:
+                raise gdb.GdbError("Usage: hs-snapshot save <file> | hs-snapshot load [-f] <file>")
+        except (OSError, ValueError, struct.error) as e:
+            raise gdb.GdbError("hs-snapshot: " + str(e))
+
+
+hs_snapshot ()
+
+#############################################################################
+#
+# Standalone core file analysis (see hotspot_core.py)
+#
+#############################################################################
+
+# Layouts of the types and addresses of the globals used by the walkers of
+# hotspot_vm.HotSpotVM (see its types and globals). They depend only on
+# the libjvm build. The addresses are relocated with the load address of
+# libjvm.
+class LayoutExport(object):
+    _mapping_re = re.compile(r'\s*(0x[0-9a-f]+)\s+0x[0-9a-f]+\s+0x[0-9a-f]+\s+(0x[0-9a-f]+)\s+(?:[rwxps-]{4}\s+)?(\S*/libjvm\.so)\s*$')
+    @staticmethod
+    def libjvm_base():
+        try:
+            mappings = gdb.execute('info proc mappings', to_string = True)
+        except gdb.error:
+            return None
+        for line in mappings.splitlines():
+            m = LayoutExport._mapping_re.match(line)
+            if m and int(m.group(2), 16) == 0:
+                return int(m.group(1), 16)
+        return None
+    @staticmethod
+    def export():
+        res = {'byteorder': target_byteorder(), 'pointer_size': T.void_tp.sizeof,
+               'libjvm_base': LayoutExport.libjvm_base(), 'types': {}, 'globals': {}}
+        vm = GdbVM.get()
+        for name in hotspot_vm.HotSpotVM.types:
+            try:
+                res['types'][name] = vm.layout(name).export()
+            except KeyError:
+                pass  # not in this vm, e.g. CodeCache::_heaps in old vms
+        for expr in hotspot_vm.HotSpotVM.globals:
+            try:
+                val = gdb.parse_and_eval(expr)
+            except gdb.error:
+                continue
+            res['globals'][expr] = [as_int(val.address), val.type.sizeof]
+        return res
+
+class hs_export_layouts (gdb.Command):
+    """Export type layouts and global addresses for hotspot_core.py. Usage: hs-export-layouts <file>"""
+
+    def __init__ (self):
+        super (hs_export_layouts, self).__init__ ("hs-export-layouts", gdb.COMMAND_USER)
+
+    def invoke (self, argument, from_tty):
+        argv = gdb.string_to_argv(argument)
+        if len(argv) != 1:
+            raise gdb.GdbError("Usage: hs-export-layouts <file>")
+        layouts = LayoutExport.export()
+        with open(argv[0], 'w') as f:
+            json.dump(layouts, f, indent = 1, sort_keys = True)
+        print("exported %d types and %d globals to %s" % (len(layouts['types']), len(layouts['globals']), argv[0]))
+
+
+hs_export_layouts ()
+
+class hs_backend (gdb.Command):
+    """Read memory through gdb or directly from the core file. Usage: hs-backend [gdb | core <core file>]"""
+
+    def __init__ (self):
+        super (hs_backend, self).__init__ ("hs-backend", gdb.COMMAND_USER)
+
+    def invoke (self, argument, from_tty):
+        argv = gdb.string_to_argv(argument)
+        if argv == ['gdb']:
+            set_backend(GdbBackend())
+        elif len(argv) == 2 and argv[0] == 'core':
+            try:
+                set_backend(CoreFileBackend(argv[1]))
+            except (OSError, ValueError) as e:
+                raise gdb.GdbError("hs-backend: " + str(e))
+        elif argv:
+            raise gdb.GdbError("Usage: hs-backend [gdb | core <core file>]")
+        print("reading memory through " + str(backend()))
+
+
+hs_backend ()
+
+#############################################################################
+#
+# Profiling
+#
+#############################################################################
+
+# Profile
+#
+# hs-profile on wraps read_memory, the reads of the page cache from the
+# inferior, gdb.parse_and_eval, gdb.lookup_type, the construction of
+# GdbValWrappers and the invoke methods of the commands and functions of
+# this module to count calls and bytes and to measure time. Memory that gdb
+# reads for gdb.Values is not seen. GdbValWrapper.getField and deref, the
+# common paths to such reads, are counted separately as value reads without
+# bytes. Indexing and dereferencing gdb.Values directly is not counted at
+# all. hs-profile off
+# restores the originals, so there is no overhead unless profiling.
+# Commands and functions get the counts and times spent while they run,
+# including nested commands.
+class Profile(object):
+    counters = ('reads', 'bytes', 'read_seconds', 'inferior_reads', 'inferior_bytes', 'inferior_seconds',
+                'evals', 'eval_seconds', 'lookups', 'lookup_seconds', 'value_reads', 'value_seconds', 'wrappers')
+    active = None  # the running Profile
+    last = None    # the last Profile started
+    def __init__(self):
+        self.start = time.time()
+        self.seconds = None
+        self.totals = dict.fromkeys(Profile.counters, 0)
+        self.commands = OrderedDict()  # name -> counters, calls and seconds
+        self.wrappers = {}             # class name -> constructions
+        self._cache_start = Profile.cache_counts()
+        self._cache_end = None
+        self._originals = []           # (owner, attribute, original)
+    # (hits, misses) of the page cache and the LRUCaches by name
+    @staticmethod
+    def cache_counts():
+        res = OrderedDict([('page cache', (page_cache.hits, page_cache.misses))])
+        for name, cache in LRUCache.instances.items():
+            res[name] = (cache.hits, cache.misses)
+        return res
+    def cache_stats(self):
+        end = self._cache_end if self._cache_end is not None else Profile.cache_counts()
+        return OrderedDict((name, (end[name][0] - hits, end[name][1] - misses))
+                           for name, (hits, misses) in self._cache_start.items())
+    # Replace the attribute of owner (a module, class or the dict of the
+    # globals of this module) by wrapper(original). The original attribute,
+    # e.g. a staticmethod, is restored by end.
+    def _wrap(self, owner, attribute, wrapper):
+        if isinstance(owner, dict):
+            original = saved = owner[attribute]
+            owner[attribute] = wrapper(original)
+        else:
+            original = getattr(owner, attribute)
+            saved = owner.__dict__[attribute] if isinstance(owner, type) else original
+            setattr(owner, attribute, wrapper(original))
+        self._originals.append((owner, attribute, saved))
+    def _timed(self, calls, seconds, bytes_counter = None):
+        totals = self.totals
+        def wrapper(original):
+            def timed(*args):
+                start = time.perf_counter()
+                try:
+                    return original(*args)
+                finally:
+                    totals[seconds] += time.perf_counter() - start
+                    totals[calls] += 1
+                    if bytes_counter is not None: totals[bytes_counter] += args[-1]
+            return timed
+        return wrapper
+    def _constructions(self, original):
+        totals = self.totals
+        wrappers = self.wrappers
+        def init(wrapper, *args, **kwargs):
+            totals['wrappers'] += 1
+            name = wrapper.__class__.__name__
+            wrappers[name] = wrappers.get(name, 0) + 1
+            original(wrapper, *args, **kwargs)
+        return init
+    def _invocations(self, name):
+        totals = self.totals
+        commands = self.commands
+        def wrapper(original):
+            def invoke(*args):
+                before = dict(totals)
+                start = time.perf_counter()
+                try:
+                    return original(*args)
+                finally:
+                    rec = commands.get(name)
+                    if rec is None:
+                        rec = commands[name] = dict(dict.fromkeys(Profile.counters, 0), calls = 0, seconds = 0.0)
+                    rec['calls'] += 1
+                    rec['seconds'] += time.perf_counter() - start
+                    for c in Profile.counters:
+                        rec[c] += totals[c] - before[c]
+            return invoke
+        return wrapper
+    # the commands and functions of this module by name
+    @staticmethod
+    def invocables():
+        res = []
+        for cls in list(globals().values()):
+            if not isinstance(cls, type) or cls is hs_profile or 'invoke' not in cls.__dict__: continue
+            if issubclass(cls, gdb.Command):
+                res.append((cls.__name__.replace('_', '-'), cls))
+            elif issubclass(cls, gdb.Function):
+                res.append(('$' + cls.__name__, cls))
+        return res
+    def begin(self):
+        self._wrap(globals(), 'read_memory', self._timed('reads', 'read_seconds', 'bytes'))
+        self._wrap(PageCache, '_read_inferior', lambda original: staticmethod(self._timed('inferior_reads', 'inferior_seconds', 'inferior_bytes')(original)))
+        self._wrap(gdb, 'parse_and_eval', self._timed('evals', 'eval_seconds'))
+        self._wrap(gdb, 'lookup_type', self._timed('lookups', 'lookup_seconds'))
+        self._wrap(GdbValWrapper, '__init__', self._constructions)
+        self._wrap(GdbValWrapper, 'getField', self._timed('value_reads', 'value_seconds'))
+        self._wrap(GdbValWrapper, 'deref', self._timed('value_reads', 'value_seconds'))
+        for name, cls in Profile.invocables():
+            self._wrap(cls, 'invoke', self._invocations(name))
+        Profile.active = Profile.last = self
+    def end(self):
+        for owner, attribute, original in reversed(self._originals):
+            if isinstance(owner, dict):
+                owner[attribute] = original
+            else:
+                setattr(owner, attribute, original)
+        self._originals = []
+        self.seconds = time.time() - self.start
+        self._cache_end = Profile.cache_counts()
+        Profile.active = None
+    def as_dict(self):
+        return {'seconds': self.seconds if self.seconds is not None else time.time() - self.start,
+                'totals': self.totals,
+                'commands': self.commands,
+                'wrappers': self.wrappers,
+                'caches': dict((name, {'hits': hits, 'misses': misses}) for name, (hits, misses) in self.cache_stats().items())}
+    def print_report(self):
+        d = self.as_dict()
+        print("reads: read_memory calls. Memory read by gdb for gdb.Values is not counted.")
+        print("val reads: GdbValWrapper.getField and deref calls, i.e. reads through gdb.Values.")
+        print("")
+        print("%-32s %6s %9s %8s %10s %8s %8s %8s %8s %9s %9s" %
+              ("command", "calls", "seconds", "reads", "KiB read", "read s", "evals", "eval s", "lookups", "val reads", "wrappers"))
+        calls = sum(rec['calls'] for rec in self.commands.values())
+        rows = list(self.commands.items()) + [("total while profiling", dict(self.totals, calls = calls, seconds = d['seconds']))]
+        for name, rec in rows:
+            print("%-32s %6d %9.3f %8d %10d %8.3f %8d %8.3f %8d %9d %9d" %
+                  (name, rec['calls'], rec['seconds'], rec['reads'], rec['bytes'] // 1024, rec['read_seconds'],
+                   rec['evals'], rec['eval_seconds'], rec['lookups'], rec['value_reads'], rec['wrappers']))
+        print("")
+        print("%-32s %10d reads %10d KiB" % ("inferior (page cache misses)", self.totals['inferior_reads'], self.totals['inferior_bytes'] // 1024))
+        print("")
+        print("%-32s %10s %10s %9s" % ("cache", "hits", "misses", "hit rate"))
+        for name, (hits, misses) in self.cache_stats().items():
+            rate = "%8.1f%%" % (100.0 * hits / (hits + misses)) if hits + misses > 0 else "%9s" % "-"
+            print("%-32s %10d %10d %s" % (name, hits, misses, rate))
+        if self.wrappers:
+            print("")
+            print("%-32s %10s" % ("wrapper class", "instances"))
+            for name, n in sorted(self.wrappers.items(), key = lambda e: -e[1]):
+                print("%-32s %10d" % (name, n))
+
+class hs_profile (gdb.Command):
+    """Count reads, evaluations and wrappers and time the commands. Usage: hs-profile on | off | report [json [<file>]]"""
+
+    def __init__ (self):
+        super (hs_profile, self).__init__ ("hs-profile", gdb.COMMAND_USER)
+
+    def invoke (self, argument, from_tty):
+        argv = gdb.string_to_argv(argument)
+        if argv == ['on']:
+            if Profile.active is not None: Profile.active.end()
+            Profile().begin()
+        elif argv == ['off']:
+            if Profile.active is not None: Profile.active.end()
+        elif argv[:1] == ['report'] and len(argv) <= 3 and argv[1:2] in ([], ['json']):
+            if Profile.last is None:
+                raise gdb.GdbError("hs-profile: no profile, use hs-profile on")
+            if len(argv) == 1:
+                Profile.last.print_report()
+            elif len(argv) == 3:
+                with open(argv[2], 'w') as f:
+                    json.dump(Profile.last.as_dict(), f, indent = 1)
+            else:
+                print(json.dumps(Profile.last.as_dict(), indent = 1))
+        else:
+            raise gdb.GdbError("Usage: hs-profile on | off | report [json [<file>]]")
+
+
+hs_profile ()
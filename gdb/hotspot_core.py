@@ -0,0 +1,303 @@
+#############################################################################
+#
+# Read data structures of the hotspot vm directly from an ELF core file
+#
+#############################################################################
+#
+# Analyzing a core through gdb costs a round-trip into gdb for every read
+# and often gdb's expression evaluator. This module maps the core file and
+# reads the memory of the vm from its PT_LOAD segments without gdb. The
+# layouts of the hotspot types (offset, struct format and size of the
+# fields) and the addresses of a few globals are exported once per libjvm
+# build with gdb:
+#
+#    (gdb) source gdb_utilities_python3.py
+#    (gdb) hs-export-layouts jdk17-layouts.json
+#
+# Afterwards cores of vms with that libjvm are analyzed in plain Python
+# processes, several cores in parallel:
+#
+#    $ python3 hotspot_core.py -l jdk17-layouts.json -j 8 classes cores/core.*
+#    $ python3 hotspot_core.py -l jdk17-layouts.json blobs core.4711
+#    $ python3 hotspot_core.py -l jdk17-layouts.json heap core.4711
+#
+# Queries: classes, clds, blobs, heap. Memory that is not in the core, e.g. the
+# read-only data of libjvm, is read from the files mapped by the process
+# (see the NT_FILE note). --sysroot is prepended to their paths.
+#
+# The walkers are those of hotspot_vm.py (HotSpotVM, HeapWalker), which
+# gdb_utilities_python3.py runs through gdb. It uses ElfCore for its core
+# file backend (see hs-backend).
+#
+#############################################################################
+
+import json
+import mmap
+import os
+import struct
+import sys
+from bisect import bisect_right
+from collections import namedtuple
+
+from hotspot_vm import HeapWalker, HotSpotVM
+
+class CoreMemoryError(Exception):
+    pass
+
+#############################################################################
+#
+# ELF core files
+#
+#############################################################################
+
+# A PT_LOAD segment with the memory of [vaddr, vaddr + filesz) at offset
+ElfSegment = namedtuple('ElfSegment', ['vaddr', 'filesz', 'offset'])
+# A file mapped to [start, end) from offset of the file (NT_FILE note)
+FileMapping = namedtuple('FileMapping', ['start', 'end', 'offset', 'path'])
+
+def _align4(n):
+    return (n + 3) & ~3
+
+# ElfCore
+#
+# The memory of a 64 bit ELF core file. read returns memoryviews of the
+# mapped file, i.e. nothing is copied unless the range spans segments.
+class ElfCore(object):
+    ET_CORE = 4
+    PT_LOAD = 1
+    PT_NOTE = 4
+    NT_FILE = 0x46494c45
+    def __init__(self, path, sysroot = ''):
+        self.path = path
+        self._sysroot = sysroot
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        self._view = memoryview(self._mm)
+        ident = self._mm[:16]
+        if ident[:4] != b'\x7fELF':
+            raise ValueError(path + " is not an ELF file")
+        if ident[4] != 2:
+            raise ValueError(path + " is not a 64 bit ELF file")
+        self.byteorder = 'little' if ident[5] == 1 else 'big'
+        e = '<' if self.byteorder == 'little' else '>'
+        e_type, self.machine, _, _, e_phoff, _, _, _, e_phentsize, e_phnum = struct.unpack_from(e + 'HHIQQQIHHH', self._mm, 16)
+        if e_type != ElfCore.ET_CORE:
+            raise ValueError(path + " is not a core file")
+        segments = []
+        self.mappings = []
+        for i in range(e_phnum):
+            p_type, _, p_offset, p_vaddr, _, p_filesz, _, _ = struct.unpack_from(e + 'IIQQQQQQ', self._mm, e_phoff + i*e_phentsize)
+            if p_type == ElfCore.PT_LOAD and p_filesz > 0:
+                segments.append(ElfSegment(p_vaddr, p_filesz, p_offset))
+            elif p_type == ElfCore.PT_NOTE:
+                self._read_notes(p_offset, p_filesz, e)
+        segments.sort()
+        self._segments = segments
+        self._starts = [s.vaddr for s in segments]
+        self.mappings.sort()
+        self._mapping_starts = [m.start for m in self.mappings]
+        self._files = {}  # path -> memoryview of the mapped file or None
+    def _read_notes(self, offset, size, e):
+        end = offset + size
+        while offset + 12 <= end:
+            namesz, descsz, n_type = struct.unpack_from(e + 'III', self._mm, offset)
+            name = self._mm[offset + 12:offset + 12 + namesz].rstrip(b'\0')
+            desc = offset + 12 + _align4(namesz)
+            if n_type == ElfCore.NT_FILE and name == b'CORE':
+                self._read_file_note(desc, descsz, e)
+            offset = desc + _align4(descsz)
+    def _read_file_note(self, desc, size, e):
+        count, page_size = struct.unpack_from(e + 'QQ', self._mm, desc)
+        names = self._mm[desc + 16 + count*24:desc + size].split(b'\0')
+        for i in range(count):
+            start, end, page_offset = struct.unpack_from(e + 'QQQ', self._mm, desc + 16 + i*24)
+            self.mappings.append(FileMapping(start, end, page_offset * page_size, names[i].decode('utf-8', 'replace')))
+    # start of the mapping of offset 0 of the file with the given name or None
+    def base_of(self, name):
+        for m in self.mappings:
+            if m.offset == 0 and os.path.basename(m.path) == name:
+                return m.start
+        return None
+    # length bytes at addr as memoryview
+    def read(self, addr, length):
+        i = bisect_right(self._starts, addr) - 1
+        if i >= 0:
+            s = self._segments[i]
+            pos = addr - s.vaddr
+            if pos + length <= s.filesz:
+                return self._view[s.offset + pos:s.offset + pos + length]
+        res = bytearray()
+        while len(res) < length:
+            res += self.read_prefix(addr + len(res), length - len(res))
+        return memoryview(bytes(res))
+    # the longest prefix of [addr, addr + length) in one segment or mapped
+    # file. The segments take precedence, they have the pages of mapped
+    # files written by the process.
+    def read_prefix(self, addr, length):
+        i = bisect_right(self._starts, addr) - 1
+        if i >= 0:
+            s = self._segments[i]
+            pos = addr - s.vaddr
+            if pos < s.filesz:
+                n = min(length, s.filesz - pos)
+                return self._view[s.offset + pos:s.offset + pos + n]
+        if i + 1 < len(self._starts):
+            length = min(length, self._starts[i + 1] - addr)
+        i = bisect_right(self._mapping_starts, addr) - 1
+        if i >= 0 and addr < self.mappings[i].end:
+            m = self.mappings[i]
+            f = self._file(m.path)
+            pos = m.offset + addr - m.start
+            if f is not None and pos < len(f):
+                return f[pos:pos + min(length, m.end - addr, len(f) - pos)]
+        raise CoreMemoryError("Cannot access memory at address 0x%x" % addr)
+    def _file(self, path):
+        if path not in self._files:
+            try:
+                with open(self._sysroot + path, 'rb') as f:
+                    self._files[path] = memoryview(mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ))
+            except (OSError, ValueError):
+                self._files[path] = None
+        return self._files[path]
+
+#############################################################################
+#
+# Layouts
+#
+#############################################################################
+
+# Layout of a type exported with hs-export-layouts. It has the interface of
+# StructLayout in gdb_utilities_python3.py. Fields are name -> [offset,
+# struct format or None, size].
+class Layout(object):
+    def __init__(self, name, exported):
+        self.name = name
+        self._size = exported['size']
+        self._fields = exported['fields']
+    def size(self): return self._size
+    def has(self, name): return name in self._fields
+    def offset(self, name): return self._fields[name][0]
+    def format(self, name): return self._fields[name][1]
+    def field_size(self, name): return self._fields[name][2]
+
+#############################################################################
+#
+# The hotspot vm in a core
+#
+#############################################################################
+
+# HotSpotCore
+#
+# A HotSpotVM in a core file with the layouts exported by
+# hs-export-layouts. The exported addresses of globals are relocated by the
+# difference of the load addresses of libjvm.
+class HotSpotCore(HotSpotVM):
+    memory_errors = (CoreMemoryError,)
+    def __init__(self, core_path, layouts, sysroot = ''):
+        self.core = ElfCore(core_path, sysroot)
+        if layouts['byteorder'] != self.core.byteorder or layouts['pointer_size'] != 8:
+            raise ValueError("the layouts do not match " + core_path)
+        super(HotSpotCore, self).__init__(self.core.byteorder, 8)
+        self._layouts = dict((name, Layout(name, t)) for name, t in layouts['types'].items())
+        self._globals = layouts['globals']
+        # libjvm is position independent, so without both load addresses
+        # the addresses of the globals cannot be relocated
+        base = self.core.base_of('libjvm.so')
+        if layouts['libjvm_base'] is None:
+            raise ValueError("layouts have no libjvm base")
+        if base is None:
+            raise ValueError("no mapping of libjvm.so in " + core_path)
+        self._reloc = base - layouts['libjvm_base']
+    @staticmethod
+    def load_layouts(path):
+        with open(path) as f:
+            return json.load(f)
+    def layout(self, type_name):
+        return self._layouts[type_name]
+    def read(self, addr, length):
+        return self.core.read(addr, length)
+    def read_prefix(self, addr, length):
+        return self.core.read_prefix(addr, length)
+    def has_global(self, name):
+        return name in self._globals
+    def global_address(self, name):
+        return self._globals[name][0] + self._reloc
+    def global_value(self, name):
+        addr, size = self._globals[name]
+        return int.from_bytes(self.read(addr + self._reloc, size), self.core.byteorder)
+
+#############################################################################
+#
+# Driver
+#
+#############################################################################
+
+def query_classes(vm):
+    for rec in vm.iter_klasses():
+        yield "%s (Klass *)0x%x loader: %s" % (rec.name, rec.klass, rec.cld.loader_name)
+
+def query_clds(vm):
+    for cld in vm.iter_clds():
+        yield "(ClassLoaderData *)0x%x loader: %s%s" % (cld.cld, cld.loader_name, " anon" if cld.is_anonymous else "")
+
+def query_blobs(vm):
+    for heap in vm.code_heaps():
+        heap_name = vm.code_heap_name(heap)
+        for start, end, kind in vm.code_heap_blobs(heap):
+            yield "0x%x-0x%x %s in CodeHeap '%s'" % (start, end, kind, heap_name)
+
+# class histogram of the java heap like hs-heap-histo
+def query_heap(vm):
+    walker = HeapWalker(vm)
+    counts = {}  # Klass* -> [instances, bytes]
+    for addr, klass, size in walker.objects():
+        c = counts.get(klass)
+        if c is None:
+            c = counts[klass] = [0, 0]
+        c[0] += 1
+        c[1] += size
+    yield "%10s %14s  %s" % ("instances", "bytes", "class")
+    for klass, (n, size) in sorted(counts.items(), key = lambda kv: -kv[1][1]):
+        yield "%10d %14d  %s" % (n, size, walker.klass_info(klass)[1])
+    for space, addr, reason in walker.failures:
+        yield "stopped walking %s at 0x%x: %s" % (space, addr, reason)
+
+QUERIES = {'classes': query_classes, 'clds': query_clds, 'blobs': query_blobs, 'heap': query_heap}
+
+# runs in a worker process
+def run_query(query, core, layouts, sysroot):
+    try:
+        vm = HotSpotCore(core, layouts, sysroot)
+        return (core, list(QUERIES[query](vm)), None)
+    except (CoreMemoryError, OSError, ValueError, KeyError) as e:
+        return (core, [], "%s: %s" % (type(e).__name__, e))
+
+def main(argv):
+    import argparse
+    from concurrent.futures import ProcessPoolExecutor
+
+    parser = argparse.ArgumentParser(description = 'Analyze hotspot core files without gdb.')
+    parser.add_argument('query', choices = sorted(QUERIES), help = 'what to list')
+    parser.add_argument('cores', nargs = '+', help = 'core files')
+    parser.add_argument('-l', '--layouts', required = True, help = 'layouts exported with hs-export-layouts')
+    parser.add_argument('-j', '--jobs', type = int, default = os.cpu_count() or 1, help = 'number of worker processes')
+    parser.add_argument('--sysroot', default = '', help = 'prefix for the paths of the files mapped by the vm')
+    args = parser.parse_args(argv)
+
+    layouts = HotSpotCore.load_layouts(args.layouts)
+    failed = False
+    with ProcessPoolExecutor(max_workers = args.jobs) as pool:
+        futures = [pool.submit(run_query, args.query, core, layouts, args.sysroot) for core in args.cores]
+        for f in futures:
+            core, lines, error = f.result()
+            if len(args.cores) > 1:
+                print("== " + core)
+            for line in lines:
+                print(line)
+            if error is not None:
+                sys.stderr.write(core + ": " + error + "\n")
+                failed = True
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,592 @@
+#############################################################################
+#
+# Walk the data structures of the hotspot vm in raw memory
+#
+#############################################################################
+#
+# The walkers in this module read the memory of the vm in big blocks and
+# decode it with the layouts of the hotspot types (offset, struct format
+# and size of the fields). They do not need gdb: gdb_utilities_python3.py
+# runs them through gdb (see GdbVM there) and hotspot_core.py runs them on
+# core files.
+#
+#############################################################################
+
+import struct
+import sys
+from bisect import bisect_left
+from collections import namedtuple
+
+#############################################################################
+#
+# Raw structs
+#
+#############################################################################
+
+#
+# RawStruct: an object read with one call.
+#
+# Fields are unpacked from the buffer as Python ints. layout is the layout
+# of the type (see HotSpotVM.layout). If just a few fields of a big object
+# are needed, HotSpotVM.read_fields reads only the bytes spanning these
+# fields. vm is used to read the oops referenced by OopHandles.
+#
+class RawStruct(object):
+    def __init__(self, layout, buf, addr, buf_offset = 0, vm = None):
+        self._layout = layout
+        self._buf = buf
+        self._addr = addr
+        self._buf_offset = buf_offset  # offset of buf[0] in the object
+        self._vm = vm
+    def address(self): return self._addr
+    def layout(self): return self._layout
+    def buffer(self): return self._buf
+    def has(self, name): return self._layout.has(name)
+    def get(self, name):
+        fmt = self._layout.format(name)
+        if fmt is None:
+            raise Exception("Error: field " + name + " of " + self._layout.name + " is not a scalar")
+        return struct.unpack_from(fmt, self._buf, self._layout.offset(name) - self._buf_offset)[0]
+    def field_address(self, name):
+        return self._addr + self._layout.offset(name)
+    # The oop in the field name. The field is an oop, an oop with
+    # CHECK_UNHANDLED_OOPS or an OopHandle in newer vms.
+    def get_oop(self, name):
+        if self.has(name + '._obj'):
+            handle = self.get(name + '._obj')
+            return 0 if handle == 0 else self._vm.read_pointer(handle)
+        if self.has(name + '._o'):
+            return self.get(name + '._o')
+        return self.get(name)
+
+#############################################################################
+#
+# Walking the data structures of the vm
+#
+#############################################################################
+
+# Records yielded by HotSpotVM.iter_clds and iter_klasses. Addresses are
+# ints. The cld of a KlassRecord is the CLDRecord of its ClassLoaderData.
+CLDRecord = namedtuple('CLDRecord', ['cld', 'loader', 'loader_name', 'is_anonymous', 'is_unloading', 'klasses'])
+KlassRecord = namedtuple('KlassRecord', ['klass', 'name', 'cld'])
+
+# HotSpotVM
+#
+# The walkers over the ClassLoaderDataGraph, the CodeHeaps, the JavaThreads
+# and the java heap (see HeapWalker). They only read raw memory and use the
+# layouts of the types, so the same code runs in gdb and on core files.
+# Subclasses provide the memory, the layouts and the globals:
+#
+#    read(addr, length)       bytes-like object, raises one of memory_errors
+#    layout(type name)        layout of the type, KeyError if unknown
+#    has_global(name)
+#    global_value(name)       value of a global as int, KeyError if unknown
+#    message(text)            report a problem found while walking
+#    error(text)              exception to raise if the vm is not supported
+#
+# GdbVM in gdb_utilities_python3.py reads through gdb. HotSpotCore in
+# hotspot_core.py reads a core file with the layouts exported by
+# hs-export-layouts.
+# types and globals are what the walkers use. hs-export-layouts exports
+# them. Decoded strings are cached for the life of the instance.
+class HotSpotVM(object):
+    types = ('ClassLoaderData', 'Klass', 'Symbol', 'oopDesc', 'CodeHeap', 'HeapBlock', 'CodeBlob', 'PcDesc',
+             'GrowableArray<CodeHeap*>', 'JavaThread', 'ThreadsList',
+             'G1CollectedHeap', 'HeapRegionManager', 'G1HeapRegionManager', 'HeapRegion', 'G1HeapRegion',
+             'ParallelScavengeHeap', 'PSYoungGen', 'PSOldGen', 'MutableSpace',
+             'SerialHeap', 'GenCollectedHeap', 'DefNewGeneration', 'TenuredGeneration', 'ContiguousSpace')
+    globals = ('ClassLoaderDataGraph::_head', 'ClassLoaderDataGraph::_unloading',
+               'CodeCache::_heaps', 'CodeCache::_heap',
+               'UseCompressedClassPointers', 'CompressedKlassPointers::_narrow_klass._base',
+               'CompressedKlassPointers::_narrow_klass._shift', 'MinObjAlignmentInBytes',
+               'java_lang_Class::_oop_size_offset', 'ThreadsSMRSupport::_java_thread_list', 'Threads::_thread_list',
+               'ThreadLocalAllocBuffer::_reserve_for_allocation_prefetch', 'Universe::_collectedHeap',
+               'UseG1GC', 'UseParallelGC', 'UseSerialGC', 'G1CollectedHeap::_g1h',
+               'ParallelScavengeHeap::_young_gen', 'ParallelScavengeHeap::_old_gen')
+    memory_errors = ()
+    # bytes of the body of a Symbol read together with its header
+    symbol_prefetch_size = 128
+    def __init__(self, byteorder, pointer_size):
+        self.byteorder = byteorder
+        self.pointer_size = pointer_size
+        self._endian = '<' if byteorder == 'little' else '>'
+        self._pointer_format = 'Q' if pointer_size == 8 else 'I'
+        self._pointer = struct.Struct(self._endian + self._pointer_format)
+        self._klass_decoding = None  # (compressed, base, shift)
+        self._symbols = {}  # Symbol* -> str
+        self._strings = {}  # char* -> str
+    def read(self, addr, length):
+        raise NotImplementedError()
+    def layout(self, type_name):
+        raise NotImplementedError()
+    def has_global(self, name):
+        raise NotImplementedError()
+    def global_value(self, name):
+        raise NotImplementedError()
+    def message(self, text):
+        sys.stderr.write(text + "\n")
+    def error(self, text):
+        return ValueError(text)
+    def has_layout(self, type_name):
+        try:
+            self.layout(type_name)
+            return True
+        except KeyError:
+            return False
+    # the first of the given types the vm has (types are renamed over time)
+    def first_type(self, *type_names):
+        for name in type_names:
+            if self.has_layout(name): return name
+        raise KeyError(type_names[0])
+    # the longest prefix of [addr, addr + length) that can be read up to the
+    # end of its page
+    def read_prefix(self, addr, length):
+        try:
+            return self.read(addr, length)
+        except self.memory_errors:
+            page_end = (addr | 0xfff) + 1
+            if addr + length <= page_end: raise
+            return self.read(addr, page_end - addr)
+    def read_pointer(self, addr):
+        return self._pointer.unpack_from(self.read(addr, self.pointer_size))[0]
+    # read n pointers at addr with one call
+    def read_pointers(self, addr, n):
+        if n == 0: return []
+        return list(struct.unpack(self._endian + str(n) + self._pointer_format, self.read(addr, n * self.pointer_size)))
+    # the object of the given type (name or layout) at addr
+    def read_struct(self, addr, type_name):
+        layout = self.layout(type_name) if isinstance(type_name, str) else type_name
+        return RawStruct(layout, self.read(addr, layout.size()), addr, 0, self)
+    # only the bytes spanning the given fields of the object at addr
+    def read_fields(self, addr, type_name, names):
+        layout = self.layout(type_name) if isinstance(type_name, str) else type_name
+        lo = min(layout.offset(n) for n in names)
+        hi = max(layout.offset(n) + layout.field_size(n) for n in names)
+        return RawStruct(layout, self.read(addr + lo, hi - lo), addr, lo, self)
+    # the NUL terminated string at addr
+    def c_string(self, addr):
+        res = self._strings.get(addr)
+        if res is None:
+            buf = bytearray()
+            while True:
+                chunk = bytes(self.read_prefix(addr + len(buf), 256))
+                end = chunk.find(b'\0')
+                if end >= 0:
+                    buf += chunk[:end]
+                    break
+                buf += chunk
+            res = self._strings[addr] = buf.decode('utf-8', 'replace')
+        return res
+    # The string of the Symbol at addr. The header and the first bytes of
+    # the body are read with one call.
+    def symbol_str(self, addr):
+        res = self._symbols.get(addr)
+        if res is None:
+            layout = self.layout('Symbol')
+            if layout.has('_length'):
+                # newer vms have a separate u2 _length
+                len_name, len_shift = '_length', 0
+            else:
+                len_name, len_shift = '_length_and_refcount', 16
+            body = layout.offset('_body')
+            try:
+                buf = bytes(self.read(addr, body + HotSpotVM.symbol_prefetch_size))
+            except self.memory_errors:
+                # prefetching crossed into unreadable memory
+                buf = bytes(self.read(addr, body))
+            offset = layout.offset(len_name)
+            length = int.from_bytes(buf[offset:offset + layout.field_size(len_name)], self.byteorder) >> len_shift
+            if body + length > len(buf):
+                buf += bytes(self.read(addr + len(buf), body + length - len(buf)))
+            res = self._symbols[addr] = buf[body:body + length].decode('utf-8', 'ignore')
+        return res
+    # the name of the Klass at the given address or None
+    def klass_name(self, klass):
+        name = self.read_fields(klass, 'Klass', ('_name',)).get('_name')
+        return None if name == 0 else self.symbol_str(name)
+    # (compressed, base, shift) of the klass pointers in object headers
+    def klass_decoding(self):
+        if self._klass_decoding is None:
+            if self.global_value('UseCompressedClassPointers'):
+                self._klass_decoding = (True, self.global_value('CompressedKlassPointers::_narrow_klass._base'),
+                                        self.global_value('CompressedKlassPointers::_narrow_klass._shift'))
+            else:
+                self._klass_decoding = (False, 0, 0)
+        return self._klass_decoding
+    # address of the Klass of the object at the given address
+    def klass_at(self, obj):
+        compressed, base, shift = self.klass_decoding()
+        if compressed:
+            nk = self.read_fields(obj, 'oopDesc', ('_metadata._compressed_klass',)).get('_metadata._compressed_klass')
+            return 0 if nk == 0 else base + (nk << shift)
+        return self.read_fields(obj, 'oopDesc', ('_metadata._klass',)).get('_metadata._klass')
+    #
+    # ClassLoaderDataGraph
+    #
+    # newer vms replaced _is_anonymous with _has_class_mirror_holder
+    @staticmethod
+    def cld_is_anonymous(raw):
+        for name in ('_is_anonymous', '_has_class_mirror_holder'):
+            if raw.has(name): return raw.get(name) != 0
+        return False
+    # only older vms have the _unloading flag
+    @staticmethod
+    def cld_is_unloading(raw):
+        return raw.has('_unloading') and raw.get('_unloading') != 0
+    # Yield a CLDRecord for each ClassLoaderData. loader_name selects CLDs
+    # by the name of the class of their loader ('<bootstrap>' for the
+    # boot loader). predicate is called with the record.
+    def iter_clds(self, loader_name = None, predicate = None):
+        return self.iter_cld_list(self.global_value('ClassLoaderDataGraph::_head'), loader_name, predicate)
+    # Like iter_clds for the list of CLDs being unloaded. Only older vms
+    # have this list.
+    def iter_unloading_clds(self, loader_name = None, predicate = None):
+        if not self.has_global('ClassLoaderDataGraph::_unloading'): return iter(())
+        return self.iter_cld_list(self.global_value('ClassLoaderDataGraph::_unloading'), loader_name, predicate)
+    # Like iter_clds for the list starting with the ClassLoaderData at cld
+    def iter_cld_list(self, cld, loader_name = None, predicate = None):
+        loader_names = {}  # loader klass -> name
+        while cld != 0:
+            raw = self.read_struct(cld, 'ClassLoaderData')
+            loader = raw.get_oop('_class_loader')
+            if loader == 0:
+                name = '<bootstrap>'
+            else:
+                loader_klass = self.klass_at(loader)
+                name = loader_names.get(loader_klass)
+                if name is None:
+                    name = loader_names[loader_klass] = self.klass_name(loader_klass)
+            rec = CLDRecord(cld, loader, name, HotSpotVM.cld_is_anonymous(raw), HotSpotVM.cld_is_unloading(raw),
+                            raw.get('_klasses'))
+            if (loader_name is None or name == loader_name) and (predicate is None or predicate(rec)):
+                yield rec
+            cld = raw.get('_next')
+    # Yield a KlassRecord for each Klass of the CLDs selected by
+    # loader_name. name_prefix selects klasses by name. predicate is
+    # called with the record.
+    def iter_klasses(self, name_prefix = None, loader_name = None, predicate = None):
+        for cld in self.iter_clds(loader_name):
+            for rec in self.iter_cld_klasses(cld):
+                if name_prefix is None or (rec.name is not None and rec.name.startswith(name_prefix)):
+                    if predicate is None or predicate(rec):
+                        yield rec
+    # Yield a KlassRecord for each Klass of the given CLDRecord
+    def iter_cld_klasses(self, cld):
+        fields = ('_name', '_next_link')
+        k = cld.klasses
+        while k != 0:
+            raw = self.read_fields(k, 'Klass', fields)
+            name = raw.get('_name')
+            yield KlassRecord(k, None if name == 0 else self.symbol_str(name), cld)
+            k = raw.get('_next_link')
+    # number of klasses in the list starting with the given Klass*
+    def klass_count(self, k):
+        n = 0
+        while k != 0:
+            n += 1
+            k = self.read_fields(k, 'Klass', ('_next_link',)).get('_next_link')
+        return n
+    #
+    # Threads
+    #
+    # addresses of all JavaThreads
+    def java_thread_addresses(self):
+        if self.has_global('ThreadsSMRSupport::_java_thread_list'):
+            tl = self.read_fields(self.global_value('ThreadsSMRSupport::_java_thread_list'), 'ThreadsList',
+                                  ('_length', '_threads'))
+            return self.read_pointers(tl.get('_threads'), tl.get('_length'))
+        # before jdk 10 the threads are linked with _next
+        res = []
+        t = self.global_value('Threads::_thread_list')
+        while t != 0:
+            res.append(t)
+            t = self.read_fields(t, 'JavaThread', ('_next',)).get('_next')
+        return res
+    #
+    # CodeCache
+    #
+    # addresses of the CodeHeaps sorted by address. Newer vms have a
+    # segmented code cache with several CodeHeaps in CodeCache::_heaps.
+    # Older vms have just CodeCache::_heap.
+    def code_heaps(self):
+        if self.has_global('CodeCache::_heaps'):
+            raw = self.read_struct(self.global_value('CodeCache::_heaps'), 'GrowableArray<CodeHeap*>')
+            return sorted(self.read_pointers(raw.get('_data'), raw.get('_len')))
+        return [self.global_value('CodeCache::_heap')]
+    def code_heap_name(self, heap):
+        layout = self.layout('CodeHeap')
+        if not layout.has('_name'): return 'CodeHeap'
+        return self.c_string(self.read_fields(heap, layout, ('_name',)).get('_name'))
+    # (start, end, kind) of the CodeBlobs of the CodeHeap at heap in address
+    # order. All HeapBlocks are walked once. The header of a block and the
+    # CodeBlob following it are read with one call.
+    def code_heap_blobs(self, heap):
+        hb_layout = self.layout('HeapBlock')
+        cb_layout = self.layout('CodeBlob')
+        hb_size = hb_layout.size()
+        raw = self.read_struct(heap, 'CodeHeap')
+        low = raw.get('_memory._low')
+        log2_segment_size = raw.get('_log2_segment_size')
+        if raw.has('_next_segment'):
+            # segments beyond _next_segment have never been allocated
+            limit = raw.get('_next_segment')
+        else:
+            limit = (raw.get('_memory._high') - low) >> log2_segment_size
+        res = []
+        seg = 0
+        while seg < limit:
+            block = low + (seg << log2_segment_size)
+            try:
+                buf = memoryview(self.read(block, hb_size + cb_layout.size()))
+            except self.memory_errors:
+                # small free block at the end of the committed memory
+                buf = memoryview(self.read(block, hb_size))
+            hb = RawStruct(hb_layout, buf[:hb_size], block)
+            length = hb.get('_header._length')
+            if length == 0:
+                self.message("Error: zero length HeapBlock at 0x%x, stopped indexing CodeHeap '%s'" %
+                             (block, self.code_heap_name(heap)))
+                break
+            if hb.get('_header._used') != 0:
+                cb = RawStruct(cb_layout, buf[hb_size:], block + hb_size)
+                start = cb.address()
+                res.append((start, start + cb.get('_size'), self.c_string(cb.get('_name'))))
+            seg += length
+        return res
+
+# A contiguous part of the java heap with objects in [bottom, top)
+HeapSpace = namedtuple('HeapSpace', ['name', 'bottom', 'top'])
+
+# HeapWalker
+#
+# Iterates the objects in the spaces of the java heap of a HotSpotVM.
+# Spaces are read in chunks of chunk_size bytes and headers are decoded
+# from the chunks. Only the layout helper and the name of each Klass are
+# read once. The size of an object is computed from the layout helper like
+# oopDesc::size_given_klass does.
+#
+# Supported are G1 (regions), Parallel and Serial GC (eden, from and old
+# space). The unused parts of TLABs are skipped. If an object cannot be
+# decoded the walk of its space is stopped and recorded in failures.
+class HeapWalker(object):
+    chunk_size = 1 << 20
+    # layout helper bit of instances that need the slow path to get their size
+    _lh_instance_slow_path_bit = 0x01
+    def __init__(self, vm):
+        self.vm = vm
+        w = vm.pointer_size
+        self._word_size = w
+        self._compressed_klass, self._klass_base, self._klass_shift = vm.klass_decoding()
+        self._length_offset = w + 4 if self._compressed_klass else 2*w
+        self._align = vm.global_value('MinObjAlignmentInBytes')
+        self._class_oop_size_offset = None
+        e = vm._endian
+        self._u4 = struct.Struct(e + 'I')
+        self._i4 = struct.Struct(e + 'i')
+        self._uw = struct.Struct(e + ('Q' if w == 8 else 'I'))
+        self._klasses = {}   # Klass* -> (layout helper, name)
+        self.failures = []   # (space name, address, reason)
+    def _align_up(self, size):
+        return (size + self._align - 1) & -self._align
+    # (layout helper, name) of the Klass at the given address
+    def klass_info(self, klass):
+        res = self._klasses.get(klass)
+        if res is None:
+            raw = self.vm.read_fields(klass, 'Klass', ('_layout_helper', '_name'))
+            name = raw.get('_name')
+            res = (raw.get('_layout_helper'), None if name == 0 else self.vm.symbol_str(name))
+            self._klasses[klass] = res
+        return res
+    # the spaces of the java heap
+    def spaces(self):
+        vm = self.vm
+        if vm.global_value('UseG1GC'): return self._g1_spaces()
+        if vm.global_value('UseParallelGC'): return self._parallel_spaces()
+        if vm.global_value('UseSerialGC'): return self._serial_spaces()
+        raise vm.error("Only the heaps of G1, Parallel and Serial GC can be walked")
+    def _space(self, name, space, type_name):
+        raw = self.vm.read_fields(space, type_name, ('_bottom', '_top'))
+        return HeapSpace(name, raw.get('_bottom'), raw.get('_top'))
+    # the fields of the G1BiasedMappedArray of the HeapRegions and the
+    # HeapRegion type
+    def _g1_regions(self):
+        vm = self.vm
+        g1h = vm.global_value('G1CollectedHeap::_g1h')
+        names = ('_regions._base', '_regions._length', '_regions._bias', '_regions._shift_by')
+        if vm.layout('G1CollectedHeap').has('_hrm._regions._base'):
+            raw = vm.read_fields(g1h, 'G1CollectedHeap', ['_hrm.' + n for n in names])
+            regions = dict((n, raw.get('_hrm.' + n)) for n in names)
+        else:
+            # jdk 12 and 13 have a pointer to the HeapRegionManager
+            hrm = vm.read_fields(g1h, 'G1CollectedHeap', ('_hrm',)).get('_hrm')
+            raw = vm.read_fields(hrm, vm.first_type('HeapRegionManager', 'G1HeapRegionManager'), names)
+            regions = dict((n, raw.get(n)) for n in names)
+        return regions, vm.first_type('HeapRegion', 'G1HeapRegion')
+    def _region_fields(self, region_type):
+        has_start = self.vm.layout(region_type).has('_humongous_start_region')
+        return ('_bottom', '_top') + (('_humongous_start_region',) if has_start else ())
+    def _g1_spaces(self):
+        regions, region_type = self._g1_regions()
+        fields = self._region_fields(region_type)
+        res = []
+        for i, r in enumerate(self.vm.read_pointers(regions['_regions._base'], regions['_regions._length'])):
+            if r == 0: continue
+            raw = self.vm.read_fields(r, region_type, fields)
+            if raw.has('_humongous_start_region') and raw.get('_humongous_start_region') not in (0, r):
+                continue  # the object is walked in the starts humongous region
+            if raw.get('_top') > raw.get('_bottom'):
+                res.append(HeapSpace('region ' + str(i), raw.get('_bottom'), raw.get('_top')))
+        return res
+    # The HeapSpace of the G1 region containing addr or None if the heap is
+    # not a G1 heap or addr is not in a committed region. For a region
+    # continuing a humongous object the space starts at the bottom of the
+    # starts humongous region, so walking it yields the humongous object.
+    def g1_region_at(self, addr):
+        vm = self.vm
+        if not vm.global_value('UseG1GC'): return None
+        regions, region_type = self._g1_regions()
+        index = (addr >> regions['_regions._shift_by']) - regions['_regions._bias']
+        if index < 0 or index >= regions['_regions._length']: return None
+        r = vm.read_pointer(regions['_regions._base'] + index * self._word_size)
+        if r == 0: return None
+        raw = vm.read_fields(r, region_type, self._region_fields(region_type))
+        bottom = raw.get('_bottom')
+        if raw.has('_humongous_start_region') and raw.get('_humongous_start_region') not in (0, r):
+            bottom = vm.read_fields(raw.get('_humongous_start_region'), region_type, ('_bottom',)).get('_bottom')
+        return HeapSpace('region ' + str(index), bottom, raw.get('_top'))
+    def _parallel_spaces(self):
+        vm = self.vm
+        heap = vm.global_value('Universe::_collectedHeap')
+        if vm.layout('ParallelScavengeHeap').has('_young_gen'):
+            raw = vm.read_fields(heap, 'ParallelScavengeHeap', ('_young_gen', '_old_gen'))
+            young, old = raw.get('_young_gen'), raw.get('_old_gen')
+        else:
+            # static members in older vms
+            young, old = vm.global_value('ParallelScavengeHeap::_young_gen'), vm.global_value('ParallelScavengeHeap::_old_gen')
+        young = vm.read_fields(young, 'PSYoungGen', ('_eden_space', '_from_space'))
+        old = vm.read_fields(old, 'PSOldGen', ('_object_space',))
+        return [self._space('eden', young.get('_eden_space'), 'MutableSpace'),
+                self._space('from', young.get('_from_space'), 'MutableSpace'),
+                self._space('old', old.get('_object_space'), 'MutableSpace')]
+    def _serial_spaces(self):
+        vm = self.vm
+        heap_type = vm.first_type('SerialHeap', 'GenCollectedHeap')
+        heap = vm.global_value('Universe::_collectedHeap')
+        if vm.layout(heap_type).has('_young_gen'):
+            raw = vm.read_fields(heap, heap_type, ('_young_gen', '_old_gen'))
+            young, old = raw.get('_young_gen'), raw.get('_old_gen')
+        else:
+            raw = vm.read_fields(heap, heap_type, ('_gens[0]', '_gens[1]'))  # jdk 8
+            young, old = raw.get('_gens[0]'), raw.get('_gens[1]')
+        young = vm.read_fields(young, 'DefNewGeneration', ('_eden_space', '_from_space'))
+        old = vm.read_fields(old, 'TenuredGeneration', ('_the_space',))
+        return [self._space('eden', young.get('_eden_space'), 'ContiguousSpace'),
+                self._space('from', young.get('_from_space'), 'ContiguousSpace'),
+                self._space('old', old.get('_the_space'), 'ContiguousSpace')]
+    # The unparsable part [top, hard end) of the TLABs of all JavaThreads
+    # as dictionary top -> hard end
+    def tlab_gaps(self):
+        vm = self.vm
+        layout = vm.layout('JavaThread')
+        end_name = '_tlab._allocation_end' if layout.has('_tlab._allocation_end') else '_tlab._end'
+        prefetch = 0
+        if vm.has_global('ThreadLocalAllocBuffer::_reserve_for_allocation_prefetch'):
+            prefetch = vm.global_value('ThreadLocalAllocBuffer::_reserve_for_allocation_prefetch')
+        # see ThreadLocalAllocBuffer::alignment_reserve()
+        int_array_header = self._align_up(self._length_offset + 4) // self._word_size
+        reserve = self._align_up(max(prefetch, int_array_header) * self._word_size)
+        gaps = {}
+        for t in vm.java_thread_addresses():
+            raw = vm.read_fields(t, layout, ('_tlab._top', end_name))
+            top = raw.get('_tlab._top')
+            if top != 0:
+                gaps[top] = raw.get(end_name) + reserve
+        return gaps
+    # Yield (address, Klass*, size in bytes) for the objects in the given
+    # spaces (default: all spaces of the heap)
+    def objects(self, spaces = None):
+        if spaces is None: spaces = self.spaces()
+        gaps = self.tlab_gaps()
+        for space in spaces:
+            for obj in self._space_objects(space, gaps):
+                yield obj
+    # Map each of the given addresses to the (address, Klass*, size) of the
+    # object containing it or to None. Only those of the given spaces
+    # (default: all spaces of the heap) containing one of the addresses are
+    # walked.
+    def containing_objects(self, addrs, spaces = None):
+        if spaces is None: spaces = self.spaces()
+        addrs = sorted(set(addrs))
+        res = dict.fromkeys(addrs)
+        gaps = None
+        for space in spaces:
+            i = bisect_left(addrs, space.bottom)
+            if i == len(addrs) or addrs[i] >= space.top: continue
+            if gaps is None: gaps = self.tlab_gaps()
+            for obj in self._space_objects(space, gaps):
+                addr, klass, size = obj
+                while i < len(addrs) and addrs[i] < addr: i += 1
+                while i < len(addrs) and addrs[i] < addr + size:
+                    res[addrs[i]] = obj
+                    i += 1
+                if i == len(addrs) or addrs[i] >= space.top: break
+        return res
+    def _int_at(self, buf, off, addr, offset):
+        if off + offset + 4 <= len(buf):
+            return self._i4.unpack_from(buf, off + offset)[0]
+        return self._i4.unpack(self.vm.read(addr + offset, 4))[0]
+    def _space_objects(self, space, gaps):
+        vm = self.vm
+        w = self._word_size
+        header_size = self._length_offset + 4
+        addr = space.bottom
+        top = space.top
+        buf = b''
+        buf_start = addr
+        while addr < top:
+            gap_end = gaps.get(addr)
+            if gap_end is not None:
+                addr = gap_end
+                continue
+            off = addr - buf_start
+            if off + header_size > len(buf):
+                buf_start = addr
+                off = 0
+                try:
+                    buf = vm.read(addr, max(min(HeapWalker.chunk_size, top - addr), header_size))
+                except vm.memory_errors:
+                    self.failures.append((space.name, addr, "cannot read memory"))
+                    return
+            if self._compressed_klass:
+                nk = self._u4.unpack_from(buf, off + w)[0]
+                klass = 0 if nk == 0 else self._klass_base + (nk << self._klass_shift)
+            else:
+                klass = self._uw.unpack_from(buf, off + w)[0]
+            try:
+                lh, name = self.klass_info(klass) if klass != 0 else (0, None)
+            except vm.memory_errors:
+                lh, name = 0, None
+            if lh == 0 or name is None:
+                self.failures.append((space.name, addr, "bad klass 0x%x" % klass))
+                return
+            if lh > 0:
+                if not lh & HeapWalker._lh_instance_slow_path_bit:
+                    size = lh
+                elif name == 'java/lang/Class':
+                    if self._class_oop_size_offset is None:
+                        self._class_oop_size_offset = vm.global_value('java_lang_Class::_oop_size_offset')
+                    size = self._int_at(buf, off, addr, self._class_oop_size_offset) * w
+                elif name == 'jdk/internal/vm/StackChunk':
+                    self.failures.append((space.name, addr, "size of stack chunks is not supported"))
+                    return
+                else:
+                    size = lh & -w
+            else:
+                # array: see Klass::layout_helper_header_size and layout_helper_log2_element_size
+                length = self._int_at(buf, off, addr, self._length_offset)
+                size = self._align_up(((lh >> 16) & 0xFF) + (length << (lh & 0xFF)))
+            if size <= 0 or size % self._align != 0:
+                self.failures.append((space.name, addr, "bad size %d of %s instance" % (size, name)))
+                return
+            yield (addr, klass, size)
+            addr += size
@@ -0,0 +1,137 @@
+#############################################################################
+#
+# Triage many core files of the hotspot vm in parallel
+#
+#############################################################################
+#
+# Runs one batch gdb process per core file in a pool of workers. Each gdb
+# sources gdb_utilities_python3.py, executes a configurable list of gdb
+# commands and records their output. The results of all cores are merged
+# into one JSON report.
+#
+# Example:
+#
+#    $ python3 hs_triage_cores.py -j 16 -e /opt/jdk/bin/java -o report.json cores/core.*
+#
+#    $ python3 hs_triage_cores.py -e /opt/jdk/bin/java \
+#          -x hs-print-all-class-loader-data -x 'hs-symbolize-pcs' core.4711
+#
+# Default commands: see DEFAULT_COMMANDS below.
+#
+# This file has two roles. Run with python3 it is the driver. Sourced in
+# gdb (done by the driver) it executes the commands passed in the
+# environment and writes the result of the core as JSON.
+#
+#############################################################################
+
+import json
+import os
+import sys
+import time
+
+DEFAULT_COMMANDS = [
+    'hs-print-all-class-loader-data',
+    'python ClassLoaderDataGraph.classes_do(lambda kk: print(kk.extended_str()))',
+    'hs-symbolize-pcs',
+]
+
+# environment variables to pass the job from the driver to gdb
+ENV_COMMANDS = 'HS_TRIAGE_COMMANDS'
+ENV_RESULT   = 'HS_TRIAGE_RESULT'
+
+#############################################################################
+# Running in gdb
+#############################################################################
+
+def run_commands_in_gdb(gdb, commands, result_file):
+    results = []
+    for cmd in commands:
+        start = time.time()
+        res = {'command': cmd}
+        try:
+            res['output'] = gdb.execute(cmd, to_string = True)
+        except Exception as e:
+            res['error'] = str(e)
+        res['seconds'] = round(time.time() - start, 3)
+        results.append(res)
+    with open(result_file, 'w') as f:
+        json.dump(results, f)
+
+#############################################################################
+# Driver
+#############################################################################
+
+def triage_core(job, core, args, result_dir):
+    import subprocess
+    result_file = os.path.join(result_dir, str(job) + '.json')
+    env = dict(os.environ)
+    env[ENV_COMMANDS] = json.dumps(args.commands)
+    env[ENV_RESULT] = result_file
+    cmd = [args.gdb, '-batch', '-nx', '-q']
+    if args.executable:
+        cmd += [args.executable]
+    cmd += ['-c', core, '-ex', 'source ' + args.utilities, '-ex', 'source ' + os.path.abspath(__file__)]
+    res = {'core': core, 'executable': args.executable}
+    start = time.time()
+    try:
+        proc = subprocess.run(cmd, env = env, stdout = subprocess.PIPE, stderr = subprocess.PIPE,
+                              universal_newlines = True, timeout = args.timeout)
+        res['returncode'] = proc.returncode
+        if proc.returncode != 0 or not os.path.exists(result_file):
+            res['stderr'] = proc.stderr[-4096:]
+    except subprocess.TimeoutExpired:
+        res['error'] = 'timeout after ' + str(args.timeout) + 's'
+    res['seconds'] = round(time.time() - start, 3)
+    if os.path.exists(result_file):
+        with open(result_file) as f:
+            res['commands'] = json.load(f)
+        os.remove(result_file)
+    return res
+
+def main(argv):
+    import argparse
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    parser = argparse.ArgumentParser(description = 'Triage hotspot core files with gdb in parallel.')
+    parser.add_argument('cores', nargs = '+', help = 'core files')
+    parser.add_argument('-e', '--executable', help = 'java launcher the cores were dumped from')
+    parser.add_argument('-x', '--command', dest = 'commands', action = 'append',
+                        help = 'gdb command to execute for each core (repeatable, default: %s)' % DEFAULT_COMMANDS)
+    parser.add_argument('-j', '--jobs', type = int, default = os.cpu_count() or 1, help = 'number of parallel gdb processes')
+    parser.add_argument('-o', '--output', help = 'JSON report (default: stdout)')
+    parser.add_argument('--gdb', default = 'gdb', help = 'gdb executable')
+    parser.add_argument('--utilities', default = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gdb_utilities_python3.py'),
+                        help = 'path of gdb_utilities_python3.py')
+    parser.add_argument('--timeout', type = int, default = None, help = 'seconds after which a gdb process is killed')
+    args = parser.parse_args(argv)
+    if not args.commands:
+        args.commands = DEFAULT_COMMANDS
+
+    start = time.time()
+    with tempfile.TemporaryDirectory(prefix = 'hs_triage_') as result_dir:
+        with ThreadPoolExecutor(max_workers = args.jobs) as pool:
+            # the threads just wait for their gdb process
+            cores = list(pool.map(lambda job: triage_core(job[0], job[1], args, result_dir), enumerate(args.cores)))
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'seconds': round(time.time() - start, 3),
+        'commands': args.commands,
+        'cores': cores,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent = 1)
+    else:
+        json.dump(report, sys.stdout, indent = 1)
+    return 0 if all(c.get('returncode') == 0 and 'commands' in c for c in cores) else 1
+
+try:
+    import gdb
+except ImportError:
+    gdb = None
+
+if gdb is not None and ENV_RESULT in os.environ:
+    run_commands_in_gdb(gdb, json.loads(os.environ[ENV_COMMANDS]), os.environ[ENV_RESULT])
+elif __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
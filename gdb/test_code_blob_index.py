@@ -0,0 +1,42 @@
+# Lookups of pcs in the index of the CodeBlobs of a CodeHeap (CodeBlobIndex)
+
+from array import array
+
+# blobs [0x1000, 0x1100), [0x1100, 0x1180) and, after a gap, [0x2000, 0x2400)
+ENTRIES = [(0x2000, 0x2400, 'nmethod'), (0x1000, 0x1100, 'BufferBlob'), (0x1100, 0x1180, 'nmethod')]
+
+def test_entries_are_sorted(u):
+    index = u.CodeBlobIndex(list(ENTRIES))
+    assert index.length() == 3
+    assert list(index.entries()) == sorted(ENTRIES)
+    assert index.entry(2) == (0x2000, 0x2400, 'nmethod')
+
+def test_find(u):
+    index = u.CodeBlobIndex(list(ENTRIES))
+    assert [index.find(pc) for pc in (0x1000, 0x10ff, 0x1100, 0x117f, 0x2000, 0x23ff)] == [0, 0, 1, 1, 2, 2]
+
+def test_find_outside_of_blobs(u):
+    index = u.CodeBlobIndex(list(ENTRIES))
+    # before the first blob, in the gap and at the end of the last blob
+    assert [index.find(pc) for pc in (0, 0xfff, 0x1180, 0x1fff, 0x2400, 1 << 48)] == [-1] * 6
+
+def test_find_blob(u):
+    index = u.CodeBlobIndex(list(ENTRIES))
+    assert index.find_blob(0x1150) == 0x1100
+    assert index.find_blob(0x1500) is None
+
+def test_empty(u):
+    index = u.CodeBlobIndex([])
+    assert index.find(0x1000) == -1
+    assert index.find_blob(0x1000) is None
+    assert index.nmethods() == []
+
+def test_nmethods(u):
+    assert u.CodeBlobIndex(list(ENTRIES)).nmethods() == [0x1100, 0x2000]
+
+def test_from_columns(u):
+    # the columns of a snapshot are memoryviews of arrays
+    starts, ends, kinds = zip(*sorted(ENTRIES))
+    index = u.CodeBlobIndex.from_columns(memoryview(array('Q', starts)), memoryview(array('Q', ends)), list(kinds))
+    assert [index.find(pc) for pc in (0xfff, 0x1000, 0x1150, 0x1180, 0x2100)] == [-1, 0, 1, -1, 2]
+    assert index.find_blob(0x2100) == 0x2000
@@ -0,0 +1,73 @@
+# Decoding of compressed streams from bytes buffers (CompressedReadStream,
+# CompressedLineNumberReadStream).
+
+import pytest
+
+# UNSIGNED5 encoding of CompressedWriteStream::write_int
+def encode_int(value):
+    L, lg_H = 192, 6
+    value &= 0xFFFFFFFF
+    res = bytearray()
+    for i in range(4):
+        if value < L: break
+        value -= L
+        res.append(L + (value & ((1 << lg_H) - 1)))
+        value >>= lg_H
+    res.append(value)
+    return bytes(res)
+
+# CompressedWriteStream::write_signed_int
+def encode_signed_int(value):
+    return encode_int((value << 1) ^ (value >> 31))
+
+# CompressedLineNumberWriteStream::write_pair_inline (0xFF is the escape)
+def encode_pair(bci_delta, line_delta):
+    if 0 <= bci_delta < 32 and 0 <= line_delta < 8 and (bci_delta, line_delta) != (31, 7):
+        return bytes([(bci_delta << 3) | line_delta])
+    return b'\xff' + encode_signed_int(bci_delta) + encode_signed_int(line_delta)
+
+INTS = [0, 1, 191, 192, 193, 255, 256, 4095, 12345, 1 << 20, (1 << 31) - 1]
+
+@pytest.mark.parametrize('value', INTS)
+def test_read_int(u, value):
+    buf = encode_int(value)
+    stream = u.CompressedReadStream(buf)
+    assert stream.is_bytes()
+    assert stream.read_int() == value
+    assert stream.position() == len(buf)
+
+def test_read_int_lengths(u):
+    assert [len(encode_int(v)) for v in (191, 192, 12479, 12480, (1 << 31) - 1)] == [1, 2, 2, 3, 5]
+
+def test_read_int_is_a_jint(u):
+    assert u.CompressedReadStream(encode_int(0xFFFFFFFF)).read_int() == -1
+    assert u.CompressedReadStream(encode_int(1 << 31)).read_int() == -(1 << 31)
+
+@pytest.mark.parametrize('value', [0, 1, -1, 95, -96, 1000, -1000, (1 << 31) - 1, -(1 << 31)])
+def test_read_signed_int(u, value):
+    assert u.CompressedReadStream(encode_signed_int(value)).read_signed_int() == value
+
+def test_read_sequence_from_position(u):
+    values = [5, 300, -7, 70000, 191]
+    buf = b'\x00\x00\x00' + b''.join(encode_signed_int(v) for v in values)
+    stream = u.CompressedReadStream(memoryview(buf), 3)
+    assert [stream.read_signed_int() for v in values] == values
+    assert stream.position() == len(buf)
+
+def test_read_byte(u):
+    stream = u.CompressedReadStream(b'\x7f\x80\xff')
+    assert [stream.read_byte() for i in range(3)] == [127, -128, -1]
+
+def test_line_number_pairs(u):
+    deltas = [(0, 10), (3, 1), (31, 6), (31, 7), (32, 0), (4, 8), (-2, -5), (1000, 300)]
+    stream = u.CompressedLineNumberReadStream(b''.join(encode_pair(*d) for d in deltas) + b'\x00')
+    pairs = []
+    while stream.read_pair():
+        pairs.append((stream.bci(), stream.line()))
+    bci = line = 0
+    expected = []
+    for bci_delta, line_delta in deltas:
+        bci += bci_delta
+        line += line_delta
+        expected.append((bci, line))
+    assert pairs == expected
@@ -0,0 +1,115 @@
+# Reading the memory of ELF core files (hotspot_core.ElfCore)
+
+import struct
+
+import pytest
+
+from hotspot_core import CoreMemoryError, ElfCore, FileMapping
+
+PAGE = 0x1000
+
+def pattern(n, seed):
+    return bytes((i * 7 + seed) & 0xFF for i in range(n))
+
+# A little endian ELF core file with the given PT_LOAD segments (vaddr,
+# data) and NT_FILE mappings (start, end, offset, path) and e_type
+def write_core(path, segments, mappings, e_type = ElfCore.ET_CORE):
+    desc = struct.pack('<QQ', len(mappings), PAGE)
+    desc += b''.join(struct.pack('<QQQ', start, end, offset // PAGE) for start, end, offset, name in mappings)
+    desc += b''.join(name.encode() + b'\0' for start, end, offset, name in mappings)
+    desc += b'\0' * (-len(desc) % 4)
+    note = struct.pack('<III', 5, len(desc), ElfCore.NT_FILE) + b'CORE\0\0\0\0' + desc
+    phnum = 1 + len(segments)
+    offset = 64 + phnum * 56
+    phdrs = struct.pack('<IIQQQQQQ', ElfCore.PT_NOTE, 0, offset, 0, 0, len(note), 0, 0)
+    offset += len(note)
+    for vaddr, data in segments:
+        phdrs += struct.pack('<IIQQQQQQ', ElfCore.PT_LOAD, 5, offset, vaddr, 0, len(data), max(len(data), PAGE), PAGE)
+        offset += len(data)
+    ident = b'\x7fELF' + bytes([2, 1, 1]) + b'\0' * 9
+    header = ident + struct.pack('<HHIQQQIHHHHHH', e_type, 62, 1, 0, 64, 0, 0, 64, 56, phnum, 64, 0, 0)
+    with open(path, 'wb') as f:
+        f.write(header + phdrs + note + b''.join(data for vaddr, data in segments))
+
+# Segments A and B are adjacent. libfoo.so is mapped from file offset
+# PAGE to [0x20000, 0x23000), but the file ends 0x1800 bytes into the
+# mapping. Segment C has a page of the mapping written by the process.
+# Segment D (filesz 0) is not dumped. libjvm.so is mapped from offset 0.
+A = (0x10000, pattern(0x100, 1))
+B = (0x10100, pattern(0x100, 2))
+C = (0x21000, pattern(0x100, 3))
+D = (0x22000, b'')
+LIBFOO = pattern(0x2800, 4)
+
+@pytest.fixture
+def core(tmp_path):
+    (tmp_path / 'lib').mkdir()
+    (tmp_path / 'lib' / 'libfoo.so').write_bytes(LIBFOO)
+    (tmp_path / 'lib' / 'libjvm.so').write_bytes(pattern(PAGE, 5))
+    write_core(str(tmp_path / 'core'), [B, A, C, D],
+               [(0x20000, 0x23000, PAGE, '/lib/libfoo.so'), (0x30000, 0x31000, 0, '/lib/libjvm.so')])
+    return ElfCore(str(tmp_path / 'core'), str(tmp_path))
+
+def test_header(core):
+    assert core.byteorder == 'little'
+    assert core.machine == 62
+    assert core.mappings == [FileMapping(0x20000, 0x23000, PAGE, '/lib/libfoo.so'),
+                             FileMapping(0x30000, 0x31000, 0, '/lib/libjvm.so')]
+
+def test_base_of(core):
+    assert core.base_of('libjvm.so') == 0x30000
+    assert core.base_of('libfoo.so') is None  # not mapped from offset 0
+    assert core.base_of('libc.so.6') is None
+
+def test_read_in_segment(core):
+    res = core.read(0x10010, 0x20)
+    assert isinstance(res, memoryview)
+    assert bytes(res) == A[1][0x10:0x30]
+
+def test_read_across_segments(core):
+    assert bytes(core.read(0x100f0, 0x20)) == A[1][0xf0:] + B[1][:0x10]
+    assert bytes(core.read(0x10000, 0x200)) == A[1] + B[1]
+
+def test_read_prefix_ends_with_the_segment(core):
+    assert bytes(core.read_prefix(0x100f0, 0x20)) == A[1][0xf0:]
+    assert bytes(core.read_prefix(0x10100, 0x1000)) == B[1]
+
+def test_read_beyond_segments(core):
+    with pytest.raises(CoreMemoryError):
+        core.read(0x101f0, 0x20)
+    with pytest.raises(CoreMemoryError):
+        core.read(0xfff0, 0x20)
+    with pytest.raises(CoreMemoryError):
+        core.read_prefix(0x40000, 8)
+
+def test_read_mapped_file(core):
+    # memory of libfoo.so that is not in the core
+    assert bytes(core.read(0x20010, 0x20)) == LIBFOO[PAGE + 0x10:PAGE + 0x30]
+
+def test_read_segment_over_mapped_file(core):
+    # the page written by the process is read from the core
+    assert bytes(core.read_prefix(0x20ff0, 0x20)) == LIBFOO[PAGE + 0xff0:2 * PAGE]
+    assert bytes(core.read(0x20ff0, 0x20)) == LIBFOO[PAGE + 0xff0:2 * PAGE] + C[1][:0x10]
+    assert bytes(core.read(0x21100, 0x10)) == LIBFOO[2 * PAGE + 0x100:2 * PAGE + 0x110]
+
+def test_read_beyond_end_of_mapped_file(core):
+    assert bytes(core.read_prefix(0x217f0, 0x20)) == LIBFOO[-0x10:]
+    with pytest.raises(CoreMemoryError):
+        core.read(0x217f0, 0x20)
+
+def test_missing_mapped_file(tmp_path):
+    write_core(str(tmp_path / 'core'), [A], [(0x20000, 0x23000, PAGE, '/lib/libfoo.so')])
+    core = ElfCore(str(tmp_path / 'core'), str(tmp_path / 'nowhere'))
+    assert bytes(core.read(0x10000, 0x10)) == A[1][:0x10]
+    with pytest.raises(CoreMemoryError):
+        core.read(0x20000, 0x10)
+
+def test_not_a_core(tmp_path):
+    path = str(tmp_path / 'exe')
+    write_core(path, [A], [], e_type = 2)
+    with pytest.raises(ValueError):
+        ElfCore(path)
+    with open(path, 'wb') as f:
+        f.write(b'#!/bin/sh\n' + b'\0' * 64)
+    with pytest.raises(ValueError):
+        ElfCore(path)
@@ -0,0 +1,152 @@
+# The walkers of hotspot_vm.HotSpotVM and HeapWalker on a vm in a
+# bytearray
+
+import struct
+
+import pytest
+
+from hotspot_vm import HeapSpace, HeapWalker, HotSpotVM
+
+BASE = 0x10000
+
+class FakeMemoryError(Exception):
+    pass
+
+# fields are name -> (offset, struct format or None, size)
+class Layout(object):
+    def __init__(self, size, fields):
+        self._size = size
+        self._fields = fields
+    def size(self): return self._size
+    def has(self, name): return name in self._fields
+    def offset(self, name): return self._fields[name][0]
+    def format(self, name): return self._fields[name][1]
+    def field_size(self, name): return self._fields[name][2]
+
+class FakeVM(HotSpotVM):
+    memory_errors = (FakeMemoryError,)
+    def __init__(self):
+        super(FakeVM, self).__init__('little', 8)
+        self.mem = bytearray(0x10000)
+        self.layouts = {}
+        self.globals = {}
+    def read(self, addr, length):
+        if addr < BASE or addr + length > BASE + len(self.mem):
+            raise FakeMemoryError("Cannot access memory at address 0x%x" % addr)
+        return bytes(self.mem[addr - BASE:addr - BASE + length])
+    def layout(self, type_name):
+        return self.layouts[type_name]
+    def has_global(self, name):
+        return name in self.globals
+    def global_value(self, name):
+        return self.globals[name]
+    # write the value with the struct format fmt at addr
+    def put(self, addr, fmt, value):
+        if isinstance(value, bytes): self.mem[addr - BASE:addr - BASE + len(value)] = value
+        else: struct.pack_into('<' + fmt, self.mem, addr - BASE, value)
+    def add_type(self, name, size, fields):
+        self.layouts[name] = Layout(size, dict(
+            (f, (offset, '<' + fmt if fmt else None, struct.calcsize(fmt) if fmt else 8)) for f, (offset, fmt) in fields.items()))
+
+STRING, LOADER = 0x12000, 0x12100  # Klass*
+LOADER_OOP = 0x14000
+BOOT_CLD, APP_CLD = 0x13000, 0x13100
+
+@pytest.fixture
+def vm():
+    vm = FakeVM()
+    vm.add_type('Symbol', 8, {'_length': (0, 'H'), '_body': (6, None)})
+    vm.add_type('Klass', 64, {'_name': (8, 'Q'), '_next_link': (16, 'Q'), '_layout_helper': (24, 'i')})
+    vm.add_type('ClassLoaderData', 32, {'_class_loader': (0, 'Q'), '_next': (8, 'Q'), '_klasses': (16, 'Q'),
+                                        '_has_class_mirror_holder': (24, 'B')})
+    vm.add_type('oopDesc', 16, {'_metadata._klass': (8, 'Q')})
+    vm.globals.update({'UseCompressedClassPointers': 0, 'MinObjAlignmentInBytes': 8,
+                       'ClassLoaderDataGraph::_head': BOOT_CLD})
+    for addr, name in ((0x11000, b'java/lang/String'), (0x11100, b'MyLoader')):
+        vm.put(addr, 'H', len(name))
+        vm.put(addr + 6, '', name)
+    # instances of java/lang/String have 24 bytes, of MyLoader 16 bytes
+    for klass, name, size in ((STRING, 0x11000, 24), (LOADER, 0x11100, 16)):
+        vm.put(klass + 8, 'Q', name)
+        vm.put(klass + 24, 'i', size)
+    vm.put(LOADER_OOP + 8, 'Q', LOADER)
+    vm.put(BOOT_CLD + 8, 'Q', APP_CLD)
+    vm.put(BOOT_CLD + 16, 'Q', STRING)
+    vm.put(APP_CLD, 'Q', LOADER_OOP)
+    vm.put(APP_CLD + 24, 'B', 1)
+    return vm
+
+def test_symbol_str(vm):
+    assert vm.symbol_str(0x11000) == 'java/lang/String'
+    assert vm.klass_name(LOADER) == 'MyLoader'
+
+def test_symbol_at_end_of_memory(vm):
+    # the prefetch of the body crosses into unreadable memory
+    addr = BASE + len(vm.mem) - 10
+    vm.put(addr, 'H', 3)
+    vm.put(addr + 6, '', b'abc')
+    assert vm.symbol_str(addr) == 'abc'
+
+def test_symbol_length_and_refcount(vm):
+    # older vms keep the length in the upper half of _length_and_refcount
+    vm.add_type('Symbol', 8, {'_length_and_refcount': (0, 'I'), '_body': (6, None)})
+    vm.put(0x11200, 'I', (4 << 16) | 1)
+    vm.put(0x11206, '', b'Main')
+    assert vm.symbol_str(0x11200) == 'Main'
+
+def test_iter_clds(vm):
+    clds = list(vm.iter_clds())
+    assert [(c.cld, c.loader, c.loader_name, c.is_anonymous) for c in clds] == [
+        (BOOT_CLD, 0, '<bootstrap>', False), (APP_CLD, LOADER_OOP, 'MyLoader', True)]
+    assert [c.cld for c in vm.iter_clds(loader_name = 'MyLoader')] == [APP_CLD]
+    assert list(vm.iter_unloading_clds()) == []
+
+def test_iter_klasses(vm):
+    assert [(k.klass, k.name, k.cld.cld) for k in vm.iter_klasses()] == [(STRING, 'java/lang/String', BOOT_CLD)]
+    assert list(vm.iter_klasses(name_prefix = 'java/util/')) == []
+    assert vm.klass_count(STRING) == 1
+
+def test_klass_at(vm):
+    assert vm.klass_at(LOADER_OOP) == LOADER
+
+# a Serial GC heap with a String and a MyLoader instance in eden
+def serial_heap(vm):
+    vm.add_type('GenCollectedHeap', 16, {'_young_gen': (0, 'Q'), '_old_gen': (8, 'Q')})
+    vm.add_type('DefNewGeneration', 16, {'_eden_space': (0, 'Q'), '_from_space': (8, 'Q')})
+    vm.add_type('TenuredGeneration', 8, {'_the_space': (0, 'Q')})
+    vm.add_type('ContiguousSpace', 16, {'_bottom': (0, 'Q'), '_top': (8, 'Q')})
+    vm.add_type('JavaThread', 24, {'_tlab._top': (0, 'Q'), '_tlab._end': (8, 'Q'), '_next': (16, 'Q')})
+    vm.globals.update({'UseG1GC': 0, 'UseParallelGC': 0, 'UseSerialGC': 1, 'Universe::_collectedHeap': 0x15000,
+                       'Threads::_thread_list': 0})
+    vm.put(0x15000, 'Q', 0x15100)
+    vm.put(0x15008, 'Q', 0x15200)
+    vm.put(0x15100, 'Q', 0x15300)
+    vm.put(0x15108, 'Q', 0x15320)
+    vm.put(0x15200, 'Q', 0x15340)
+    for space, bottom, top in ((0x15300, 0x16000, 0x16000 + 40), (0x15320, 0x17000, 0x17000), (0x15340, 0x18000, 0x18000)):
+        vm.put(space, 'Q', bottom)
+        vm.put(space + 8, 'Q', top)
+    vm.put(0x16000 + 8, 'Q', STRING)
+    vm.put(0x16000 + 24 + 8, 'Q', LOADER)
+
+def test_heap_objects(vm):
+    serial_heap(vm)
+    walker = HeapWalker(vm)
+    assert walker.spaces() == [HeapSpace('eden', 0x16000, 0x16028), HeapSpace('from', 0x17000, 0x17000),
+                               HeapSpace('old', 0x18000, 0x18000)]
+    assert list(walker.objects()) == [(0x16000, STRING, 24), (0x16018, LOADER, 16)]
+    assert walker.failures == []
+    assert walker.containing_objects([0x16004, 0x16020, 0x20000]) == {
+        0x16004: (0x16000, STRING, 24), 0x16020: (0x16018, LOADER, 16), 0x20000: None}
+
+def test_heap_walk_stops_at_bad_klass(vm):
+    serial_heap(vm)
+    vm.put(0x16000 + 24 + 8, 'Q', 0)
+    walker = HeapWalker(vm)
+    assert list(walker.objects()) == [(0x16000, STRING, 24)]
+    assert walker.failures == [('eden', 0x16018, 'bad klass 0x0')]
+
+def test_unsupported_gc(vm):
+    vm.globals.update({'UseG1GC': 0, 'UseParallelGC': 0, 'UseSerialGC': 0})
+    with pytest.raises(ValueError):
+        HeapWalker(vm).spaces()
@@ -0,0 +1,79 @@
+# Lookups in decoded line number tables (LineNumberTable)
+
+import random
+
+from test_compressed_stream import encode_pair
+
+class FakeConstMethod(object):
+    def __init__(self, table):
+        self._table = table
+    def compressed_linenumber_table_bytes(self):
+        return self._table
+
+# The Method interface used by LineNumberTable with the table of the given
+# (bci, line) pairs
+class FakeMethod(object):
+    def __init__(self, pairs, address = 0x1000):
+        self._address = address
+        self._has_table = pairs is not None
+        table = bytearray()
+        bci = line = 0
+        for b, l in pairs or ():
+            table += encode_pair(b - bci, l - line)
+            bci, line = b, l
+        self._const_method = FakeConstMethod(bytes(table + b'\x00'))
+    def obj_address(self): return self._address
+    def has_linenumber_table(self): return self._has_table
+    def constMethod(self): return self._const_method
+
+# the linear search of Method::line_number_from_bci
+def line_number_from_bci(pairs, bci):
+    best_bci, best_line = 0, -1
+    for b, l in pairs:
+        if b == bci: return l
+        if b < bci and b >= best_bci:
+            best_bci, best_line = b, l
+    return best_line
+
+def test_exact_and_between(u):
+    table = u.LineNumberTable(FakeMethod([(0, 10), (4, 11), (9, 13)]))
+    assert [table.line_number_from_bci(bci) for bci in range(12)] == [10, 10, 10, 10, 11, 11, 11, 11, 11, 13, 13, 13]
+
+def test_duplicate_bcis(u):
+    # exact matches get the first pair, bcis above get the last one
+    table = u.LineNumberTable(FakeMethod([(0, 1), (5, 20), (5, 21), (5, 22)]))
+    assert table.line_number_from_bci(5) == 20
+    assert table.line_number_from_bci(6) == 22
+
+def test_unsorted(u):
+    pairs = [(10, 5), (0, 2), (20, 9), (5, 3)]
+    table = u.LineNumberTable(FakeMethod(pairs))
+    assert [table.line_number_from_bci(bci) for bci in range(25)] == [line_number_from_bci(pairs, bci) for bci in range(25)]
+
+def test_below_first_bci(u):
+    table = u.LineNumberTable(FakeMethod([(3, 7), (8, 9)]))
+    assert table.line_number_from_bci(0) == -1
+    assert table.line_number_from_bci(2) == -1
+    assert table.line_number_from_bci(3) == 7
+
+def test_no_table(u):
+    assert u.LineNumberTable(FakeMethod(None)).line_number_from_bci(0) == -1
+    assert u.LineNumberTable(FakeMethod([])).line_number_from_bci(0) == -1
+
+def test_same_as_linear_search(u):
+    rnd = random.Random(4711)
+    for n in range(50):
+        pairs = [(rnd.randrange(200), rnd.randrange(1, 1000)) for i in range(rnd.randrange(1, 30))]
+        # (0, 0) deltas are never written (they would be the terminator)
+        pairs = [p for i, p in enumerate(pairs) if i == 0 or p != pairs[i-1]]
+        table = u.LineNumberTable(FakeMethod(pairs))
+        for bci in range(210):
+            assert table.line_number_from_bci(bci) == line_number_from_bci(pairs, bci), (pairs, bci)
+
+def test_cached_by_method(u):
+    u.clear_caches()
+    table = u.LineNumberTable.of(FakeMethod([(0, 1)], 0x2000))
+    assert u.LineNumberTable.of(FakeMethod([(0, 2)], 0x2000)) is table
+    assert u.LineNumberTable.of(FakeMethod([(0, 2)], 0x3000)).line_number_from_bci(0) == 2
+    u.clear_caches()
+    assert u.LineNumberTable.of(FakeMethod([(0, 2)], 0x2000)).line_number_from_bci(0) == 2
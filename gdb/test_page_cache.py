@@ -0,0 +1,103 @@
+# Reads of the inferior through the PageCache
+
+import gdb
+import pytest
+
+PAGE = 16
+
+def memory(n):
+    return bytes(i & 0xFF for i in range(n))
+
+# reader of the memory [0, size) without the unreadable pages
+def reader(size, unreadable = ()):
+    mem = memory(size)
+    def read(addr, length):
+        pages = range(addr // PAGE, (addr + length - 1) // PAGE + 1)
+        if addr < 0 or addr + length > size or any(p in unreadable for p in pages):
+            raise gdb.MemoryError("Cannot access memory at address 0x%x" % addr)
+        return mem[addr:addr + length]
+    return read
+
+@pytest.fixture
+def cache(u, monkeypatch):
+    monkeypatch.setattr(u.PageCache, 'page_size', PAGE)
+    monkeypatch.setattr(u.PageCache, 'max_pages', 8)
+    monkeypatch.setattr(u.PageCache, 'bypass_size', 16 * PAGE)
+    return u.PageCache()
+
+def test_adjacent_pages_are_read_with_one_call(cache, inferior):
+    inf = inferior(reader(16 * PAGE))
+    assert cache.read(5, 40) == memory(45)[5:]
+    assert inf.reads == [(0, 3 * PAGE)]
+    assert cache.misses == 3
+
+def test_cached_pages_are_not_read_again(cache, inferior):
+    inf = inferior(reader(16 * PAGE))
+    cache.read(0, PAGE)
+    cache.read(3 * PAGE, PAGE)
+    inf.reads = []
+    # pages 0 and 3 are cached, 1 and 2 are read with one call, 4 with another
+    assert cache.read(0, 5 * PAGE - 1) == memory(5 * PAGE - 1)
+    assert inf.reads == [(PAGE, 2 * PAGE), (4 * PAGE, PAGE)]
+    assert cache.hits == 2
+    inf.reads = []
+    assert cache.read(PAGE + 3, 2 * PAGE) == memory(3 * PAGE + 3)[PAGE + 3:]
+    assert inf.reads == []
+
+def test_unreadable_page_is_found_by_bisection(cache, inferior):
+    inf = inferior(reader(16 * PAGE, unreadable = (5,)))
+    with pytest.raises(gdb.MemoryError):
+        cache.read(0, 8 * PAGE - 1)
+    # the run of pages 0-7, then the halves down to page 5, then the
+    # direct read of the requested bytes
+    assert inf.reads == [(0, 8 * PAGE), (0, 4 * PAGE), (4 * PAGE, 4 * PAGE), (4 * PAGE, 2 * PAGE),
+                         (4 * PAGE, PAGE), (5 * PAGE, PAGE), (6 * PAGE, 2 * PAGE), (0, 8 * PAGE - 1)]
+    inf.reads = []
+    # the readable pages are cached
+    assert cache.read(0, 5 * PAGE) == memory(5 * PAGE)
+    assert cache.read(6 * PAGE, 2 * PAGE) == memory(8 * PAGE)[6 * PAGE:]
+    assert inf.reads == []
+    # reads touching the unreadable page go directly to the inferior
+    with pytest.raises(gdb.MemoryError):
+        cache.read(5 * PAGE - 2, 4)
+    assert inf.reads == [(5 * PAGE - 2, 4)]
+
+def test_partially_readable_page(cache, inferior):
+    # the readable memory ends in the middle of page 2
+    inf = inferior(reader(2 * PAGE + 8))
+    assert cache.read(2 * PAGE, 8) == memory(2 * PAGE + 8)[2 * PAGE:]
+    assert inf.reads == [(2 * PAGE, PAGE), (2 * PAGE, 8)]
+    inf.reads = []
+    assert cache.read(2 * PAGE + 2, 4) == memory(2 * PAGE + 6)[2 * PAGE + 2:]
+    assert inf.reads == [(2 * PAGE + 2, 4)]
+
+def test_big_reads_bypass_the_cache(cache, inferior):
+    inf = inferior(reader(32 * PAGE))
+    assert cache.read(3, 16 * PAGE) == memory(16 * PAGE + 3)[3:]
+    assert inf.reads == [(3, 16 * PAGE)]
+    assert cache.size() == 0
+
+def test_least_recently_used_pages_are_evicted(cache, inferior):
+    inf = inferior(reader(16 * PAGE))
+    for p in range(8):
+        cache.read(p * PAGE, 1)
+    cache.read(0, 1)  # page 0 is used again
+    cache.read(8 * PAGE, 1)
+    assert cache.size() == 8 * PAGE
+    inf.reads = []
+    cache.read(0, 1)
+    assert inf.reads == []
+    cache.read(PAGE, 1)
+    assert inf.reads == [(PAGE, PAGE)]
+
+def test_clear(cache, inferior):
+    inf = inferior(reader(16 * PAGE, unreadable = (1,)))
+    cache.read(0, 1)
+    with pytest.raises(gdb.MemoryError):
+        cache.read(PAGE, 1)
+    cache.clear()
+    assert cache.size() == 0
+    inf.reader = reader(16 * PAGE)
+    inf.reads = []
+    assert cache.read(0, 2 * PAGE) == memory(2 * PAGE)
+    assert inf.reads == [(0, 2 * PAGE)]
@@ -0,0 +1,90 @@
+# Exact and approximate lookups in the PcDescs of an nmethod (PcDescTable)
+
+import random
+import struct
+
+import gdb
+import pytest
+
+# PcDesc of newer vms and of older ones with the union PcDescFlags
+def pc_desc_type(union_flags):
+    int_t = gdb.lookup_type('int')
+    flags_t = int_t
+    if union_flags:
+        flags_t = gdb.struct_type('PcDesc::PcDescFlags', 4, [('word', int_t, 0)], gdb.TYPE_CODE_UNION)
+    return gdb.struct_type('PcDesc', 16, [('_pc_offset', int_t, 0), ('_scope_decode_offset', int_t, 4),
+                                          ('_obj_decode_offset', int_t, 8), ('_flags', flags_t, 12)])
+
+@pytest.fixture(params = [False, True], ids = ['int flags', 'union flags'])
+def pc_desc(request, u):
+    u.clear_caches()
+    gdb.types['PcDesc'] = pc_desc_type(request.param)
+    yield
+    del gdb.types['PcDesc']
+    u.clear_caches()
+
+class FakeNMethod(object):
+    def __init__(self, begin, n):
+        self._scopes_pcs_begin = begin
+        self._scopes_pcs_end = begin + n * 16
+
+BEGIN = 0x7f0000001000
+
+# table of PcDescs with the given pc offsets after the sentinel
+def table(u, pc_offsets):
+    rows = [(-1, 0, 0, 0)] + [(pc, 100 + i, 200 + i, i) for i, pc in enumerate(pc_offsets)]
+    buf = b''.join(struct.pack('<iiii', *row) for row in rows)
+    return u.PcDescTable(FakeNMethod(BEGIN, len(rows)), buf)
+
+# nmethod::find_pc_desc_internal without the caches: the first PcDesc
+# after the sentinel that matches
+def find_linear(pc_offsets, pc_offset, approximate):
+    offsets = [-1] + pc_offsets
+    for i in range(1, len(offsets)):
+        if offsets[i] == pc_offset or (approximate and offsets[i-1] < pc_offset <= offsets[i]):
+            return i
+    return -1
+
+def test_columns(u, pc_desc):
+    t = table(u, [0x10, 0x20])
+    assert t.length() == 3
+    assert [t.pc_offset(i) for i in range(3)] == [-1, 0x10, 0x20]
+    assert [t.scope_decode_offset(i) for i in range(3)] == [0, 100, 101]
+    assert [t.obj_decode_offset(i) for i in range(3)] == [0, 200, 201]
+    assert [t.flags(i) for i in range(3)] == [0, 0, 1]
+
+def test_find_exact(u, pc_desc):
+    t = table(u, [0x10, 0x20, 0x30, 0x48])
+    assert [t.find(pc, False) for pc in (0x10, 0x20, 0x30, 0x48)] == [1, 2, 3, 4]
+    assert [t.find(pc, False) for pc in (0, 0x11, 0x2f, 0x49)] == [-1, -1, -1, -1]
+
+def test_find_approximate(u, pc_desc):
+    t = table(u, [0x10, 0x20, 0x30, 0x48])
+    assert [t.find(pc, True) for pc in (0, 0x10, 0x11, 0x20, 0x21, 0x47, 0x48)] == [1, 1, 2, 2, 3, 4, 4]
+    assert t.find(0x49, True) == -1
+
+def test_sentinel_is_never_found(u, pc_desc):
+    t = table(u, [0x10, 0x20])
+    assert t.find(-1, False) == -1
+    assert t.find(-1, True) == -1
+
+def test_no_pc_descs(u, pc_desc):
+    assert u.PcDescTable(FakeNMethod(BEGIN, 0), b'').find(0, True) == -1
+    assert table(u, []).find(0, True) == -1
+
+def test_same_as_linear_search(u, pc_desc):
+    rnd = random.Random(4711)
+    for n in range(30):
+        pc_offsets = sorted(rnd.sample(range(0, 2000, 4), rnd.randrange(1, 40)))
+        t = table(u, pc_offsets)
+        for pc in range(-2, 2010):
+            for approximate in (False, True):
+                assert t.find(pc, approximate) == find_linear(pc_offsets, pc, approximate)
+
+def test_pc_desc(u, pc_desc):
+    t = table(u, [0x10, 0x20])
+    desc = t.find_pc_desc(0x18, True)
+    assert desc.obj_address() == BEGIN + 2 * 16
+    assert desc.pc_offset() == 0x20
+    assert desc.scope_decode_offset() == 101
+    assert t.find_pc_desc(0x18, False) == u.NULL